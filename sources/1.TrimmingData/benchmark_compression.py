@@ -0,0 +1,154 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+# Usage
+#     (pyroot) $ python benchmark_compression.py 'xtal' 'run' 'subruns' [options]
+#             xtal: 2, 3, 4, 6 or 7
+#             run: every available runs
+#             subruns: comma separated list of subruns (e.g. 0,1,2)
+#             --settings: comma separated list of compression settings to
+#                         compare, 'default' for the ROOT default compression
+#                         (default: 'default,zlib:1,lz4:4,zstd:5,lzma:1')
+#             --work-dir: directory of the trimmed files of the benchmark.
+#                         Put it on the file system to be benchmarked, e.g.
+#                         the Lustre mount. (default: ./benchmark/)
+#             other options: same as perform_trim.py (--engine, --slim, ...)
+# Example
+#     (pyroot) $ python benchmark_compression.py 2 1544 0,1,2,3 --slim
+#             will trim crystal 2 of run 1544, subrun 0 ~ 3 with every
+#             compression setting, and print the result of each setting.
+#
+#  This script compares the compression settings of the trimmed files.
+# For each setting, the subruns are trimmed into the work directory, and the
+# trimmed files are read back twice: once like the later stages do (drawing
+# crystal{xtal}.energy in 1~6 keV), and once reading every branch of every
+# event. The result is printed in csv format,
+#     setting,files,size_MB,trim_s,draw_s,read_s,read_MBps
+# where trim_s includes reading the MRGD files.
+#  The MRGD files are read once before the benchmark, so that every setting
+# sees the same page cache state. The trimmed files are read just after they
+# are written, so the read times are those of a warm cache; drop the caches
+# or use a work directory on another node for cold cache numbers.
+###############################################################################
+
+# 0. Prepare
+# Import packages
+import os
+import sys
+import time
+import shutil
+import argparse
+import contextlib
+import perform_trim
+
+
+# Read a file once, so that it is in the page cache
+def warm_up(path):
+  with open(path, 'rb') as infile:
+    while infile.read(1 << 24):
+      pass
+
+
+# Trim the subruns with the options, and return the time taken
+def time_trim(xtal, run, subruns, multiplicity, options):
+  start = time.perf_counter()
+  for subrun in subruns:
+    # The result lines of perform_trim go to stderr, not to the benchmark result.
+    with contextlib.redirect_stdout(sys.stderr):
+      perform_trim.trim_subrun([xtal], run, subrun, multiplicity, options)
+  return time.perf_counter() - start
+
+
+# Read the trimmed files, and return (time of drawing, time of reading
+# every branch)
+def time_read(ROOT, xtal, data_files):
+  draw_time = 0
+  read_time = 0
+  for data_file in data_files:
+    start = time.perf_counter()
+    infile = ROOT.TFile(data_file)
+    tree = infile.Get('ntp')
+    tree.Draw('crystal{0}.energy'.format(xtal), 'crystal{0}.energy >= 1 && crystal{0}.energy <= 6'.format(xtal), 'goff')
+    infile.Close()
+    draw_time += time.perf_counter() - start
+
+    start = time.perf_counter()
+    infile = ROOT.TFile(data_file)
+    tree = infile.Get('ntp')
+    for i in range(tree.GetEntries()):
+      tree.GetEntry(i)
+    infile.Close()
+    read_time += time.perf_counter() - start
+  return draw_time, read_time
+
+
+def main():
+  # 1. Get input from command line.
+  parser = argparse.ArgumentParser(description='Compare the compression settings of the trimmed files.')
+  parser.add_argument('xtal', type=int)
+  parser.add_argument('run', type=int)
+  parser.add_argument('subruns')
+  parser.add_argument('--multiplicity', default='single')
+  parser.add_argument('--settings', default='default,zlib:1,lz4:4,zstd:5,lzma:1',
+                      help="comma separated compression settings, 'default' for the ROOT default")
+  parser.add_argument('--work-dir', default='./benchmark/',
+                      help='directory of the trimmed files of the benchmark')
+  perform_trim.add_trim_options(parser)
+  options = parser.parse_args()
+
+  xtal = options.xtal
+  run = options.run
+  subruns = [int(subrun) for subrun in options.subruns.split(',')]
+  multiplicity = options.multiplicity
+  settings = options.settings.split(',')
+
+  # Check bad input
+  assert xtal in perform_trim.good_xtals  # Use good crystals only
+  assert (run >= 1000) and (run <= 9999)
+  for subrun in subruns:
+    assert (subrun >= 0) and (subrun <= 999)
+  assert multiplicity in ['single', 'multi']
+  compressions = [None if setting == 'default' else perform_trim.parse_compression(setting) for setting in settings]
+
+  # Every output is trimmed again, without the trim manifest and the columnar export.
+  options.no_manifest = True
+  options.columnar = False
+
+  # Importing ROOT takes a few seconds, so import it after checking input.
+  import ROOT
+
+  # 2. Read MRGD files once
+  for subrun in subruns:
+    mrgd_file = ''.join(perform_trim.get_mrgd_file(run, subrun, options))
+    if os.path.isfile(mrgd_file):
+      warm_up(mrgd_file)
+
+  # 3. Trim and read back with every setting
+  print('setting,files,size_MB,trim_s,draw_s,read_s,read_MBps')
+  for setting, compression in zip(settings, compressions):
+    work_dir = os.path.join(options.work_dir, setting.replace(':', '_')) + '/'
+    shutil.rmtree(work_dir, ignore_errors=True)  # trim again from scratch
+    perform_trim.home_directory = work_dir
+    options.compression = compression
+
+    trim_time = time_trim(xtal, run, subruns, multiplicity, options)
+
+    data_files = []
+    for subrun in subruns:
+      output_path, output_name = perform_trim.get_output_file(xtal, run, subrun, multiplicity)
+      if os.path.isfile(output_path + output_name):
+        data_files.append(output_path + output_name)
+    size = sum(os.path.getsize(data_file) for data_file in data_files) / 1e6
+    draw_time, read_time = time_read(ROOT, xtal, data_files)
+
+    print(setting, len(data_files), f'{size:.3f}', f'{trim_time:.3f}', f'{draw_time:.3f}', f'{read_time:.3f}',
+          f'{size / read_time:.3f}' if read_time > 0 else 0, sep=',')
+    sys.stdout.flush()
+
+
+# Execute the main code
+if __name__ == '__main__':
+  main()
+
+# END OF CODE
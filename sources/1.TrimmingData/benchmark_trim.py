@@ -0,0 +1,219 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+# Usage
+#     (pyroot) $ python benchmark_trim.py 'mrgd_dir' 'run' 'subruns' [options]
+#             mrgd_dir: directory of the MRGD files, holding a directory per
+#                       run (e.g. ./synthetic/MRGD/ of make_synthetic_mrgd.py)
+#             run: every available runs
+#             subruns: comma separated list of subruns (e.g. 0,1,2)
+#             --xtals: 2, 3, 4, 6 or 7, a comma separated list of them, or
+#                      'all' (default: 'all')
+#             --multiplicity: 'single', 'multi' or 'both' (default: 'single')
+#             --modes: comma separated list of the trimming modes to compare.
+#                      A mode is an engine ('tree', 'rdf' or 'uproot')
+#                      followed by '+slim', '+summary', '+cache' (for
+#                      --cache-branches) or '+prefetch' for those options.
+#                      (default: 'tree,tree+slim,rdf,rdf+slim,uproot')
+#             --work-dir: directory of the trimmed files of the benchmark
+#                         (default: ./benchmark/)
+#             other options: same as perform_trim.py (--threads,
+#                            --compression, --cache-size, ...), applied to
+#                            every mode
+# Example
+#     (pyroot) $ python make_synthetic_mrgd.py 1544 4 --events 1000000
+#     (pyroot) $ python benchmark_trim.py ./synthetic/MRGD/ 1544 0,1,2,3
+#             will trim every good crystal of the 4 synthetic subruns with
+#             every mode, and print the result of each mode.
+#     (pyroot) $ python benchmark_trim.py /mnt/lustre/.../V00-04-19/ 1544 0,1 \
+#                       --modes tree+slim,tree+slim+cache,tree+slim+cache+prefetch \
+#                       --cache-size 64
+#             will compare the TTreeCache settings on the cluster.
+#
+#  This script compares the trimming engines and modes. Each mode is run in
+# its own process, trimming the subruns into the work directory from scratch,
+# so that the peak memory of each mode is measured separately and the ROOT
+# import is counted in every mode. The result is printed in csv format,
+#     mode,files,events,selected,wall_s,trim_s,events_per_s,MBps,output_MB,peak_RSS_MB,read_calls,file_read_calls
+# where
+#  events, selected: number of MRGD events, and of events written in total
+#  wall_s: time of the process, including the Python startup
+#  trim_s: time of trimming, including the ROOT (or uproot) import
+#  events_per_s, MBps: MRGD events and MRGD bytes trimmed per second of trim_s
+#  peak_RSS_MB: peak resident memory of the process
+#  read_calls: number of read system calls while trimming, of every file
+#  file_read_calls: number of reads of the ROOT files (TFile), empty for the
+#                   uproot engine. Fewer, larger reads are faster on Lustre.
+#  The MRGD files are read once before the benchmark, so that every mode sees
+# the same page cache state.
+###############################################################################
+
+# 0. Prepare
+# Import packages
+import os
+import sys
+import io
+import json
+import time
+import shutil
+import argparse
+import subprocess
+import contextlib
+import perform_trim
+import trim_profile
+from benchmark_compression import warm_up
+
+# Options of each mode flag
+mode_flags = {'slim': ['--slim'], 'summary': ['--summary'], 'cache': ['--cache-branches'], 'prefetch': ['--prefetch']}
+
+
+# Parse a mode 'engine+flag+...' into the perform_trim options
+def parse_mode(mode):
+  engine, *flags = mode.split('+')
+  if engine not in ['tree', 'rdf', 'uproot']:
+    raise argparse.ArgumentTypeError('unknown engine ' + engine)
+  arguments = ['--engine', engine]
+  for flag in flags:
+    if flag not in mode_flags:
+      raise argparse.ArgumentTypeError('unknown mode flag ' + flag)
+    arguments += mode_flags[flag]
+  return arguments
+
+
+# Trim the subruns in this process, and write the result into result_file.
+# This is run in the process started by run_mode().
+def trim_mode(options, xtals, subruns, result_file):
+  # Write into the work directory of the mode. The MRGD files are read from
+  # mrgd_dir, which is also the --mrgd-dir option of perform_trim.
+  perform_trim.home_directory = os.path.dirname(result_file) + '/'
+
+  # Every output is trimmed again, without the trim manifest and the columnar export.
+  options.no_manifest = True
+  options.columnar = False
+
+  # The result lines of perform_trim are parsed, not printed.
+  lines = io.StringIO()
+  start = trim_profile.read_counters()
+  with contextlib.redirect_stdout(lines):
+    for subrun in subruns:
+      perform_trim.trim_subrun(xtals, options.run, subrun, options.multiplicity, options)
+  stop = trim_profile.read_counters()
+  trim_time = stop[0] - start[0]
+  read_calls = stop[4] - start[4]
+  # Reads of the ROOT files, if ROOT was used
+  file_read_calls = sys.modules['ROOT'].TFile.GetFileReadCalls() if 'ROOT' in sys.modules else None
+
+  nOriginalEntries = {}
+  nEntries = 0
+  for line in lines.getvalue().splitlines():
+    filename, xtal, run, subrun, multiplicity, nOriginal, nSelected = line.split(',')
+    nOriginalEntries[subrun] = int(nOriginal)
+    nEntries += int(nSelected)
+  with open(result_file, 'w') as outfile:
+    json.dump({'trim_s': trim_time, 'events': sum(nOriginalEntries.values()), 'selected': nEntries,
+               'read_calls': read_calls, 'file_read_calls': file_read_calls}, outfile)
+
+
+# Run a mode in a new process, and return (its result, wall time, peak
+# resident memory in MB), or None if it failed.
+def run_mode(mode, work_dir):
+  result_file = os.path.join(work_dir, 'result.json')
+  command = [sys.executable, os.path.abspath(__file__)] + sys.argv[1:] + parse_mode(mode) + ['--result-file', result_file]
+
+  start = time.perf_counter()
+  process = subprocess.Popen(command)
+  # os.wait4() returns the resource usage of this process only.
+  pid, status, rusage = os.wait4(process.pid, 0)
+  wall_time = time.perf_counter() - start
+  process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+
+  if process.returncode != 0 or not os.path.isfile(result_file):
+    print('Failed ', mode, process.returncode, file=sys.stderr)
+    return None
+  with open(result_file) as infile:
+    result = json.load(infile)
+  return result, wall_time, rusage.ru_maxrss / 1024.  # ru_maxrss is in kB on Linux
+
+
+# Total size of the files under a directory, in MB
+def get_directory_size(directory):
+  size = 0
+  for dirpath, dirnames, filenames in os.walk(directory):
+    size += sum(os.path.getsize(os.path.join(dirpath, filename)) for filename in filenames)
+  return size / 1e6
+
+
+def main():
+  # 1. Get input from command line.
+  parser = argparse.ArgumentParser(description='Compare the trimming engines and modes.')
+  parser.add_argument('mrgd_dir')
+  parser.add_argument('run', type=int)
+  parser.add_argument('subruns')
+  parser.add_argument('--xtals', default='all')
+  parser.add_argument('--multiplicity', default='single')
+  parser.add_argument('--modes', default='tree,tree+slim,rdf,rdf+slim,uproot',
+                      help="comma separated modes, an engine followed by '+slim', '+summary', '+cache' or '+prefetch'")
+  parser.add_argument('--work-dir', default='./benchmark/',
+                      help='directory of the trimmed files of the benchmark')
+  parser.add_argument('--result-file', help=argparse.SUPPRESS)  # set in the process of each mode
+  perform_trim.add_trim_options(parser)
+  options = parser.parse_args()
+
+  xtals = perform_trim.good_xtals if options.xtals == 'all' else [int(xtal) for xtal in options.xtals.split(',')]
+  subruns = [int(subrun) for subrun in options.subruns.split(',')]
+  modes = options.modes.split(',')
+
+  # Check bad input
+  for xtal in xtals:
+    assert xtal in perform_trim.good_xtals  # Use good crystals only
+  for subrun in subruns:
+    assert (subrun >= 0) and (subrun <= 999)
+  assert options.multiplicity in ['single', 'multi', 'both']
+  for mode in modes:
+    try:
+      parse_mode(mode)
+    except argparse.ArgumentTypeError as error:
+      parser.error(str(error))
+
+  # In the process of a mode, trim and return.
+  if options.result_file is not None:
+    trim_mode(options, xtals, subruns, options.result_file)
+    return
+
+  # 2. Read MRGD files once
+  mrgd_files = []
+  for subrun in subruns:
+    mrgd_file = os.path.join(options.mrgd_dir, f'{options.run:d}', perform_trim.file_name_format.format(run=options.run, subrun=subrun))
+    if os.path.isfile(mrgd_file):
+      warm_up(mrgd_file)
+      mrgd_files.append(mrgd_file)
+  mrgd_size = sum(os.path.getsize(mrgd_file) for mrgd_file in mrgd_files) / 1e6
+
+  # 3. Run every mode
+  print('mode,files,events,selected,wall_s,trim_s,events_per_s,MBps,output_MB,peak_RSS_MB,read_calls,file_read_calls')
+  for mode in modes:
+    work_dir = os.path.join(options.work_dir, mode.replace('+', '_')) + '/'
+    shutil.rmtree(work_dir, ignore_errors=True)  # trim again from scratch
+    os.makedirs(work_dir)
+
+    measured = run_mode(mode, work_dir)
+    if measured is None:
+      continue
+    result, wall_time, peak_rss = measured
+    trim_time = result['trim_s']
+    output_size = get_directory_size(os.path.join(work_dir, 'data'))
+
+    print(mode, len(mrgd_files), result['events'], result['selected'], f'{wall_time:.3f}', f'{trim_time:.3f}',
+          f'{result["events"] / trim_time:.0f}' if trim_time > 0 else 0,
+          f'{mrgd_size / trim_time:.3f}' if trim_time > 0 else 0,
+          f'{output_size:.3f}', f'{peak_rss:.1f}', result['read_calls'],
+          '' if result['file_read_calls'] is None else result['file_read_calls'], sep=',')
+    sys.stdout.flush()
+
+
+# Execute the main code
+if __name__ == '__main__':
+  main()
+
+# END OF CODE
@@ -0,0 +1,229 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+#  Change output directories to your own directories.
+# Find '# SETTING: directory' comments in perform_trim.py and modify
+# directories.
+#
+# Usage
+#     (pyroot) $ python consolidate_trim.py 'xtal' 'runs' 'multiplicity' [options]
+#             xtal: 2, 3, 4, 6 or 7, a comma separated list of them, or 'all'
+#             runs: comma separated list of runs
+#             multiplicity: 'single' or 'multi'
+#             --remove: remove the per-subrun files after packing them
+#             --force: pack the run even if some subruns of the MRGD
+#                      directory are neither trimmed nor skipped
+#             --mrgd-dir: MRGD directory holding a directory per run, the
+#                         subruns of which must be trimmed
+#                         (default: that of perform_trim.file_path_format)
+#             --manifest: trim manifest directory recording the skipped
+#                         subruns (default: data/trim_manifest/)
+# Example
+#     (pyroot) $ python consolidate_trim.py all 1544,1545 single --remove
+#             will pack the trimmed files of crystal 2, 3, 4, 6 and 7 of run
+#             1544 and 1545 into one file per crystal and run, and remove the
+#             per-subrun files.
+#
+#  This script packs every per-subrun trimmed file of a run,
+#     data/C{xtal}/trim_T{run:06d}_C{xtal}.root.{subrun:03d}
+# into one run file,
+#     data/C{xtal}/trim_T{run:06d}_C{xtal}.root
+# to reduce the number of files on the file system. The run file holds
+#  'ntp': the events of every subrun, in the order of subrun
+#  'subruns': the index tree, one row per subrun, with subrun, firstEntry and
+#             the subrun metadata (iEvtSec, fEvtSec, subrunDuration,
+#             nOriginalEntries, nEntries). The events of a subrun are the
+#             entries firstEntry ~ firstEntry + nEntries - 1 of 'ntp'.
+#  'cutVersion', 'cutHash': the cut version of the trimmed files
+# The later stages read both layouts with dqc_io.iter_subruns().
+#  A run is packed only when every subrun of its MRGD directory is trimmed,
+# or recorded in the trim manifest as skipped ('NoBranch'), since such a
+# subrun has no trimmed file.
+#  Pack a run only after its trimming is finished; perform_trim.py skips
+# the subruns of a packed run. Remove the run file to trim the run again.
+###############################################################################
+
+# 0. Prepare
+# Import packages
+import os
+import sys
+import argparse
+from array import array
+import perform_trim
+import trim_manifest
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import dqc_io
+
+# Keys of the skipped tasks of the trim manifest, read once per directory
+skipped_records = {}
+
+
+# Pack the trimmed files of a run into the run file
+def consolidate_run(ROOT, xtal, run, multiplicity, options):
+  # Command line of this task, printed with the result
+  argv = [sys.argv[0], str(xtal), str(run), multiplicity]
+
+  # 1. Find the per-subrun files
+  output_path, run_name = perform_trim.get_run_file(xtal, run, multiplicity)
+  if os.path.isfile(output_path + run_name):
+    print('AlreadyConsolidated ', argv, file=sys.stderr)
+    return
+  prefix = run_name + '.'
+  filenamelist = sorted(filename for filename in os.listdir(output_path) if filename.startswith(prefix)) \
+                 if os.path.isdir(output_path) else []
+  if len(filenamelist) == 0:
+    print('NoTrimmed ', argv, file=sys.stderr)
+    return
+
+  # Check that every subrun of the MRGD directory is trimmed or skipped, if it
+  # is reachable
+  mrgd_path, mrgd_name = perform_trim.get_mrgd_file(run, 0, options)
+  if not options.force and os.path.isdir(mrgd_path):
+    mrgd_prefix = mrgd_name[:-3]
+    mrgd_subruns = set(int(filename[-3:]) for filename in os.listdir(mrgd_path) if filename.startswith(mrgd_prefix))
+    missing = mrgd_subruns - set(int(filename[-3:]) for filename in filenamelist) \
+              - get_skipped_subruns(xtal, run, multiplicity, options)
+    if len(missing) > 0:
+      print('Incomplete ', argv, f'{len(mrgd_subruns) - len(missing)}/{len(mrgd_subruns)}', file=sys.stderr)
+      return
+
+  # 2. Read the metadata of every subrun
+  chain = ROOT.TChain('ntp')
+  index = []  # list of (subrun, firstEntry, meta)
+  cut_versions = set()
+  compression = None
+  firstEntry = 0
+  for filename in filenamelist:
+    data_file = ROOT.TFile(output_path + filename)
+    meta = dqc_io.read_valid_subrun_meta(data_file)
+    if meta is None:
+      print('Broken ', argv, filename, file=sys.stderr)
+      return
+    cut_versions.add(dqc_io.read_cut_version(data_file))
+    if compression is None:
+      compression = data_file.GetCompressionSettings()
+    data_file.Close()
+
+    index.append((int(filename[-3:]), firstEntry, meta))
+    firstEntry += meta['nEntries']
+    chain.Add(output_path + filename)
+
+  # Every subrun must be trimmed with the same cuts.
+  if len(cut_versions) != 1:
+    print('MixedCutVersions ', argv, sorted(str(cut_version) for cut_version in cut_versions), file=sys.stderr)
+    return
+  cut_version, cut_hash = cut_versions.pop()
+
+  # 3. Write the run file
+  # It is written under a temporary name and renamed, so that readers never
+  # see a partially written file.
+  temporary = output_path + '.' + run_name
+  newfile = ROOT.TFile(temporary, 'RECREATE', '', compression)
+  newtree = chain.CloneTree(-1, 'fast')  # copy the baskets without decompressing them
+  nEntries = newtree.GetEntries()
+  newtree.Write()
+  write_subrun_index(ROOT, newfile, index)
+  if cut_version is not None:
+    ROOT.TNamed('cutVersion', cut_version).Write()
+    ROOT.TNamed('cutHash', cut_hash).Write()
+  newfile.Close()
+
+  if nEntries != firstEntry:
+    os.remove(temporary)
+    print('Broken ', argv, run_name, file=sys.stderr)
+    return
+  os.replace(temporary, output_path + run_name)
+
+  # 4. Remove the per-subrun files
+  if options.remove:
+    for filename in filenamelist:
+      os.remove(output_path + filename)
+
+  # Print the output
+  print(sys.argv[0], xtal, run, multiplicity, len(index), nEntries, sep=',')
+
+
+# Subruns of the run recorded in the trim manifest as skipped without output
+def get_skipped_subruns(xtal, run, multiplicity, options):
+  # Every job file is read, since the workers may not be merged yet. The
+  # records are read once for every run and crystal.
+  if options.manifest not in skipped_records:
+    skipped_records[options.manifest] = [key for key, entry in trim_manifest.read_records(options.manifest).items()
+                                         if entry.get('status', 'Trimmed') != 'Trimmed']
+  return set(subrun for each_run, subrun, each_xtal, each_multiplicity in skipped_records[options.manifest]
+             if (each_run, each_xtal, each_multiplicity) == (run, xtal, multiplicity))
+
+
+# Write the index tree 'subruns', one row per subrun
+def write_subrun_index(ROOT, newfile, index):
+  # Define variables for tree I/O
+  subrun = array('i', [0])
+  firstEntry = array('q', [0])
+  iEvtSec = array('q', [0])  # 'q' means signed-long-long-int data type
+  fEvtSec = array('q', [0])
+  subrunDuration = array('H', [0])  # 'H' means unsigned-short data type
+  nOriginalEntries = array('q', [0])
+  nEntries = array('q', [0])
+
+  newfile.cd()
+  tree = ROOT.TTree('subruns', 'subrun index')
+  ROOT.SetOwnership(tree, False)  # the tree is deleted when newfile is closed
+  tree.Branch('subrun', subrun, 'subrun/I')
+  tree.Branch('firstEntry', firstEntry, 'firstEntry/L')
+  tree.Branch('iEvtSec', iEvtSec, 'iEvtSec/L')
+  tree.Branch('fEvtSec', fEvtSec, 'fEvtSec/L')
+  tree.Branch('subrunDuration', subrunDuration, 'subrunDuration/s')
+  tree.Branch('nOriginalEntries', nOriginalEntries, 'nOriginalEntries/L')
+  tree.Branch('nEntries', nEntries, 'nEntries/L')
+  for subrun_number, first_entry, meta in index:
+    subrun[0] = subrun_number
+    firstEntry[0] = first_entry
+    iEvtSec[0] = meta['iEvtSec']
+    fEvtSec[0] = meta['fEvtSec']
+    subrunDuration[0] = meta['subrunDuration']
+    nOriginalEntries[0] = meta['nOriginalEntries']
+    nEntries[0] = meta['nEntries']
+    tree.Fill()
+  tree.Write()
+
+
+def main():
+  # Get input from command line.
+  parser = argparse.ArgumentParser(description='Pack the trimmed files of a run into one file.')
+  parser.add_argument('xtal', help="2, 3, 4, 6 or 7, a comma separated list of them, or 'all'")
+  parser.add_argument('runs', help='comma separated list of runs')
+  parser.add_argument('multiplicity')
+  parser.add_argument('--remove', action='store_true',
+                      help='remove the per-subrun files after packing them')
+  parser.add_argument('--force', action='store_true',
+                      help='pack the run even if some subruns are neither trimmed nor skipped')
+  parser.add_argument('--mrgd-dir', default=None,
+                      help='MRGD directory holding a directory per run, instead of the default one')
+  parser.add_argument('--manifest', default=perform_trim.manifest_directory,
+                      help='trim manifest directory recording the skipped subruns')
+  options = parser.parse_args()
+
+  xtals = perform_trim.good_xtals if options.xtal == 'all' else [int(xtal) for xtal in options.xtal.split(',')]
+  runs = [int(run) for run in options.runs.split(',')]
+  multiplicity = options.multiplicity
+
+  # Check bad input
+  for xtal in xtals:
+    assert xtal in perform_trim.good_xtals  # Use good crystals only
+  for run in runs:
+    assert (run >= 1000) and (run <= 9999)
+  assert multiplicity in ['single', 'multi']
+
+  import ROOT
+  for run in runs:
+    for xtal in xtals:
+      consolidate_run(ROOT, xtal, run, multiplicity, options)
+      sys.stdout.flush()
+
+
+# Execute the main code
+if __name__ == '__main__':
+  main()
+
+# END OF CODE
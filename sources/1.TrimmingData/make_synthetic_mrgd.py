@@ -0,0 +1,211 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+# Usage
+#     (pyroot) $ python make_synthetic_mrgd.py 'runs' 'nSubruns' [options]
+#             runs: comma separated list of runs
+#             nSubruns: number of subruns of each run
+#             --output-dir: directory of the synthetic MRGD files, holding a
+#                           directory per run like the MRGD directory
+#                           (default: ./synthetic/MRGD/)
+#             --events: number of events of each subrun (default: 200000)
+#             --seed: random seed (default: 1)
+#             --start-time: eventsec of the first event (default: 1546300800)
+#             --subrun-duration: duration of each subrun in seconds
+#                                (default: 3600)
+#             --energy-scale: mean energy of the hit crystals in keV, drawn
+#                             from an exponential distribution (default: 10)
+#             --noise-fraction: fraction of PMT noise-like hits, failing the
+#                               BDT and ES cuts (default: 0.3)
+#             --multi-fraction: fraction of events hitting two crystals
+#                               (default: 0.2)
+#             --coincidence-fraction: fraction of events with
+#                                     BLSVeto.isCoincident == 1 (default: 0.9)
+#             --muon-interval: mean of BMuon.totalDeltaT0 in ms
+#                              (default: 2000)
+#             --ls-charge: mean LS charge in SPE (default: 40)
+#             --compression: compression of the files, as in perform_trim.py
+# Example
+#     (pyroot) $ python make_synthetic_mrgd.py 1544 4 --events 1000000
+#             will write 4 subruns of run 1544 with 1000000 events each,
+#             ./synthetic/MRGD/1544/mrgd_M001544.root.000 ~ 003
+#     (pyroot) $ python benchmark_trim.py ./synthetic/MRGD/ 1544 0,1,2,3
+#             will benchmark the trimming on them (see benchmark_trim.py).
+#
+#  This script writes synthetic MRGD files, so that the trimming can be run
+# and benchmarked without the MRGD files on the cluster. The 'ntp' tree has
+# every branch perform_trim.py reads,
+#     eventsec, BLSVeto, BMuon, crystal1 ~ crystal8, pmt11 ~ pmt82, bdt[9]
+# with the leaves used by the cuts in trim_cuts.py. The object branches of
+# the MRGD file are written as leaflist branches here, which the trimming
+# engines read with the same 'branch.leaf' names.
+#  The events are filled by a C++ function JIT-compiled once per process.
+# Each hit crystal gets an exponential energy spectrum; a noise-like hit has
+# a low BDT score and ES variable, so that the BDT and ES cuts reject it.
+# Every random number is drawn from a generator seeded by the seed, run and
+# subrun, so the files are reproducible.
+###############################################################################
+
+# 0. Prepare
+# Import packages
+import os
+import sys
+import argparse
+import trim_cuts
+import perform_trim
+
+# C++ code filling the synthetic events
+fill_code = r'''
+#include "TTree.h"
+#include "TRandom3.h"
+
+namespace synthetic_mrgd {
+
+// Leaves are ordered from the largest type, so that the struct has no padding
+// between them.
+struct LSVeto { double Charge; int isCoincident; };
+struct Muon { double totalDeltaT0; };
+struct Crystal { double energy; double rqcn; double nx1; double nx2; int nc; };
+struct PMT { double t1; int nc; };
+
+void fill(TTree *tree, Long64_t nEvents, UInt_t seed, Long64_t iEvtSec, double duration,
+          double energyScale, double noiseFraction, double multiFraction,
+          double coincidenceFraction, double muonInterval, double lsCharge)
+{
+  TRandom3 random(seed);
+  Long64_t eventsec;
+  LSVeto lsveto;
+  Muon muon;
+  Crystal crystal[9];
+  PMT pmt[9][3];
+  double bdt[9];
+
+  tree->Branch("eventsec", &eventsec, "eventsec/L");
+  tree->Branch("BLSVeto", &lsveto, "Charge/D:isCoincident/I");
+  tree->Branch("BMuon", &muon, "totalDeltaT0/D");
+  for (int x = 1; x <= 8; x++) {
+    tree->Branch(Form("crystal%d", x), &crystal[x], "energy/D:rqcn/D:nx1/D:nx2/D:nc/I");
+    for (int p = 1; p <= 2; p++)
+      tree->Branch(Form("pmt%d%d", x, p), &pmt[x][p], "t1/D:nc/I");
+  }
+  tree->Branch("bdt", bdt, "bdt[9]/D");
+
+  for (Long64_t i = 0; i < nEvents; i++) {
+    eventsec = iEvtSec + (Long64_t)(duration*i/nEvents);
+    lsveto.isCoincident = random.Rndm() < coincidenceFraction;
+    lsveto.Charge = random.Exp(lsCharge);
+    muon.totalDeltaT0 = random.Exp(muonInterval*1e6);  // in ns
+
+    // Crystals without a hit
+    for (int x = 0; x <= 8; x++) {
+      crystal[x].energy = random.Gaus(0., 0.1);
+      crystal[x].rqcn = -1.;
+      crystal[x].nx1 = crystal[x].nx2 = 0.;
+      crystal[x].nc = random.Poisson(0.3);
+      pmt[x][1].t1 = pmt[x][2].t1 = -1.;
+      pmt[x][1].nc = pmt[x][2].nc = 0;
+      bdt[x] = random.Gaus(0., 0.1);
+    }
+
+    // Hit crystals
+    int nHits = random.Rndm() < multiFraction ? 2 : 1;
+    for (int hit = 0; hit < nHits; hit++) {
+      int x = 1 + random.Integer(8);
+      bool noise = random.Rndm() < noiseFraction;
+      double es = noise ? random.Gaus(0.35, 0.1) : random.Gaus(0.65, 0.08);
+      crystal[x].energy = random.Exp(energyScale);
+      crystal[x].nc = 4 + random.Poisson(15.*crystal[x].energy);  // about 15 NPE per keV
+      crystal[x].rqcn = crystal[x].nc;
+      crystal[x].nx1 = random.Uniform(0., 0.5);
+      crystal[x].nx2 = crystal[x].nx1 + 1. - 2.*es;
+      for (int p = 1; p <= 2; p++) {
+        pmt[x][p].nc = 1 + random.Poisson(crystal[x].nc/2.);
+        pmt[x][p].t1 = random.Uniform(1., 100.);
+      }
+      bdt[x] = noise ? random.Gaus(-0.15, 0.05) : random.Gaus(0.1, 0.04);
+    }
+    tree->Fill();
+  }
+  tree->ResetBranchAddresses();  // the addresses are local to this function
+}
+
+}
+'''
+
+
+# Write one synthetic MRGD file, and return its number of events
+def write_subrun(ROOT, run, subrun, options):
+  file_path = os.path.join(options.output_dir, f'{run:d}') + '/'
+  file_name = perform_trim.file_name_format.format(run=run, subrun=subrun)
+  os.makedirs(file_path, exist_ok=True)
+
+  # It is written under a temporary name and renamed, so that the trimming
+  # never reads a partially written file.
+  temporary = file_path + '.' + file_name
+  newfile = perform_trim.open_output_file(ROOT, temporary, options.compression)
+  tree = ROOT.TTree('ntp', 'synthetic MRGD')
+  ROOT.SetOwnership(tree, False)  # the tree is deleted when newfile is closed
+
+  # The LS charge of the cuts is in SPE.
+  spe = trim_cuts.load_cut_config()['ls_charge']['spe']
+  # The subruns of the runs follow each other in time.
+  iEvtSec = options.start_time + int((options.runs.index(run) * options.subruns + subrun) * options.subrun_duration)
+  seed = (options.seed * 1000003 + run * 1000 + subrun) % (1 << 32)
+  ROOT.synthetic_mrgd.fill(tree, options.events, seed,
+                           iEvtSec, options.subrun_duration, options.energy_scale, options.noise_fraction,
+                           options.multi_fraction, options.coincidence_fraction, options.muon_interval,
+                           options.ls_charge * spe)
+  nEntries = tree.GetEntries()
+  tree.Write()
+  newfile.Close()
+  os.replace(temporary, file_path + file_name)
+  return nEntries
+
+
+def main():
+  # 1. Get input from command line.
+  parser = argparse.ArgumentParser(description='Write synthetic MRGD files for testing and benchmarking the trimming.')
+  parser.add_argument('runs', type=lambda value: [int(run) for run in value.split(',')],
+                      help='comma separated list of runs')
+  parser.add_argument('subruns', type=int, help='number of subruns of each run')
+  parser.add_argument('--output-dir', default='./synthetic/MRGD/',
+                      help='directory of the synthetic MRGD files')
+  parser.add_argument('--events', type=int, default=200000, help='number of events of each subrun')
+  parser.add_argument('--seed', type=int, default=1, help='random seed')
+  parser.add_argument('--start-time', type=int, default=1546300800, help='eventsec of the first event')
+  parser.add_argument('--subrun-duration', type=float, default=3600., help='duration of each subrun in seconds')
+  parser.add_argument('--energy-scale', type=float, default=10., help='mean energy of the hit crystals in keV')
+  parser.add_argument('--noise-fraction', type=float, default=0.3, help='fraction of noise-like hits')
+  parser.add_argument('--multi-fraction', type=float, default=0.2, help='fraction of events hitting two crystals')
+  parser.add_argument('--coincidence-fraction', type=float, default=0.9,
+                      help='fraction of events with BLSVeto.isCoincident == 1')
+  parser.add_argument('--muon-interval', type=float, default=2000., help='mean of BMuon.totalDeltaT0 in ms')
+  parser.add_argument('--ls-charge', type=float, default=40., help='mean LS charge in SPE')
+  parser.add_argument('--compression', type=perform_trim.parse_compression, default=None,
+                      help="compression of the files as 'algorithm:level', ROOT default if not given")
+  options = parser.parse_args()
+
+  # Check bad input
+  assert (options.subruns >= 1) and (options.subruns <= 1000)
+  assert options.events >= 1
+  for fraction in (options.noise_fraction, options.multi_fraction, options.coincidence_fraction):
+    assert (fraction >= 0) and (fraction <= 1)
+
+  # Importing ROOT takes a few seconds, so import it after checking input.
+  import ROOT
+  ROOT.gInterpreter.Declare(fill_code)
+
+  # 2. Write the files
+  for run in options.runs:
+    for subrun in range(options.subruns):
+      nEntries = write_subrun(ROOT, run, subrun, options)
+      print(sys.argv[0], run, subrun, nEntries, sep=',')
+      sys.stdout.flush()
+
+
+# Execute the main code
+if __name__ == '__main__':
+  main()
+
+# END OF CODE
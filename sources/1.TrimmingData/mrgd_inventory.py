@@ -0,0 +1,226 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+#  Change output directories to your own directories.
+# Find '# SETTING: directory' comments in perform_trim.py and modify
+# directories.
+#
+# Usage
+#     $ python mrgd_inventory.py scan [options]
+#             --runs: comma separated list of runs (default: every run
+#                     directory of the MRGD directory)
+#             --mrgd-dir: MRGD directory holding a directory per run
+#                         (default: that of perform_trim.file_path_format)
+#             --inventory: inventory file
+#                          (default: data/mrgd_inventory.csv)
+#     $ python mrgd_inventory.py bundle 'xtal' 'multiplicity' [options]
+#             xtal: 2, 3, 4, 6 or 7, a comma separated list of them, or 'all'
+#             multiplicity: 'single', 'multi' or 'both'
+#             --runs: comma separated list of runs of the inventory
+#                     (default: every run of the inventory)
+#             --bundle-size: total MRGD size of each bundle in GB
+#                            (default: 20)
+#             --bundles: number of bundles, instead of --bundle-size
+#             --inventory: inventory file
+#             --output-dir: directory of the task files of the bundles
+#                           (default: out/bundles/)
+# Example
+#     $ python mrgd_inventory.py scan
+#             will scan every run directory of the MRGD directory once, and
+#             write the inventory.
+#     $ python mrgd_inventory.py bundle all single --bundle-size 20
+#     (pyroot) $ sbatch --array=0-N perform_trim_bundles.sh out/bundles/
+#             will pack every subrun of the inventory into bundles of about
+#             20 GB of MRGD files, and trim a bundle per array task, where N
+#             is the number of bundles - 1, printed by the first command.
+#
+#  The inventory lists every existing MRGD file, one per row,
+#     run,subrun,size,mtime
+# so that the task lists are built without scanning the MRGD directory
+# again, and without a task for a subrun which does not exist.
+#  The bundles are made of roughly equal total bytes, so that every job
+# trims a predictable amount of data and none is empty. The subruns are
+# assigned from the largest, each to the bundle with the fewest bytes so far,
+# and each bundle lists its subruns in the order of run and subrun. The task
+# files are in the format of perform_trim_batch.py,
+#     out/bundles/bundle-0000.txt, bundle-0001.txt, ...
+# (see also 'schedule_trim.py --bundle-size').
+###############################################################################
+
+# 0. Prepare
+# Import packages
+import os
+import sys
+import math
+import heapq
+import argparse
+import perform_trim
+
+# MRGD directory holding a directory per run, from the MRGD data path format
+mrgd_directory = os.path.dirname(perform_trim.file_path_format.rstrip('/'))
+
+# Inventory file
+inventory_file = perform_trim.home_directory + 'data/mrgd_inventory.csv'
+
+
+# Runs of the MRGD directory
+def find_runs(mrgd_dir):
+  return sorted(int(name) for name in os.listdir(mrgd_dir) if name.isdigit())
+
+
+# Scan the MRGD files of the runs. Return the list of
+# (run, subrun, size, mtime), sorted by run and subrun.
+def scan(mrgd_dir, runs):
+  entries = []
+  for run in runs:
+    run_path = os.path.join(mrgd_dir, f'{run:d}')
+    prefix = perform_trim.file_name_format.format(run=run, subrun=0)[:-3]
+    if not os.path.isdir(run_path):
+      continue
+    with os.scandir(run_path) as files:  # one directory listing per run
+      for entry in files:
+        if entry.name.startswith(prefix) and entry.name[len(prefix):].isdigit():
+          stat = entry.stat()
+          entries.append((run, int(entry.name[len(prefix):]), stat.st_size, stat.st_mtime))
+  entries.sort()
+  return entries
+
+
+# Write the inventory. It is written under a temporary name and renamed, so
+# that readers never see a partially written file. An unchanged inventory is
+# not written again, so that its mtime tells when the MRGD files changed
+# (see run_pipeline.py).
+def write_inventory(path, entries):
+  directory, name = os.path.split(path)
+  os.makedirs(directory or '.', exist_ok=True)
+  text = 'run,subrun,size,mtime\n' + ''.join(','.join(map(str, entry)) + '\n' for entry in entries)
+  if os.path.isfile(path):
+    with open(path) as infile:
+      if infile.read() == text:
+        return
+  temporary = os.path.join(directory, '.' + name)
+  with open(temporary, 'w') as outfile:
+    outfile.write(text)
+  os.replace(temporary, path)
+
+
+# Read the inventory. Return the list of (run, subrun, size, mtime).
+def read_inventory(path):
+  entries = []
+  with open(path) as infile:
+    next(infile)  # header
+    for line in infile:
+      run, subrun, size, mtime = line.strip().split(',')
+      entries.append((int(run), int(subrun), int(size), float(mtime)))
+  return entries
+
+
+# Number of bundles of about bundle_bytes each
+def count_bundles(entries, bundle_bytes):
+  return max(1, math.ceil(sum(entry[2] for entry in entries) / bundle_bytes))
+
+
+# Pack the entries into nBundles bundles of roughly equal total size.
+# Return the list of bundles, each a list of entries sorted by run and
+# subrun. No bundle is empty, so there are at most as many bundles as
+# entries, and at least one if there is any entry.
+def make_bundles(entries, nBundles):
+  if nBundles < 1:
+    raise ValueError(f'number of bundles must be positive, not {nBundles}')
+  nBundles = min(nBundles, len(entries))
+  heap = [(0, i) for i in range(nBundles)]  # (total size, bundle index)
+  bundles = [[] for i in range(nBundles)]
+  for entry in sorted(entries, key=lambda entry: -entry[2]):
+    size, i = heapq.heappop(heap)
+    bundles[i].append(entry)
+    heapq.heappush(heap, (size + entry[2], i))
+  for bundle in bundles:
+    bundle.sort()
+  return bundles
+
+
+# Write the task file of a bundle of (run, subrun, ...), in the format of
+# perform_trim_batch.py
+def write_task_file(task_file, bundle, xtals, multiplicity):
+  with open(task_file, 'w') as outfile:
+    for run, subrun, *rest in bundle:
+      for xtal in xtals:
+        print(xtal, run, subrun, multiplicity, file=outfile)
+
+
+# Parse a positive integer option, like the number of bundles
+def positive_int(value):
+  number = int(value)
+  if number < 1:
+    raise argparse.ArgumentTypeError(f'must be a positive integer, not {value}')
+  return number
+
+
+# Parse a positive float option, like the bundle size
+def positive_float(value):
+  number = float(value)
+  if not number > 0:
+    raise argparse.ArgumentTypeError(f'must be positive, not {value}')
+  return number
+
+
+def main():
+  # 1. Get input from command line.
+  parser = argparse.ArgumentParser(description='Scan the MRGD files, and pack them into size-balanced bundles.')
+  subparsers = parser.add_subparsers(dest='command', required=True)
+  scan_parser = subparsers.add_parser('scan', help='scan the MRGD directory into the inventory')
+  scan_parser.add_argument('--mrgd-dir', default=mrgd_directory, help='MRGD directory holding a directory per run')
+  bundle_parser = subparsers.add_parser('bundle', help='write the task files of size-balanced bundles')
+  bundle_parser.add_argument('xtal', help="2, 3, 4, 6 or 7, a comma separated list of them, or 'all'")
+  bundle_parser.add_argument('multiplicity')
+  bundle_parser.add_argument('--bundle-size', type=positive_float, default=20., help='total MRGD size of each bundle in GB')
+  bundle_parser.add_argument('--bundles', type=positive_int, default=None, help='number of bundles, instead of --bundle-size')
+  bundle_parser.add_argument('--output-dir', default='out/bundles/', help='directory of the task files')
+  for subparser in (scan_parser, bundle_parser):
+    subparser.add_argument('--runs', default=None, help='comma separated list of runs')
+    subparser.add_argument('--inventory', default=inventory_file, help='inventory file')
+  options = parser.parse_args()
+
+  runs = None if options.runs is None else [int(run) for run in options.runs.split(',')]
+
+  # 2. Scan the MRGD directory
+  if options.command == 'scan':
+    if runs is None:
+      runs = find_runs(options.mrgd_dir)
+    entries = scan(options.mrgd_dir, runs)
+    write_inventory(options.inventory, entries)
+    print(sys.argv[0], len(runs), len(entries), f'{sum(entry[2] for entry in entries) / 1e9:.3f}', sep=',')
+    return
+
+  # 3. Write the bundles
+  xtals = perform_trim.good_xtals if options.xtal == 'all' else [int(xtal) for xtal in options.xtal.split(',')]
+  for xtal in xtals:
+    assert xtal in perform_trim.good_xtals  # Use good crystals only
+  assert options.multiplicity in ['single', 'multi', 'both']
+
+  entries = read_inventory(options.inventory)
+  if runs is not None:
+    entries = [entry for entry in entries if entry[0] in runs]
+  if len(entries) == 0:
+    print('NoSubrun ', options.inventory, file=sys.stderr)
+    sys.exit(1)
+  nBundles = options.bundles if options.bundles is not None else count_bundles(entries, options.bundle_size * 1e9)
+  bundles = make_bundles(entries, nBundles)
+
+  # Remove the bundles left from before, so that every task file is of these bundles.
+  os.makedirs(options.output_dir, exist_ok=True)
+  for filename in os.listdir(options.output_dir):
+    if filename.startswith('bundle-') and filename.endswith('.txt'):
+      os.remove(os.path.join(options.output_dir, filename))
+  print('bundle,subruns,size_GB')
+  for i, bundle in enumerate(bundles):
+    write_task_file(os.path.join(options.output_dir, f'bundle-{i:04d}.txt'), bundle, xtals, options.multiplicity)
+    print(i, len(bundle), f'{sum(entry[2] for entry in bundle) / 1e9:.3f}', sep=',')
+
+
+# Execute the main code
+if __name__ == '__main__':
+  main()
+
+# END OF CODE
@@ -7,16 +7,75 @@
 # Find '# SETTING: directory' comments and modify directories.
 #
 # Usage
-#     (pyroot) $ python perform_trim.py 'xtal' 'run' 'subrun' 'multiplicity'
-#             xtal: 2, 3, 4, 6 or 7
+#     (pyroot) $ python perform_trim.py 'xtal' 'run' 'subrun' 'multiplicity' [options]
+#             xtal: 2, 3, 4, 6 or 7, a comma separated list of them
+#                   (e.g. 2,3,7), or 'all' for every good crystal
 #             run: every available runs
 #             subrun: 0 ~ 999
-#             multiplicity: 'single' or 'multi' 
+#             multiplicity: 'single' or 'multi', or 'both' for both of
+#                           them in one pass over the MRGD file 
+#             --mrgd-dir: MRGD directory holding a directory per run, e.g.
+#                         the synthetic files of make_synthetic_mrgd.py.
+#                         (default: file_path_format below)
+#             --engine: 'tree' (default) trims with TChain.CopyTree,
+#                       'rdf' trims with RDataFrame and implicit multithreading,
+#                       'uproot' trims with uproot and NumPy, without ROOT.
+#                       The 'uproot' engine always writes the slim output.
+#             --threads: number of threads of the 'rdf' engine, 0 (default)
+#                        uses every core of the node
+#             --cut-version: version of the cut configuration file in 'cuts/'
+#             --slim: write only the whitelisted columns instead of every
+#                     branch of the MRGD file
+#             --columns: comma separated column whitelist of the slim output.
+#                        '{xtal}' is replaced by the crystal number, and
+#                        '{cuts}' by every leaf read by the cuts.
+#                        (default: 'eventsec,crystal{xtal}.energy,{cuts}')
+#             --manifest: trim manifest directory
+#                         (default: data/trim_manifest/)
+#             --no-manifest: skip complete outputs, checked by their 'meta'
+#                            tree, instead of using the trim manifest
+#             --checksum: also compare SHA-1 checksum of the MRGD file
+#             --columnar: also write the selected events into the per-crystal
+#                         Parquet dataset (see trim_columnar.py)
+#             --columnar-path: directory of the Parquet datasets
+#                              (default: data/columnar/)
+#             --compression: compression of the trimmed files, as
+#                            'algorithm:level' (e.g. 'zstd:5', 'lz4:4'),
+#                            where algorithm is zlib, lzma, lz4 or zstd.
+#                            ROOT default compression if not given.
+#                            See benchmark_compression.py to choose it.
+#             --summary: also write the per-subrun summary record of the
+#                        energy windows and the energy histogram
+#                        (see trim_summary.py)
+#             --profile: append the wall and CPU time, and the bytes read
+#                        and written, of every phase of each task to this
+#                        file as one JSON line per task (see trim_profile.py
+#                        and summarize_profile.py)
+#             --cache-size: size of the TTreeCache of the MRGD file in MB,
+#                           0 to disable it. ROOT default if not given.
+#                           Used by the 'tree' engine; RDataFrame manages
+#                           its own cache.
+#             --cache-branches: register the branches read by the trimming
+#                               in the TTreeCache at once, instead of
+#                               learning them from the first entries
+#             --prefetch: read the next baskets asynchronously while the
+#                         current ones are processed (TFile.AsyncPrefetching)
+#                         Use benchmark_trim.py to tune these on the cluster.
 # Example
 #     (pyroot) $ python perform_trim.py 2 1544 0 single
 #             will trim crystal 2, run 1544, subrun 0, single hit events.
 #             Note that you must activate virtual environment containing
 #             pyroot.
+#     (pyroot) $ python perform_trim.py all 1544 0 single
+#             will trim crystal 2, 3, 4, 6 and 7 of run 1544, subrun 0,
+#             reading the MRGD file only once.
+#     (pyroot) $ python perform_trim.py all 1544 0 single --engine rdf
+#             will do the same with RDataFrame, using every core of the node.
+#     $ python perform_trim.py all 1544 0 single --engine uproot
+#             will do the same with uproot, on a node without ROOT.
+#     (pyroot) $ python perform_trim.py all 1544 0 both
+#             will trim single and multiple hit events of every good crystal
+#             of run 1544, subrun 0, in a single pass over the MRGD file.
 # 
 #  This script trims the MRGD data file. Save single (or multiple) hit 
 # scintillation-like events without muon coincidence. Crystal number, run 
@@ -28,181 +87,671 @@
 #  Changes suited for Olaf server.
 #  BDT cut coefficients were modified and ES cut was applied.
 #    [ref] https://docdb.wlab.yale.edu/cosine/ShowDocument?docid=914
+#  Several crystals can be trimmed in a single pass over the MRGD file.
+#  RDataFrame based trimming engine was added.
+#  Subrun timing is stored once per file in the one-row 'meta' tree,
+#  instead of the per-entry iEvtSec, fEvtSec and subrunDuration branches.
+#  Cuts are read from the versioned configuration files in 'cuts/' by
+#  trim_cuts.py, and the cut version is recorded in each output file.
+#  Slim output mode writing a column whitelist was added.
+#  Trim manifest records the input and cuts of every output, and only the
+#  outputs whose input or cuts changed are trimmed again.
+#  uproot based trimming engine, not requiring ROOT, was added.
+#  Columnar export of the selected events into Parquet datasets was added.
+#  Compression of the trimmed files can be chosen.
+#  Per-subrun summary records are made while trimming.
+#  Subruns of the runs packed by consolidate_trim.py are skipped.
+#  Single and multiple hit events can be trimmed in one pass. The cuts not
+#  depending on the multiplicity select an entry list once, which is narrowed
+#  by the crystal cuts and then by the LS cuts of each output.
+#  Time and I/O of every phase of a task can be recorded.
+#  TTreeCache size, its branches and asynchronous prefetching of the MRGD
+#  reads can be set.
+#  MRGD directory can be given by an option, and the status of each task is
+#  recorded in its profile for schedule_trim.py.
 ###############################################################################
 
 # 0. Prepare
 # Import packages
 import sys
 import os
+import argparse
+import hashlib
 from array import array
-# ROOT package was imported after checking file existence
-# to  avoid the ROOT importing time consumption.
-
-# Get input from command line.
-xtal = int(sys.argv[1])  # First input
-run = int(sys.argv[2])  # Second input
-subrun = int(sys.argv[3])  # Third input
-multiplicity = sys.argv[4]  # Fourth input
-
-# Check bad input
-assert xtal in [2, 3, 4, 6, 7]  # Use good crystals only
-assert (run >= 1000) and (run <= 9999)
-assert (subrun >= 0) and (subrun <= 999)
-assert multiplicity in ['single', 'multi']
-
-# 1. Read MRGD data file
+import trim_cuts
+import trim_manifest
+import trim_columnar
+import trim_summary
+import trim_profile
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import dqc_io
+# ROOT package is imported in trim_subrun_root() after checking file
+# existence to  avoid the ROOT importing time consumption.
+
+# Crystals to be trimmed
+good_xtals = [2, 3, 4, 6, 7]
+
 # MRGD data path and file name format
 file_path_format = '/mnt/lustre/ibs/cupcosine/data/COSINE/MRGD/phys/V00-04-19/{run:d}/'
 file_name_format = 'mrgd_M{run:06d}.root.{subrun:03d}'
 
-# Read the data file into TChain
-file_path = file_path_format.format(run=run)
-file_name = file_name_format.format(run=run, subrun=subrun)
-if not os.path.isfile(file_path + file_name):  # If there is no such file wanted, exit.
-  print('NoMRGD ', sys.argv, file=sys.stderr)  # Print result
-  exit()
-
-# Set output directory and name
+# Output directory
 home_directory = './../../'  # SETTING: directory
-output_path = home_directory + 'data/'
-output_path += f'C{xtal}/' if multiplicity == 'single' else f'C{xtal}_multi/'
-output_name = f'trim_T{run:06d}_C{xtal}.root.{subrun:03d}'
 
-# If trimmed data larger than 10kB already exists, skip it.
-if os.path.isfile(output_path + output_name) and (os.path.getsize(output_path + output_name) > 10000):
-  print('AlreadyExist ', sys.argv, file=sys.stderr)  # Print result
-  exit()
+# Trim manifest directory, holding a manifest file per job (see trim_manifest.py)
+manifest_directory = home_directory + 'data/trim_manifest/'
 
-# Importing ROOT takes a few seconds, so import it after file existence check.
-import ROOT
+# Branches which must be in the MRGD file
+branch_list = ['BLSVeto', 'BMuon',
+               'crystal1', 'crystal2', 'crystal3', 'crystal4',
+               'crystal5', 'crystal6', 'crystal7', 'crystal8']
 
-# Define TChain and read the data file.
-c = ROOT.TChain('ntp')
-c.Add(file_path + file_name)
+# Compression algorithms of the trimmed files, with their ROOT codes
+compression_algorithms = {'zlib': 1, 'lzma': 2, 'lz4': 4, 'zstd': 5}
 
-# Check branch existence
-branch_list = ['BLSVeto', 'BMuon', 
-               'crystal1', 'crystal2', 'crystal3', 'crystal4', 
-               'crystal5', 'crystal6', 'crystal7', 'crystal8']
-for branch in branch_list:
-  if c.GetBranch(branch) == None:  # a branch is not in the MRGD file.
-    print('No' + branch + ' ', sys.argv, file=sys.stderr)
-    exit()
-
-# Get total number of events before trimming
-nOriginalEntries = c.GetEntries()
-
-# 2. Define cuts for trimming
-# LS cut
-CoincidenceCut = 'BLSVeto.isCoincident==1 &&'
-MuonCut = '(BMuon.totalDeltaT0/1e6>30) &&'
-
-# LS coincidence cut
-# apply LS charge correction to runs after 1720
-LSChargeCorrection = '' if run <= 1720 else '*((4.6165E-6)*(eventsec-1451606400.0)/3600.0+0.92166)'
-if multiplicity == 'single':
-  LSThresCut = '(BLSVeto.Charge' + LSChargeCorrection + '/143.8<=80 &&'
-elif multiplicity == 'multi':
-  LSThresCut_M = '!(BLSVeto.Charge' + LSChargeCorrection + '/143.8<=30 &&'
-
-# Crystal coincidence check and scintillation-like event cut
-# BDT cut variable was updated.
-if xtal==2:
-  SingleCut = '(crystal1.nc<4 && crystal3.nc<4 && crystal4.nc<4 && crystal5.nc<4 && crystal6.nc<4 && crystal7.nc<4 && crystal8.nc<3)) &&'
-  bdtCut = "((1.52e-06*TMath::Exp(-107.84*bdt[2]) - 1.94 - 29.288*bdt[2])<crystal2.energy)"
-  esVar = "((1 - (crystal2.nx2 - crystal2.nx1))/2)"
-  eshCut = "(" + esVar + " > 0.5163 )"
-  esdCut = "(" + esVar + " - 0.330*bdt[2] < 0.918 )"
-elif xtal==3:
-  SingleCut = '(crystal1.nc<4 && crystal2.nc<4 && crystal4.nc<4 && crystal5.nc<4 && crystal6.nc<4 && crystal7.nc<4 && crystal8.nc<3)) &&'
-  bdtCut = '((1.50e-07*TMath::Exp(-120.0*bdt[3]) + 0.0 - 20.0*bdt[3])<crystal3.energy)'
-  esVar = "((1 - (crystal3.nx2 - crystal3.nx1))/2)"
-  eshCut = "(" + esVar + " > 0.5079 )"
-  esdCut = "(" + esVar + " - 0.552*bdt[3] < 0.902 )"
-elif xtal==4:
-  SingleCut = '(crystal2.nc<4 && crystal3.nc<4 && crystal1.nc<4 && crystal5.nc<4 && crystal6.nc<4 && crystal7.nc<4 && crystal8.nc<4)) &&'
-  bdtCut = '((1.50e-09*TMath::Exp(-110.0*bdt[4]) + 0.3 - 10.0*bdt[4])<crystal4.energy)'
-  esVar = "((1 - (crystal4.nx2 - crystal4.nx1))/2)"
-  eshCut = "(" + esVar + " > 0.5245 )"
-  esdCut = "(" + esVar + " - 0.358*bdt[4] < 0.944 )"
-elif xtal==6:
-  SingleCut = '(crystal1.nc<4 && crystal2.nc<4 && crystal3.nc<4 && crystal4.nc<4 && crystal5.nc<4 && crystal7.nc<4 && crystal8.nc<3)) &&'
-  bdtCut = '((6.01e-08*TMath::Exp(-120.177*bdt[6]) + 0.8 - 21.615*bdt[6]) <crystal6.energy)'
-  esVar = "((1 - (crystal6.nx2 - crystal6.nx1))/2)"
-  eshCut = "(" + esVar + " > 0.4877 )"
-  esdCut = "(" + esVar + " - 0.687*bdt[6] < 0.906 )"
-elif xtal==7:
-  SingleCut = '(crystal1.nc<4 && crystal2.nc<4 && crystal3.nc<4 && crystal4.nc<4 && crystal5.nc<4 && crystal6.nc<4 && crystal8.nc<3)) &&'
-  bdtCut = '((6.01e-08*TMath::Exp(-120.177*bdt[7]) - 0.24 - 31.615*bdt[7])<crystal7.energy)'
-  esVar = "((1 - (crystal7.nx2 - crystal7.nx1))/2)"
-  eshCut = "(" + esVar + " > 0.4875 )"
-  esdCut = "(" + esVar + " - 0.451*bdt[7] < 0.909 )"
-scintCut = bdtCut + "&&" + eshCut + "&&" + esdCut
-
-# Waveform precuts
-nchargeCut = f'(crystal{xtal}.rqcn>-1) &&'
-ncCut = f'(pmt{xtal}1.nc>0 && pmt{xtal}2.nc>0) &&'
-t1Cut = f'(pmt{xtal}1.t1>0 && pmt{xtal}2.t1>0) &&'
-
-# Merge every cuts
-if multiplicity == 'single':
-  allCuts = CoincidenceCut + MuonCut + LSThresCut   + SingleCut + nchargeCut + ncCut + t1Cut + scintCut
-elif multiplicity == 'multi':
-  allCuts = CoincidenceCut + MuonCut + LSThresCut_M + SingleCut + nchargeCut + ncCut + t1Cut + scintCut
-
-# 3. Create trimmed output file
-# Create output directory and file
-# if you encounter permission problem, change the output directory or its permission using chmod.
-os.makedirs(output_path, exist_ok=True)
-newfile = ROOT.TFile(output_path + output_name, 'RECREATE')
-
-# 4. Write tree into output file
-newtree = c.CopyTree(allCuts)
-nEntries = newtree.GetEntries()
-
-newfile.Write()
-
-# 5. Include run duration info in file
-# Define variables for tree I/O
-eventsec = array('q', [0])  # 'q' means signed-long-long-int data type
-iEvtSec = array('q', [0])
-fEvtSec = array('q', [0])
-subrunDuration = array('H', [0])  # 'H' means unsigned-short data type
-
-# Set input branch
-c.SetBranchAddress('eventsec', eventsec)
-
-# Set output branch
-branch_iEvtSec = newtree.Branch('iEvtSec', iEvtSec, 'iEvtSec/L')
-branch_fEvtSec = newtree.Branch('fEvtSec', fEvtSec, 'fEvtSec/L')
-branch_subrunDuration = newtree.Branch('subrunDuration', subrunDuration, 'subrunDuration/s')
-
-# Get the start time of the subrun
-c.GetEntry(0)
-iEvtSec[0] = eventsec[0]
-
-# Get the end time of the subrun
-c.GetEntry(nOriginalEntries-1)
-fEvtSec[0] = eventsec[0]
-
-# Calculate the subrun duration time
-subrunDuration[0] = fEvtSec[0] - iEvtSec[0]
-
-# 6. Write time and close file, print out
-# Store the time value into the output tree
-for i in range(nOriginalEntries):
-  branch_iEvtSec.Fill()
-  branch_fEvtSec.Fill()
-  branch_subrunDuration.Fill()
-
-# Write it
-newtree.Write()
-newfile.Close()
-
-# Print the output
-output_format = '{filename},{xtal},{run},{subrun},{multiplicity},{nOriginalEntries},{nEntries}'
-print(output_format.format(filename=sys.argv[0], 
-                           xtal=xtal, run=run, subrun=subrun, multiplicity=multiplicity,
-                           nOriginalEntries=nOriginalEntries, nEntries=nEntries))
-
-# END OF CODE
\ No newline at end of file
+# Default column whitelist of the slim output
+# '{xtal}' is replaced by the crystal number, and '{cuts}' by the cut leaves.
+slim_columns = 'eventsec,crystal{xtal}.energy,{cuts}'
+
+
+# Directory and name of the MRGD file of a subrun. The MRGD directory of
+# the options, holding a directory per run, is used instead of
+# file_path_format if it is given.
+def get_mrgd_file(run, subrun, options):
+  if options.mrgd_dir is None:
+    file_path = file_path_format.format(run=run)
+  else:
+    file_path = os.path.join(options.mrgd_dir, f'{run:d}') + '/'
+  return file_path, file_name_format.format(run=run, subrun=subrun)
+
+
+# Output directory and name of a trimmed file
+def get_output_file(xtal, run, subrun, multiplicity):
+  output_path = home_directory + 'data/'
+  output_path += f'C{xtal}/' if multiplicity == 'single' else f'C{xtal}_multi/'
+  output_name = f'trim_T{run:06d}_C{xtal}.root.{subrun:03d}'
+  return output_path, output_name
+
+
+# Output directory and name of a run file, packing every trimmed file of the
+# run (see consolidate_trim.py)
+def get_run_file(xtal, run, multiplicity):
+  output_path = get_output_file(xtal, run, 0, multiplicity)[0]
+  return output_path, f'trim_T{run:06d}_C{xtal}.root'
+
+
+# Trim one subrun for every crystal in xtals, with the multiplicity
+# ('single', 'multi' or 'both').
+def trim_subrun(xtals, run, subrun, multiplicity, options):
+  multiplicities = ['single', 'multi'] if multiplicity == 'both' else [multiplicity]
+  trim_tasks([(xtal, each) for xtal in xtals for each in multiplicities], run, subrun, options)
+
+
+# Trim one subrun for every task, (xtal, multiplicity) in tasks.
+# The MRGD file is opened only once. If there are several outputs to trim,
+# the entries of every output are selected in ROOT from shared entry lists.
+def trim_tasks(tasks, run, subrun, options):
+  # Command line of this task, printed with the result
+  xtals = []
+  multiplicities = []
+  for xtal, multiplicity in tasks:
+    xtals += [xtal] if xtal not in xtals else []
+    multiplicities += [multiplicity] if multiplicity not in multiplicities else []
+  argv = [sys.argv[0], ','.join(str(xtal) for xtal in xtals), str(run), str(subrun), ','.join(multiplicities)]
+
+  # Record the time and I/O of every phase of the task, if asked.
+  # A task raising an exception is recorded as 'Failed'.
+  profile = trim_profile.new_profile(argv, run, subrun, options.engine) if options.profile else None
+  status = 'Failed'
+  try:
+    status = run_tasks(tasks, run, subrun, argv, options, profile)
+  finally:
+    if profile is not None:
+      trim_profile.write_profile(options.profile, profile, status)
+
+
+# Trim one subrun for every task, and return the status of the task:
+# 'NoMRGD', 'AlreadyExist', 'NoBranch' or 'Trimmed'.
+# The phases of the task are measured into profile, unless it is None.
+def run_tasks(tasks, run, subrun, argv, options, profile):
+  # 1. Read MRGD data file
+  file_path, file_name = get_mrgd_file(run, subrun, options)
+  if not os.path.isfile(file_path + file_name):  # If there is no such file wanted, exit.
+    print('NoMRGD ', argv, file=sys.stderr)  # Print result
+    return 'NoMRGD'
+
+  # Fingerprint of the input and the cuts, recorded in the trim manifest
+  if not options.no_manifest:
+    manifest = trim_manifest.open_manifest(options.manifest)
+    fingerprint = trim_manifest.input_fingerprint(file_path + file_name, options.checksum)
+    config_hash = get_config_hash(options)
+
+  # Set output directory and name
+  outputs = []
+  for xtal, multiplicity in tasks:
+    output_path, output_name = get_output_file(xtal, run, subrun, multiplicity)
+
+    # If the run is already packed into a run file, skip it.
+    # Remove the run file to trim the run again.
+    if os.path.isfile(''.join(get_run_file(xtal, run, multiplicity))):
+      print('AlreadyConsolidated ', [sys.argv[0], str(xtal), str(run), str(subrun), multiplicity], file=sys.stderr)  # Print result
+      continue
+
+    if options.no_manifest:
+      # If complete trimmed data already exists, skip it.
+      up_to_date = is_complete_output(output_path + output_name, options)
+    else:
+      # If the manifest has the output made from the same input and cuts, skip it.
+      up_to_date = trim_manifest.is_up_to_date(manifest, xtal, run, subrun, multiplicity,
+                                               fingerprint, config_hash, output_path + output_name)
+    # The columnar export and the summary record are also made if they are missing.
+    if up_to_date and options.columnar:
+      dataset_path = trim_columnar.get_dataset_path(options.columnar_path, xtal, multiplicity)
+      up_to_date = all(os.path.isfile(filename) for filename in trim_columnar.get_subrun_files(dataset_path, run, subrun))
+    if up_to_date and options.summary:
+      up_to_date = os.path.isfile(''.join(trim_summary.get_summary_file(home_directory, xtal, run, subrun, multiplicity)))
+    if up_to_date:
+      print('AlreadyExist ', [sys.argv[0], str(xtal), str(run), str(subrun), multiplicity], file=sys.stderr)  # Print result
+      continue
+    outputs.append((xtal, multiplicity, output_path, output_name))
+
+  if len(outputs) == 0:  # Every output already exists.
+    return 'AlreadyExist'
+
+  # 2. ~ 5. Trim the MRGD data file into every output
+  if options.engine == 'uproot':
+    # The uproot engine does not need ROOT, so it is imported only here.
+    with trim_profile.phase(profile, 'import'):
+      import trim_uproot
+    trimmed = trim_uproot.trim_subrun(file_path + file_name,
+                                      [output + (get_slim_columns(output[0], run, output[1], options),) for output in outputs],
+                                      run, options.cut_version, branch_list, argv,
+                                      options.compression, options.summary, profile)
+  else:
+    trimmed = trim_subrun_root(file_path + file_name, outputs, run, options, argv, profile)
+  if trimmed is None:  # a branch is not in the MRGD file.
+    # Record the outputs as skipped, so that consolidate_trim.py does not
+    # wait for them.
+    if not options.no_manifest:
+      for xtal, multiplicity, output_path, output_name in outputs:
+        trim_manifest.record_skipped(manifest, xtal, run, subrun, multiplicity, fingerprint, config_hash, 'NoBranch')
+    return 'NoBranch'
+  subrun_meta, results = trimmed
+  nOriginalEntries = subrun_meta[2]
+
+  # Export the selected events into the columnar datasets
+  if options.columnar:
+    with trim_profile.phase(profile, 'columnar'):
+      for xtal, multiplicity, output_path, output_name in outputs:
+        if options.engine == 'uproot':
+          arrays = trim_columnar.read_columns_uproot(output_path + output_name, xtal)
+        else:
+          import ROOT
+          arrays = trim_columnar.read_columns_root(ROOT, output_path + output_name, xtal)
+        trim_columnar.write_subrun(trim_columnar.get_dataset_path(options.columnar_path, xtal, multiplicity),
+                                   run, subrun, arrays, subrun_meta, options.cut_version)
+
+  # Write the summary records from the energies of the selected events
+  if options.summary:
+    with trim_profile.phase(profile, 'summary'):
+      for xtal, multiplicity, nEntries, energies in results:
+        summary_path, summary_name = trim_summary.get_summary_file(home_directory, xtal, run, subrun, multiplicity)
+        record = trim_summary.summarize(xtal, run, subrun, multiplicity, options.cut_version, subrun_meta, energies)
+        trim_summary.write_summary(summary_path, summary_name, record)
+
+  # Record the outputs in the trim manifest
+  if not options.no_manifest:
+    with trim_profile.phase(profile, 'manifest'):
+      for (xtal, multiplicity, output_path, output_name), (xtal, multiplicity, nEntries, energies) in zip(outputs, results):
+        trim_manifest.record(manifest, xtal, run, subrun, multiplicity, fingerprint, config_hash,
+                             output_path + output_name, nOriginalEntries, nEntries)
+
+  # Print the output
+  output_format = '{filename},{xtal},{run},{subrun},{multiplicity},{nOriginalEntries},{nEntries}'
+  for xtal, multiplicity, nEntries, energies in results:
+    print(output_format.format(filename=sys.argv[0],
+                               xtal=xtal, run=run, subrun=subrun, multiplicity=multiplicity,
+                               nOriginalEntries=nOriginalEntries, nEntries=nEntries))
+  return 'Trimmed'
+
+
+# Trim one subrun with ROOT, and return ((iEvtSec, fEvtSec, nOriginalEntries),
+# list of (xtal, multiplicity, number of entries after trimming, energies of
+# the selected events)), or None if a branch is missing. The energies are None
+# unless the summary record is made.
+#  outputs: list of (xtal, multiplicity, output_path, output_name)
+#  profile: record of the phases of the task (see trim_profile.py), or None
+def trim_subrun_root(input_file, outputs, run, options, argv, profile=None):
+  # Importing ROOT takes a few seconds, so import it after file existence check.
+  with trim_profile.phase(profile, 'import'):
+    import ROOT
+
+  # Asynchronous prefetching must be set before the file is opened.
+  if options.prefetch:
+    ROOT.gEnv.SetValue('TFile.AsyncPrefetching', 1)
+
+  # Define TChain and read the data file.
+  with trim_profile.phase(profile, 'open'):
+    c = ROOT.TChain('ntp')
+    c.Add(input_file)
+    # Get total number of events before trimming
+    nOriginalEntries = c.GetEntries()
+
+  # Check branch existence
+  with trim_profile.phase(profile, 'branches'):
+    for branch in branch_list:
+      if c.GetBranch(branch) == None:  # a branch is not in the MRGD file.
+        print('No' + branch + ' ', argv, file=sys.stderr)
+        return None
+
+  # Set the TTreeCache before reading any event
+  if options.engine == 'tree':
+    set_tree_cache(c, outputs, run, options)
+
+  # Get the start and end time of the subrun
+  with trim_profile.phase(profile, 'subrun_time'):
+    subrun_meta = read_subrun_time(c, nOriginalEntries) + (nOriginalEntries,)
+
+  # 2. Define cuts for trimming
+  # Cuts are built from the cut configuration file, and cached in trim_cuts
+  # so that they are built only once per process.
+
+  # 3. Create trimmed output file and 4. write tree into output file
+  # The slim output of the tree engine needs its own branch status per
+  # output, so it is always copied from the entry lists of fill_subrun().
+  if options.engine == 'rdf':
+    results = snapshot_subrun(ROOT, c, subrun_meta, outputs, run, options, profile)
+  elif len(outputs) == 1 and not options.slim:
+    results = copy_subrun(ROOT, c, subrun_meta, outputs, run, options, profile)
+  else:
+    results = fill_subrun(ROOT, c, subrun_meta, outputs, run, options, profile)
+
+  return subrun_meta, results
+
+
+# Return True if the outputs are slim. The uproot engine always writes the
+# slim output.
+def is_slim(options):
+  return options.slim or options.engine == 'uproot'
+
+
+# Return True if the trimmed output exists and is complete: its 'meta' tree
+# has as many entries as 'ntp' (see dqc_io.read_valid_subrun_meta()). The
+# size is not checked, since the output of a short or quiet subrun can be
+# very small. It is read with uproot for the uproot engine, and with ROOT
+# otherwise.
+def is_complete_output(output_file, options):
+  if not os.path.isfile(output_file):
+    return False
+  if options.engine == 'uproot':
+    import trim_uproot
+    return trim_uproot.is_complete_output(output_file)
+
+  import ROOT
+  data_file = ROOT.TFile(output_file)
+  meta = dqc_io.read_valid_subrun_meta(data_file)
+  data_file.Close()
+  return meta is not None
+
+
+# Hash of everything that changes the content of the outputs: the cut
+# configuration, the column whitelist of the slim output, and the
+# compression.
+def get_config_hash(options):
+  config = [options.cut_version, trim_cuts.cut_config_hash(options.cut_version)]
+  if is_slim(options):
+    config.append(options.columns)
+  if options.compression is not None:
+    config.append('{0}:{1}'.format(*options.compression))
+  return hashlib.sha1(' '.join(config).encode()).hexdigest()
+
+
+# Write one trimmed file with TChain.CopyTree, and return the list of
+# (xtal, multiplicity, number of entries after trimming, energies).
+def copy_subrun(ROOT, c, subrun_meta, outputs, run, options, profile=None):
+  xtal, multiplicity, output_path, output_name = outputs[0]
+  allCuts = trim_cuts.get_cuts(xtal, run, multiplicity, options.cut_version)
+
+  # 3. Create trimmed output file
+  # Create output directory and file
+  # if you encounter permission problem, change the output directory or its permission using chmod.
+  os.makedirs(output_path, exist_ok=True)
+  newfile = open_output_file(ROOT, output_path + output_name, options.compression)
+
+  # 4. Write tree into output file
+  with trim_profile.phase(profile, 'cut'):
+    newtree = c.CopyTree(allCuts)
+  nEntries = newtree.GetEntries()
+  energies = None
+  if options.summary:
+    with trim_profile.phase(profile, 'summary'):
+      energies = read_energies(newtree, xtal)
+
+  with trim_profile.phase(profile, 'write'):
+    newtree.Write()
+
+    # 5. Include run duration info in file and close it
+    write_subrun_meta(ROOT, newfile, subrun_meta, options.cut_version, nEntries)
+    newfile.Close()
+
+  return [(xtal, multiplicity, nEntries, energies)]
+
+
+# Write several trimmed files from a single read of the MRGD file, and return
+# the list of (xtal, multiplicity, number of entries after trimming,
+# energies).
+# The cuts are evaluated in C++ by TTree::Draw into entry lists, narrowing
+# the events step by step: the crystal independent cuts once, the cuts of
+# each crystal not depending on the multiplicity once per crystal, and the LS
+# terms routing the events to the single and multiple hit outputs once per
+# output. Each output is then written by CopyTree of its entry list.
+def fill_subrun(ROOT, c, subrun_meta, outputs, run, options, profile=None):
+  cut_version = options.cut_version
+
+  # Select events passing the crystal independent cuts only once.
+  c.LoadTree(0)
+  tree = c.GetTree()
+  ROOT.gROOT.cd()
+  with trim_profile.phase(profile, 'cut'):
+    tree.Draw('>>shared_list', trim_cuts.get_shared_cut(cut_version), 'entrylist')
+    shared_list = ROOT.gROOT.Get('shared_list')
+
+    # Select events of each crystal, and of each output, among them.
+    entry_lists = []
+    crystal_lists = {}
+    for xtal, multiplicity, output_path, output_name in outputs:
+      if xtal not in crystal_lists:
+        tree.SetEntryList(shared_list)
+        tree.Draw(f'>>C{xtal}_list', trim_cuts.get_cuts(xtal, run, 'crystal', cut_version), 'entrylist')
+        crystal_lists[xtal] = ROOT.gROOT.Get(f'C{xtal}_list')
+      tree.SetEntryList(crystal_lists[xtal])
+      tree.Draw(f'>>C{xtal}_{multiplicity}_list', trim_cuts.get_cuts(xtal, run, 'ls_' + multiplicity, cut_version),
+                'entrylist')
+      entry_lists.append(ROOT.gROOT.Get(f'C{xtal}_{multiplicity}_list'))
+
+  # 3. Create trimmed output files and 4. write the events of each entry list
+  # if you encounter permission problem, change the output directory or its permission using chmod.
+  results = []
+  for (xtal, multiplicity, output_path, output_name), entry_list in zip(outputs, entry_lists):
+    os.makedirs(output_path, exist_ok=True)
+    newfile = open_output_file(ROOT, output_path + output_name, options.compression)
+    # The slim output copies only the whitelisted branches.
+    if options.slim:
+      set_branch_status(tree, get_slim_columns(xtal, run, multiplicity, options))
+    tree.SetEntryList(entry_list)
+    with trim_profile.phase(profile, 'fill'):
+      newtree = tree.CopyTree('')
+    nEntries = newtree.GetEntries()
+    energies = None
+    if options.summary:
+      with trim_profile.phase(profile, 'summary'):
+        energies = read_energies(newtree, xtal)
+    results.append((xtal, multiplicity, nEntries, energies))
+
+    # 5. Include run duration info, write and close files
+    with trim_profile.phase(profile, 'write'):
+      newtree.Write()
+      write_subrun_meta(ROOT, newfile, subrun_meta, cut_version, nEntries)
+      newfile.Close()
+    ROOT.gROOT.cd()
+  tree.SetEntryList(ROOT.nullptr)
+  if options.slim:
+    tree.SetBranchStatus('*', 1)
+
+  return results
+
+
+# Write trimmed files with RDataFrame, and return the list of
+# (xtal, multiplicity, number of entries after trimming, energies).
+# Cuts of every crystal are JIT-compiled into C++ functions once per process,
+# and every output is written in a single, implicitly multithreaded event loop.
+# The filters are chained so that the shared cuts and the cuts of each crystal
+# not depending on the multiplicity are evaluated once per event.
+# Note that the order of events in the outputs may differ from the MRGD file
+# when more than one thread is used.
+def snapshot_subrun(ROOT, c, subrun_meta, outputs, run, options, profile=None):
+  cut_version = options.cut_version
+
+  # Enable implicit multithreading once per process. 0 means every core.
+  if options.threads != 1 and not ROOT.IsImplicitMTEnabled():
+    ROOT.EnableImplicitMT(options.threads)
+
+  df = ROOT.RDataFrame(c).Filter(trim_cuts.get_rdf_cuts(None, run, 'shared', cut_version), 'shared')
+
+  # 3. Create trimmed output files
+  # Book every output lazily, so that they share a single event loop.
+  # if you encounter permission problem, change the output directory or its permission using chmod.
+  snapshot_options = ROOT.RDF.RSnapshotOptions()
+  snapshot_options.fLazy = True
+  if options.compression is not None:
+    algorithm, level = options.compression
+    snapshot_options.fCompressionAlgorithm = getattr(ROOT.ROOT.RCompressionSetting.EAlgorithm, 'k' + algorithm.upper())
+    snapshot_options.fCompressionLevel = level
+  counts = []
+  takes = []
+  snapshots = []
+  crystals = {}
+  for xtal, multiplicity, output_path, output_name in outputs:
+    os.makedirs(output_path, exist_ok=True)
+    if xtal not in crystals:
+      crystals[xtal] = df.Filter(trim_cuts.get_rdf_cuts(xtal, run, 'crystal', cut_version), f'C{xtal}')
+    selected = crystals[xtal].Filter(trim_cuts.get_rdf_cuts(xtal, run, 'ls_' + multiplicity, cut_version),
+                                     f'C{xtal}_{multiplicity}')
+    counts.append((xtal, multiplicity, selected.Count()))
+    # Energies of the selected events for the summary record, in the same event loop
+    if options.summary:
+      takes.append(selected.Define('summary_energy', f'double(crystal{xtal}.energy)').Take['double']('summary_energy'))
+    else:
+      takes.append(None)
+    # RDataFrame reads only the columns it needs, and the slim output writes
+    # only the whitelisted columns.
+    columns = get_slim_columns(xtal, run, multiplicity, options) if options.slim else ''
+    snapshots.append(selected.Snapshot('ntp', output_path + output_name, columns, snapshot_options))
+
+  # 4. Run the event loop and write every tree into output files
+  # The cuts are JIT-compiled, and the outputs written, in this event loop.
+  with trim_profile.phase(profile, 'fill'):
+    results = [(xtal, multiplicity, count.GetValue(), None if take is None else list(take.GetValue()))
+               for (xtal, multiplicity, count), take in zip(counts, takes)]
+
+  # 5. Include run duration info in files
+  with trim_profile.phase(profile, 'write'):
+    for (xtal, multiplicity, output_path, output_name), (xtal, multiplicity, nEntries, energies) in zip(outputs, results):
+      newfile = ROOT.TFile(output_path + output_name, 'UPDATE')
+      write_subrun_meta(ROOT, newfile, subrun_meta, cut_version, nEntries)
+      newfile.Close()
+
+  return results
+
+
+# Create an output file with the compression (algorithm, level), or with
+# the ROOT default compression if it is None.
+def open_output_file(ROOT, output_file, compression):
+  if compression is None:
+    return ROOT.TFile(output_file, 'RECREATE')
+  algorithm, level = compression
+  return ROOT.TFile(output_file, 'RECREATE', '', compression_algorithms[algorithm]*100 + level)
+
+
+# Parse the compression option 'algorithm:level' into (algorithm, level).
+# The level is 1 if omitted.
+def parse_compression(value):
+  algorithm, _, level = value.lower().partition(':')
+  if algorithm not in compression_algorithms:
+    raise argparse.ArgumentTypeError('unknown compression algorithm ' + algorithm)
+  level = int(level) if level else 1
+  if not 1 <= level <= 9:
+    raise argparse.ArgumentTypeError('compression level must be 1 ~ 9')
+  return algorithm, level
+
+
+# Column whitelist of the slim output of the crystal
+def get_slim_columns(xtal, run, multiplicity, options):
+  columns = []
+  for column in options.columns.split(','):
+    if column == '{cuts}':
+      new_columns = trim_cuts.get_cut_leaves(xtal, run, multiplicity, options.cut_version)
+    else:
+      new_columns = [column.format(xtal=xtal)]
+    columns += [new_column for new_column in new_columns if new_column not in columns]
+  return columns
+
+
+# Activate only the branches of the columns. A column can be a branch, or a
+# leaf of a leaflist branch written as 'branch.leaf'.
+def set_branch_status(tree, columns):
+  tree.SetBranchStatus('*', 0)
+  for column in columns:
+    if tree.GetBranch(column):
+      tree.SetBranchStatus(column, 1)  # parents of a split branch are activated too
+    else:
+      tree.SetBranchStatus(column.split('.')[0], 1)
+
+
+# Set the TTreeCache of the MRGD tree with the cache options.
+# The baskets of the cached branches in the cache window are read in a few
+# large reads, instead of one small read per basket. With --cache-branches,
+# the branches read by the trimming are registered at once: every branch if
+# the outputs are not slim, since they are copied, or the cut leaves and the
+# whitelisted columns of the slim outputs.
+def set_tree_cache(c, outputs, run, options):
+  # The chain has a single file, so the cache is set on its tree, which both
+  # CopyTree of the chain and the entry lists of fill_subrun() read.
+  c.LoadTree(0)
+  tree = c.GetTree()
+  if options.cache_size is not None:
+    tree.SetCacheSize(int(options.cache_size * 1024 * 1024))
+  if options.cache_size == 0 or not options.cache_branches:
+    return
+
+  if not options.slim:
+    tree.AddBranchToCache('*', True)
+  else:
+    columns = ['eventsec']
+    for xtal, multiplicity, output_path, output_name in outputs:
+      columns += get_slim_columns(xtal, run, multiplicity, options)
+      columns += trim_cuts.get_cut_leaves(xtal, run, multiplicity, options.cut_version)
+    for column in sorted(set(columns)):
+      # A leaf of a leaflist branch is cached with its branch.
+      tree.AddBranchToCache(column if tree.GetBranch(column) else column.split('.')[0], True)
+  tree.StopCacheLearningPhase()
+
+
+# Read the energies of every event of a trimmed tree, still in memory
+def read_energies(newtree, xtal):
+  newtree.SetEstimate(newtree.GetEntries() + 1)  # keep every value of Draw
+  n = newtree.Draw(f'crystal{xtal}.energy', '', 'goff')
+  v1 = newtree.GetV1()
+  return [v1[i] for i in range(n)]
+
+
+# Read the start and end time of the subrun from its first and last event
+def read_subrun_time(c, nOriginalEntries):
+  eventsec = array('q', [0])  # 'q' means signed-long-long-int data type
+  c.SetBranchAddress('eventsec', eventsec)
+  c.GetEntry(0)
+  iEvtSec = eventsec[0]
+  c.GetEntry(nOriginalEntries-1)
+  fEvtSec = eventsec[0]
+  c.ResetBranchAddress(c.GetBranch('eventsec'))
+  return iEvtSec, fEvtSec
+
+
+# Store the run duration info once per file, as a one-row 'meta' tree.
+# subrun_meta is (iEvtSec, fEvtSec, nOriginalEntries).
+# The cut version and the hash of its configuration file are stored as
+# TNamed 'cutVersion' and 'cutHash'.
+def write_subrun_meta(ROOT, newfile, subrun_meta, cut_version, nEntries):
+  # Define variables for tree I/O
+  iEvtSec = array('q', [subrun_meta[0]])  # 'q' means signed-long-long-int data type
+  fEvtSec = array('q', [subrun_meta[1]])
+  subrunDuration = array('H', [subrun_meta[1] - subrun_meta[0]])  # 'H' means unsigned-short data type
+  nOriginalEntries = array('q', [subrun_meta[2]])
+  nTrimmedEntries = array('q', [nEntries])
+
+  newfile.cd()
+  meta = ROOT.TTree('meta', 'subrun metadata')
+  ROOT.SetOwnership(meta, False)  # the tree is deleted when newfile is closed
+  meta.Branch('iEvtSec', iEvtSec, 'iEvtSec/L')
+  meta.Branch('fEvtSec', fEvtSec, 'fEvtSec/L')
+  meta.Branch('subrunDuration', subrunDuration, 'subrunDuration/s')
+  meta.Branch('nOriginalEntries', nOriginalEntries, 'nOriginalEntries/L')
+  meta.Branch('nEntries', nTrimmedEntries, 'nEntries/L')
+  meta.Fill()
+  meta.Write()
+  ROOT.TNamed('cutVersion', cut_version).Write()
+  ROOT.TNamed('cutHash', trim_cuts.cut_config_hash(cut_version)).Write()
+
+
+# Options of the trimming, shared by every entry point
+def add_trim_options(parser):
+  parser.add_argument('--mrgd-dir', default=None,
+                      help='MRGD directory holding a directory per run, instead of the default one')
+  parser.add_argument('--engine', choices=['tree', 'rdf', 'uproot'], default='tree',
+                      help="'tree' trims with TChain.CopyTree, 'rdf' trims with RDataFrame, "
+                           "'uproot' trims with uproot and NumPy without ROOT (always slim)")
+  parser.add_argument('--threads', type=int, default=0,
+                      help='number of threads of the rdf engine, 0 uses every core')
+  parser.add_argument('--cut-version', default=trim_cuts.default_cut_version,
+                      help="version of the cut configuration file in 'cuts/'")
+  parser.add_argument('--slim', action='store_true',
+                      help='write only the whitelisted columns')
+  parser.add_argument('--columns', default=slim_columns,
+                      help="column whitelist of the slim output. '{xtal}' is replaced by "
+                           "the crystal number, and '{cuts}' by the cut leaves")
+  parser.add_argument('--manifest', default=manifest_directory,
+                      help='trim manifest directory, holding a manifest file per job')
+  parser.add_argument('--no-manifest', action='store_true',
+                      help="skip complete outputs, checked by their 'meta' tree, instead of using the trim manifest")
+  parser.add_argument('--checksum', action='store_true',
+                      help='also compare SHA-1 checksum of the MRGD file')
+  parser.add_argument('--columnar', action='store_true',
+                      help='also write the selected events into the per-crystal Parquet dataset')
+  parser.add_argument('--columnar-path', default=home_directory + 'data/columnar/',
+                      help='directory of the Parquet datasets')
+  parser.add_argument('--compression', type=parse_compression, default=None,
+                      help="compression of the trimmed files as 'algorithm:level' (zlib, lzma, lz4 "
+                           "or zstd), ROOT default if not given")
+  parser.add_argument('--summary', action='store_true',
+                      help='also write the per-subrun summary record')
+  parser.add_argument('--profile', default=None,
+                      help='append the time and I/O of every phase of each task to this file, as JSON lines')
+  parser.add_argument('--cache-size', type=float, default=None,
+                      help='TTreeCache size of the MRGD file in MB, 0 to disable it, ROOT default if not given')
+  parser.add_argument('--cache-branches', action='store_true',
+                      help='register the branches read by the trimming in the TTreeCache at once')
+  parser.add_argument('--prefetch', action='store_true',
+                      help='prefetch the MRGD baskets asynchronously')
+
+
+def main():
+  # Get input from command line.
+  parser = argparse.ArgumentParser(description='Trim the MRGD data file.')
+  parser.add_argument('xtal', help="2, 3, 4, 6 or 7, a comma separated list of them, or 'all'")
+  parser.add_argument('run', type=int)
+  parser.add_argument('subrun', type=int)
+  parser.add_argument('multiplicity')
+  add_trim_options(parser)
+  options = parser.parse_args()
+
+  xtal_arg = options.xtal  # First input
+  run = options.run  # Second input
+  subrun = options.subrun  # Third input
+  multiplicity = options.multiplicity  # Fourth input
+  xtals = good_xtals if xtal_arg == 'all' else [int(xtal) for xtal in xtal_arg.split(',')]
+
+  # Check bad input
+  for xtal in xtals:
+    assert xtal in good_xtals  # Use good crystals only
+  assert (run >= 1000) and (run <= 9999)
+  assert (subrun >= 0) and (subrun <= 999)
+  assert multiplicity in ['single', 'multi', 'both']
+
+  trim_subrun(xtals, run, subrun, multiplicity, options)
+
+
+# Execute the main code
+if __name__ == '__main__':
+  main()
+
+# END OF CODE
@@ -0,0 +1,98 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+#  Change output directories to your own directories.
+# Find '# SETTING: directory' comments in perform_trim.py and modify
+# directories.
+#
+# Usage
+#     (pyroot) $ python perform_trim_batch.py 'task_file' [options]
+#             task_file: text file listing one task per line, in the form
+#                        'xtal run subrun multiplicity' (spaces or commas).
+#                        multiplicity can be 'both' for single and multi.
+#                        Lines starting with '#' are ignored.
+#                        '-' reads the task list from standard input.
+#             options: same as perform_trim.py (--engine, --threads, ...)
+# Example
+#     (pyroot) $ printf '2 1544 0 single\n3 1544 0 single\n' > tasks.txt
+#     (pyroot) $ python perform_trim_batch.py tasks.txt
+#             will trim crystal 2 and 3 of run 1544, subrun 0, single hit
+#             events, in one python process.
+#
+#  This script trims many subruns in one long-lived python process, so that
+# the ROOT importing time is paid only once instead of once per task.
+# Tasks of the same subrun, single and multiple hit alike, are trimmed
+# together, reading the MRGD file only once. Each task prints the same result line as
+# perform_trim.py.
+###############################################################################
+
+# 0. Prepare
+# Import packages
+import sys
+import argparse
+import traceback
+import perform_trim
+
+
+# Read task list. Return the list of (xtal, run, subrun, multiplicity).
+def read_tasks(task_file):
+  infile = sys.stdin if task_file == '-' else open(task_file)
+  tasks = []
+  for line in infile:
+    line = line.strip()
+    if line == '' or line.startswith('#'):  # skip empty line and comment
+      continue
+    xtal, run, subrun, multiplicity = line.replace(',', ' ').split()
+    for each in (['single', 'multi'] if multiplicity == 'both' else [multiplicity]):
+      tasks.append((int(xtal), int(run), int(subrun), each))
+  if infile is not sys.stdin:
+    infile.close()
+  return tasks
+
+
+# Group tasks of the same subrun so that the MRGD file is read only once.
+# Return a dict (run, subrun) -> list of (xtal, multiplicity).
+# The order of the first appearance is kept.
+def group_tasks(tasks):
+  groups = {}
+  for xtal, run, subrun, multiplicity in tasks:
+    subrun_tasks = groups.setdefault((run, subrun), [])
+    if (xtal, multiplicity) not in subrun_tasks:
+      subrun_tasks.append((xtal, multiplicity))
+  return groups
+
+
+def main():
+  # 1. Read tasks
+  parser = argparse.ArgumentParser(description='Trim many MRGD data files in one process.')
+  parser.add_argument('task_file', help="task list file, or '-' for standard input")
+  perform_trim.add_trim_options(parser)
+  options = parser.parse_args()
+
+  tasks = read_tasks(options.task_file)
+
+  # Check bad input
+  for xtal, run, subrun, multiplicity in tasks:
+    assert xtal in perform_trim.good_xtals  # Use good crystals only
+    assert (run >= 1000) and (run <= 9999)
+    assert (subrun >= 0) and (subrun <= 999)
+    assert multiplicity in ['single', 'multi']
+
+  # 2. Trim every subrun
+  # A failed task is reported and the worker moves on to the next one.
+  for (run, subrun), subrun_tasks in group_tasks(tasks).items():
+    try:
+      perform_trim.trim_tasks(subrun_tasks, run, subrun, options)
+    except Exception:
+      argv = [sys.argv[0], ' '.join(f'{xtal}:{multiplicity}' for xtal, multiplicity in subrun_tasks), str(run), str(subrun)]
+      print('Failed ', argv, file=sys.stderr)
+      traceback.print_exc()
+    sys.stdout.flush()
+
+
+# Execute the main code
+if __name__ == '__main__':
+  main()
+
+# END OF CODE
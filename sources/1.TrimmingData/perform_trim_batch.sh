@@ -0,0 +1,22 @@
+#!/bin/bash
+#SBATCH -J perform_trim_batch
+#SBATCH --partition jepyc
+#SBATCH --time 99:00:00
+#SBATCH --output out/%x.csv
+#SBATCH --error out/%x.err
+#SBATCH --open-mode append
+
+# lines above are sbatch submission setting
+# job name is 'perform_trim_batch'
+# use jepyc node
+# time wall is set to 99 hours.
+# output (error) messages will be saved in out/perform_trim_batch.csv (.err) file
+
+# trim every task listed in the task file given as the first argument,
+# in one python process. Other arguments are passed to perform_trim_batch.py.
+# Example
+#     $ sbatch perform_trim_batch.sh tasks.txt --engine rdf
+
+cd "$SLURM_SUBMIT_DIR" || exit
+
+python perform_trim_batch.py "$@"
@@ -0,0 +1,29 @@
+#!/bin/bash
+#SBATCH -J perform_trim_bundles
+#SBATCH --partition jepyc
+#SBATCH --time 99:00:00
+#SBATCH --output out/%x.csv
+#SBATCH --error out/%x.err
+#SBATCH --open-mode append
+
+# lines above are sbatch submission setting
+# job name is 'perform_trim_bundles'
+# use jepyc node
+# time wall is set to 99 hours.
+# output (error) messages will be saved in out/perform_trim_bundles.csv (.err) file
+
+# trim one bundle of subruns written by 'mrgd_inventory.py bundle' per array task,
+# in one python process. The bundle directory is the first argument, and the
+# array index is the bundle number. Other arguments are passed to perform_trim_batch.py.
+# Example
+#     $ python mrgd_inventory.py bundle all single --bundle-size 20
+#     $ sbatch --array=0-N perform_trim_bundles.sh out/bundles/ --engine rdf
+# where N is the number of bundles - 1. Each array task appends to its own file of
+# the trim manifest directory; merge them when the array finished,
+#     $ python trim_manifest.py merge
+
+cd "$SLURM_SUBMIT_DIR" || exit
+
+bundle_dir=$1
+shift
+python perform_trim_batch.py "$bundle_dir/$(printf 'bundle-%04d.txt' "$SLURM_ARRAY_TASK_ID")" "$@"
@@ -19,7 +19,6 @@ subrun=$SLURM_ARRAY_TASK_ID
 cd "$SLURM_SUBMIT_DIR" || exit
 
 run=$1
-for xtal in {2,3,4,6,7}
-do
-  python perform_trim.py "$xtal" "$run" "$subrun" single
-done
+# trim every good crystal (2, 3, 4, 6, 7) reading the MRGD file only once
+# the time and I/O of every phase are appended to out/perform_trim_single.profile.jsonl (see summarize_profile.py)
+python perform_trim.py all "$run" "$subrun" single --profile "out/$SLURM_JOB_NAME.profile.jsonl"
@@ -0,0 +1,212 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+#  Change output directories to your own directories.
+# Find '# SETTING: directory' comments in perform_trim.py and modify
+# directories.
+#
+# Usage
+#     (pyroot) $ python schedule_trim.py 'xtal' 'multiplicity' [options]
+#             xtal: 2, 3, 4, 6 or 7, a comma separated list of them, or 'all'
+#             multiplicity: 'single', 'multi' or 'both'
+#             --runs: comma separated list of runs (default: every run
+#                     directory of the MRGD directory)
+#             --inventory: read the subruns from this MRGD inventory (see
+#                          mrgd_inventory.py), instead of scanning the MRGD
+#                          directory
+#             --backend: 'local' runs the workers as processes of this node,
+#                        'slurm' submits each worker as a Slurm job
+#                        (default: 'local')
+#             --workers: number of workers running at once (default: number
+#                        of cores for 'local', 20 for 'slurm')
+#             --tasks-per-job: number of subruns trimmed by each worker
+#                              (default: 50)
+#             --bundle-size: total MRGD size trimmed by each worker in GB,
+#                            instead of --tasks-per-job
+#             --retries: number of times the failed subruns are trimmed again
+#                        (default: 2)
+#             --work-dir: directory of the task lists, the profiles and the
+#                         outputs of the workers
+#                         (default: out/schedule-{date}-{time}/)
+#             --manifest: trim manifest directory of the workers, merged
+#                         after them (default: data/trim_manifest/)
+#             --partition, --time, --job-name: sbatch options of the workers
+#                                              of the 'slurm' backend
+#             other options: passed to perform_trim_batch.py (--engine,
+#                            --slim, ...)
+# Example
+#     (pyroot) $ python schedule_trim.py all single --backend slurm
+#             will trim single hit events of every good crystal, for every
+#             subrun of every run, keeping 20 Slurm jobs of 50 subruns each
+#             in the queue.
+#     (pyroot) $ python schedule_trim.py 2 single --runs 1544 --workers 4
+#             will trim crystal 2 of run 1544 with 4 local worker processes.
+#
+#  This script builds the task list from the subruns which exist in the MRGD
+# directory, packs them into bundles of --tasks-per-job subruns (or of about
+# --bundle-size GB, see mrgd_inventory.py), and runs a perform_trim_batch.py
+# worker per bundle, at most --workers at once. The
+# 'slurm' backend waits for each job with 'sbatch --wait', so that nothing
+# polls squeue.
+#  Each worker records the status of every subrun in its profile file (see
+# trim_profile.py). Subruns which failed, or were never reached because the
+# worker was killed (e.g. by the time limit), are packed again and retried up
+# to --retries times. Subruns with no MRGD file or a missing branch are not
+# retried. The subruns still failing at the end are written to
+# 'failed_tasks.txt' of the work directory, in the task file format of
+# perform_trim_batch.py.
+#  Each worker appends to its own file of the trim manifest directory, and the
+# files are merged into one when every worker finished (see trim_manifest.py).
+###############################################################################
+
+# 0. Prepare
+# Import packages
+import os
+import sys
+import time
+import shlex
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import perform_trim
+import trim_profile
+import mrgd_inventory
+import trim_manifest
+
+# Directory of this script, where the workers run
+script_directory = os.path.dirname(os.path.abspath(__file__))
+
+# Statuses of the subruns with nothing left to do. Other subruns are retried.
+done_statuses = ['Trimmed', 'AlreadyExist']
+permanent_statuses = ['NoMRGD', 'NoBranch']  # retrying does not help
+
+
+# Run a worker as a process of this node, and return its exit code
+def run_local(command, output_prefix, options):
+  with open(output_prefix + '.csv', 'w') as stdout, open(output_prefix + '.err', 'w') as stderr:
+    return subprocess.run(command, stdout=stdout, stderr=stderr, cwd=script_directory).returncode
+
+
+# Submit a worker as a Slurm job, wait for it, and return its exit code
+def run_slurm(command, output_prefix, options):
+  sbatch = ['sbatch', '--wait', '--parsable',
+            '--job-name', options.job_name, '--partition', options.partition, '--time', options.time,
+            '--output', output_prefix + '.csv', '--error', output_prefix + '.err',
+            '--wrap', ' '.join(shlex.quote(argument) for argument in command)]
+  return subprocess.run(sbatch, stdout=subprocess.DEVNULL, cwd=script_directory).returncode
+
+
+# Status of every subrun recorded in the profile files of the workers.
+# Return a dict (run, subrun) -> status.
+def read_statuses(profile_files):
+  statuses = {}
+  for record in trim_profile.read_profiles([path for path in profile_files if os.path.isfile(path)]):
+    statuses[(record['run'], record['subrun'])] = record['status']
+  return statuses
+
+
+def main():
+  # 1. Get input from command line.
+  parser = argparse.ArgumentParser(description='Trim every MRGD subrun with a bounded pool of workers.')
+  parser.add_argument('xtal', help="2, 3, 4, 6 or 7, a comma separated list of them, or 'all'")
+  parser.add_argument('multiplicity')
+  parser.add_argument('--runs', default=None, help='comma separated list of runs, every run if not given')
+  parser.add_argument('--mrgd-dir', default=mrgd_inventory.mrgd_directory,
+                      help='MRGD directory, holding a directory per run')
+  parser.add_argument('--inventory', default=None, help='MRGD inventory, instead of scanning the MRGD directory')
+  parser.add_argument('--backend', choices=['local', 'slurm'], default='local')
+  parser.add_argument('--workers', type=int, default=None,
+                      help="number of workers at once, number of cores for 'local' and 20 for 'slurm' by default")
+  parser.add_argument('--tasks-per-job', type=int, default=50, help='number of subruns trimmed by each worker')
+  parser.add_argument('--bundle-size', type=float, default=None,
+                      help='total MRGD size trimmed by each worker in GB, instead of --tasks-per-job')
+  parser.add_argument('--retries', type=int, default=2, help='number of times the failed subruns are retried')
+  parser.add_argument('--work-dir', default=None, help='directory of the task lists and the worker outputs')
+  parser.add_argument('--manifest', default=perform_trim.manifest_directory,
+                      help='trim manifest directory of the workers, merged after them')
+  parser.add_argument('--partition', default='jepyc', help='Slurm partition of the workers')
+  parser.add_argument('--time', default='99:00:00', help='time limit of each Slurm job')
+  parser.add_argument('--job-name', default='perform_trim_batch', help='name of the Slurm jobs')
+  options, trim_arguments = parser.parse_known_args()  # the others go to perform_trim_batch.py
+
+  xtals = perform_trim.good_xtals if options.xtal == 'all' else [int(xtal) for xtal in options.xtal.split(',')]
+  multiplicity = options.multiplicity
+  runs = None if options.runs is None else [int(run) for run in options.runs.split(',')]
+  if options.workers is None:
+    options.workers = os.cpu_count() if options.backend == 'local' else 20
+  if options.work_dir is None:
+    options.work_dir = os.path.join(script_directory, 'out', time.strftime('schedule-%Y%m%d-%H%M%S'))
+  run_worker = run_local if options.backend == 'local' else run_slurm
+
+  # Check bad input
+  for xtal in xtals:
+    assert xtal in perform_trim.good_xtals  # Use good crystals only
+  for run in runs or []:
+    assert (run >= 1000) and (run <= 9999)
+  assert multiplicity in ['single', 'multi', 'both']
+  assert options.workers >= 1 and options.tasks_per_job >= 1
+
+  # 2. Build the task list from the existing subruns only
+  # Each task is an entry of the inventory, (run, subrun, size, mtime).
+  if options.inventory is not None:
+    pending = [entry for entry in mrgd_inventory.read_inventory(options.inventory) if runs is None or entry[0] in runs]
+  else:
+    pending = mrgd_inventory.scan(options.mrgd_dir, mrgd_inventory.find_runs(options.mrgd_dir) if runs is None else runs)
+  print(sys.argv[0], 'tasks', len(set(entry[0] for entry in pending)), len(pending), sep=',')
+  sys.stdout.flush()
+
+  # 3. Run the workers, and retry the failed subruns
+  statuses = {}
+  for attempt in range(options.retries + 1):
+    if len(pending) == 0:
+      break
+    attempt_dir = os.path.join(options.work_dir, f'attempt-{attempt}')
+    os.makedirs(attempt_dir, exist_ok=True)
+    if options.bundle_size is not None:
+      bundles = mrgd_inventory.make_bundles(pending, mrgd_inventory.count_bundles(pending, options.bundle_size * 1e9))
+    else:
+      bundles = [pending[i:i + options.tasks_per_job] for i in range(0, len(pending), options.tasks_per_job)]
+
+    profile_files = []
+    with ThreadPoolExecutor(max_workers=options.workers) as pool:
+      futures = {}
+      for i, bundle in enumerate(bundles):
+        prefix = os.path.join(attempt_dir, f'bundle-{i:04d}')
+        mrgd_inventory.write_task_file(prefix + '.txt', bundle, xtals, multiplicity)
+        profile_files.append(prefix + '.profile.jsonl')
+        command = [sys.executable, os.path.join(script_directory, 'perform_trim_batch.py'), prefix + '.txt',
+                   '--profile', prefix + '.profile.jsonl', '--mrgd-dir', options.mrgd_dir,
+                   '--manifest', options.manifest] + trim_arguments
+        futures[pool.submit(run_worker, command, prefix, options)] = (i, bundle)
+      for future in as_completed(futures):
+        i, bundle = futures[future]
+        print(sys.argv[0], 'bundle', attempt, i, len(bundle), future.result(), sep=',')
+        sys.stdout.flush()
+
+    statuses.update(read_statuses(profile_files))
+    pending = [entry for entry in pending if statuses.get(entry[:2]) not in done_statuses + permanent_statuses]
+
+  # Merge the manifest files of the workers, none of which is running now
+  if '--no-manifest' not in trim_arguments:
+    trim_manifest.merge_manifest(options.manifest)
+
+  # 4. Print the result, and write the subruns still failing
+  counts = {}
+  for task in statuses:
+    counts[statuses[task]] = counts.get(statuses[task], 0) + 1
+  counts['NotRun'] = sum(1 for entry in pending if entry[:2] not in statuses)  # e.g. killed by the time limit
+  for status, nTasks in sorted(counts.items()):
+    print(sys.argv[0], 'status', status, nTasks, sep=',')
+  if len(pending) > 0:
+    failed_file = os.path.join(options.work_dir, 'failed_tasks.txt')
+    mrgd_inventory.write_task_file(failed_file, pending, xtals, multiplicity)
+    print('Failed ', len(pending), 'subruns, listed in', failed_file, file=sys.stderr)
+    sys.exit(1)
+
+
+# Execute the main code
+if __name__ == '__main__':
+  main()
+
+# END OF CODE
@@ -0,0 +1,108 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+# Usage
+#     $ python summarize_profile.py 'profile_files' [options]
+#             profile_files: profile files written by
+#                            'perform_trim.py --profile'
+#             --job: summarize only the tasks of this Slurm job ID
+#             --top: number of the slowest tasks to list (default: 10)
+# Example
+#     (pyroot) $ sbatch perform_trim_singlehit_onerun.sh 1544
+#     $ python summarize_profile.py out/perform_trim_single.profile.jsonl
+#             will summarize every phase of the trimming tasks of the array
+#             job, and list the 10 slowest tasks.
+#
+#  This script aggregates the per-phase records of the trimming tasks (see
+# trim_profile.py), e.g. of a whole array job, and prints four tables in csv
+# format, separated by an empty line:
+#  1. status,tasks: number of tasks of each status
+#  2. phase,tasks,wall_s,wall_share,mean_s,p50_s,p95_s,max_s,cpu_s,cpu_per_wall,read_MB,write_MB,read_MBps,read_calls
+#     for every phase of the trimmed tasks. wall_s, cpu_s, read_MB, write_MB
+#     and read_calls are the totals over the tasks, and wall_share is the
+#     share of the total wall time of the tasks. A phase with a low
+#     cpu_per_wall spent its time waiting, e.g. for the file system.
+#  3. host,tasks,mean_s,max_s: wall time of the trimmed tasks on each node
+#  4. wall_s,host,job,task,slowest_phase,slowest_phase_s,argv: the slowest
+#     trimmed tasks
+###############################################################################
+
+# 0. Prepare
+# Import packages
+import argparse
+import trim_profile
+
+
+# Value of the sorted values at the quantile
+def quantile(values, q):
+  return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def main():
+  # 1. Read the records
+  parser = argparse.ArgumentParser(description='Summarize the per-phase records of the trimming tasks.')
+  parser.add_argument('profile_files', nargs='+')
+  parser.add_argument('--job', default=None, help='summarize only the tasks of this Slurm job ID')
+  parser.add_argument('--top', type=int, default=10, help='number of the slowest tasks to list')
+  options = parser.parse_args()
+
+  records = trim_profile.read_profiles(options.profile_files)
+  if options.job is not None:
+    records = [record for record in records if record['job'] == options.job]
+
+  # 2. Number of tasks of each status
+  statuses = {}
+  for record in records:
+    statuses[record['status']] = statuses.get(record['status'], 0) + 1
+  print('status,tasks')
+  for status, nTasks in sorted(statuses.items()):
+    print(status, nTasks, sep=',')
+
+  trimmed = [record for record in records if record['status'] == 'Trimmed']
+  if len(trimmed) == 0:
+    return
+
+  # 3. Every phase of the trimmed tasks
+  total_wall = sum(record['wall_s'] for record in trimmed)
+  phases = {}  # phase -> list of the phase records
+  for record in trimmed:
+    for name, phase in record['phases'].items():
+      phases.setdefault(name, []).append(phase)
+  print()
+  print('phase,tasks,wall_s,wall_share,mean_s,p50_s,p95_s,max_s,cpu_s,cpu_per_wall,read_MB,write_MB,read_MBps,read_calls')
+  for name, phase_records in sorted(phases.items(), key=lambda item: -sum(phase['wall_s'] for phase in item[1])):
+    walls = sorted(phase['wall_s'] for phase in phase_records)
+    wall = sum(walls)
+    cpu = sum(phase['cpu_s'] for phase in phase_records)
+    read = sum(phase['read_bytes'] for phase in phase_records) / 1e6
+    write = sum(phase['write_bytes'] for phase in phase_records) / 1e6
+    read_calls = sum(phase.get('read_calls', 0) for phase in phase_records)  # not in the older records
+    print(name, len(walls), f'{wall:.3f}', f'{wall / total_wall:.3f}' if total_wall > 0 else 0,
+          f'{wall / len(walls):.3f}', f'{quantile(walls, 0.5):.3f}', f'{quantile(walls, 0.95):.3f}', f'{walls[-1]:.3f}',
+          f'{cpu:.3f}', f'{cpu / wall:.3f}' if wall > 0 else 0,
+          f'{read:.3f}', f'{write:.3f}', f'{read / wall:.3f}' if wall > 0 else 0, read_calls, sep=',')
+
+  # 4. Wall time of the trimmed tasks on each node
+  hosts = {}
+  for record in trimmed:
+    hosts.setdefault(record['host'], []).append(record['wall_s'])
+  print()
+  print('host,tasks,mean_s,max_s')
+  for host, walls in sorted(hosts.items()):
+    print(host, len(walls), f'{sum(walls) / len(walls):.3f}', f'{max(walls):.3f}', sep=',')
+
+  # 5. The slowest trimmed tasks
+  print()
+  print('wall_s,host,job,task,slowest_phase,slowest_phase_s,argv')
+  for record in sorted(trimmed, key=lambda record: -record['wall_s'])[:options.top]:
+    slowest = max(record['phases'].items(), key=lambda item: item[1]['wall_s'])
+    print(f'{record["wall_s"]:.3f}', record['host'], record['job'], record['task'],
+          slowest[0], f'{slowest[1]["wall_s"]:.3f}', ' '.join(record['argv']), sep=',')
+
+
+# Execute the main code
+if __name__ == '__main__':
+  main()
+
+# END OF CODE
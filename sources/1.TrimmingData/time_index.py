@@ -0,0 +1,113 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+#  Change output directories to your own directories.
+# Find '# SETTING: directory' comments in perform_trim.py and modify
+# directories.
+#
+# Usage
+#     (pyroot) $ python time_index.py build 'xtal' ['multiplicity']
+#     (pyroot) $ python time_index.py query 'xtal' 't0' 't1' ['multiplicity']
+#             xtal: 2, 3, 4, 6 or 7
+#             t0, t1: start and end of the time window, in eventsec
+#             multiplicity: 'single' (default) or 'multi'
+# Example
+#     (pyroot) $ python time_index.py build 2
+#             will write the time index of crystal 2,
+#             data/C2_time_index.csv
+#     (pyroot) $ python time_index.py query 2 1587218412 1589731377
+#             will print the number of events of crystal 2 in the unstable
+#             period, for each subrun overlapping it.
+#
+#  This script builds the event time index of the trimmed files of a crystal.
+# The index is a csv file with one row per subrun with selected events,
+#     tmin,tmax,run,subrun,filename,firstEntry,nEntries
+# sorted by tmin, where tmin and tmax are the start and end time of the
+# subrun, and the events of the subrun are the entries firstEntry ~
+# firstEntry + nEntries - 1 of 'ntp' in the file. Both the per-subrun files
+# and the run files of consolidate_trim.py are indexed.
+#  A time window query (dqc_io.query_time_window()) finds the subruns by
+# binary search, and opens only the files holding them. Build the index again
+# after trimming or packing new runs.
+###############################################################################
+
+# 0. Prepare
+# Import packages
+import os
+import sys
+import argparse
+import perform_trim
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import dqc_io
+
+
+# Build the time index of the crystal, and return the number of rows
+def build(ROOT, xtal, multiplicity):
+  trimmed_path = perform_trim.get_output_file(xtal, 0, 0, multiplicity)[0]
+  index_file = dqc_io.get_time_index_file(perform_trim.home_directory, xtal, multiplicity)
+
+  # Subrun timing is read from the metadata only, without reading events.
+  rows = []
+  for run, subrun, tree, firstEntry, meta in dqc_io.iter_subruns(ROOT, trimmed_path):
+    if meta['nEntries'] == 0:  # nothing to find in the subrun
+      continue
+    filename = os.path.basename(tree.GetCurrentFile().GetName())
+    rows.append((meta['iEvtSec'], meta['fEvtSec'], run, subrun, filename, firstEntry, meta['nEntries']))
+  rows.sort()
+
+  # Write the index under a temporary name and rename it, so that readers
+  # never see a partially written index.
+  directory, name = os.path.split(index_file)
+  temporary = os.path.join(directory, '.' + name)
+  with open(temporary, 'w') as outfile:
+    print('tmin,tmax,run,subrun,filename,firstEntry,nEntries', file=outfile)
+    for row in rows:
+      print(*row, file=outfile, sep=',')
+  os.replace(temporary, index_file)
+  return len(rows)
+
+
+# Print the number of events in the time window, for each subrun
+def query(ROOT, xtal, t0, t1, multiplicity):
+  trimmed_path = perform_trim.get_output_file(xtal, 0, 0, multiplicity)[0]
+  rows = dqc_io.read_time_index(dqc_io.get_time_index_file(perform_trim.home_directory, xtal, multiplicity))
+
+  print('run,subrun,nEntries,nInWindow')
+  for run, subrun, tree, firstEntry, nEntries in dqc_io.query_time_window(ROOT, trimmed_path, rows, t0, t1):
+    nInWindow = tree.Draw('eventsec', f'eventsec >= {t0} && eventsec <= {t1}', 'goff', nEntries, firstEntry)
+    print(run, subrun, nEntries, nInWindow, sep=',')
+
+
+def main():
+  # Get input from command line.
+  parser = argparse.ArgumentParser(description='Build and query the event time index of the trimmed files.')
+  subparsers = parser.add_subparsers(dest='command', required=True)
+  build_parser = subparsers.add_parser('build', help='build the time index of a crystal')
+  build_parser.add_argument('xtal', type=int)
+  build_parser.add_argument('multiplicity', nargs='?', default='single')
+  query_parser = subparsers.add_parser('query', help='count events in a time window')
+  query_parser.add_argument('xtal', type=int)
+  query_parser.add_argument('t0', type=int)
+  query_parser.add_argument('t1', type=int)
+  query_parser.add_argument('multiplicity', nargs='?', default='single')
+  options = parser.parse_args()
+
+  # Check bad input
+  assert options.xtal in perform_trim.good_xtals  # Use good crystals only
+  assert options.multiplicity in ['single', 'multi']
+
+  import ROOT
+  if options.command == 'build':
+    nRows = build(ROOT, options.xtal, options.multiplicity)
+    print(sys.argv[0], options.xtal, options.multiplicity, nRows, sep=',')
+  else:
+    assert options.t0 <= options.t1
+    query(ROOT, options.xtal, options.t0, options.t1, options.multiplicity)
+
+
+# Execute the main code
+if __name__ == '__main__':
+  main()
+
+# END OF CODE
@@ -0,0 +1,100 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+#  Columnar export of the trimmed events.
+#  Besides the trimmed ROOT files, the selected events can be written into a
+# per-crystal Parquet dataset, partitioned by run:
+#     data/columnar/C{xtal}/events/run={run}/part-{subrun:03d}.parquet
+#     data/columnar/C{xtal}/subruns/run={run}/part-{subrun:03d}.parquet
+# ('C{xtal}_multi' for the multiple hit events.)
+# 'events' holds subrun, eventsec, energy and the cut variables of every
+# selected event, and 'subruns' holds one row of the subrun metadata per
+# subrun, also for the subruns without selected events.
+#  The later stages load the whole history of a crystal with a few bulk
+# reads of the dataset (see dqc_io.read_columnar()), instead of opening every
+# trimmed ROOT file.
+#
+#  Needs pyarrow, imported only when the dataset is written.
+###############################################################################
+
+# Import packages
+import os
+
+# Columns of the 'events' dataset: name -> (leaf, index of array leaf)
+columnar_columns = {
+  'eventsec': ('eventsec', None),
+  'energy': ('crystal{xtal}.energy', None),
+  'bdt': ('bdt', '{xtal}'),
+  'nx1': ('crystal{xtal}.nx1', None),
+  'nx2': ('crystal{xtal}.nx2', None),
+  'rqcn': ('crystal{xtal}.rqcn', None),
+  'lsCharge': ('BLSVeto.Charge', None),
+  'muonDeltaT0': ('BMuon.totalDeltaT0', None),
+}
+
+
+# Dataset directory of the crystal and multiplicity
+def get_dataset_path(columnar_path, xtal, multiplicity):
+  return columnar_path + (f'C{xtal}/' if multiplicity == 'single' else f'C{xtal}_multi/')
+
+
+# Files of the subrun in the 'events' and 'subruns' datasets
+def get_subrun_files(dataset_path, run, subrun):
+  return [dataset_path + f'{table}/run={run:d}/part-{subrun:03d}.parquet' for table in ('events', 'subruns')]
+
+
+# Read the columns of the selected events from a trimmed ROOT file, with
+# RDataFrame. Return a dict of NumPy arrays.
+def read_columns_root(ROOT, data_file, xtal):
+  df = ROOT.RDataFrame('ntp', data_file)
+  for name, (leaf, index) in columnar_columns.items():
+    expr = leaf.format(xtal=xtal) if index is None else f'{leaf}[{index.format(xtal=xtal)}]'
+    df = df.Define('columnar_' + name, expr)
+  arrays = df.AsNumpy(['columnar_' + name for name in columnar_columns])
+  return {name: arrays['columnar_' + name] for name in columnar_columns}
+
+
+# Read the columns of the selected events from a trimmed ROOT file, with
+# uproot. Return a dict of NumPy arrays.
+def read_columns_uproot(data_file, xtal):
+  import uproot
+  import trim_uproot
+  with uproot.open(data_file) as infile:
+    tree = infile['ntp']
+    arrays = {}
+    for name, (leaf, index) in columnar_columns.items():
+      values = trim_uproot.read_leaf(tree, leaf.format(xtal=xtal), 0, tree.num_entries)
+      arrays[name] = values if index is None else values[:, int(index.format(xtal=xtal))]
+  return arrays
+
+
+# Write the selected events and the metadata of one subrun into the dataset.
+# subrun_meta is (iEvtSec, fEvtSec, nOriginalEntries).
+# Each file is written under a temporary name and renamed, so that readers
+# never see a partially written file.
+def write_subrun(dataset_path, run, subrun, arrays, subrun_meta, cut_version):
+  import numpy
+  import pyarrow
+  import pyarrow.parquet
+
+  nEntries = len(arrays['eventsec'])
+  events = dict(subrun=numpy.full(nEntries, subrun, dtype=numpy.int16), **arrays)
+  subruns = {
+    'subrun': numpy.array([subrun], dtype=numpy.int16),
+    'iEvtSec': numpy.array([subrun_meta[0]], dtype=numpy.int64),
+    'fEvtSec': numpy.array([subrun_meta[1]], dtype=numpy.int64),
+    'subrunDuration': numpy.array([subrun_meta[1] - subrun_meta[0]], dtype=numpy.uint16),
+    'nOriginalEntries': numpy.array([subrun_meta[2]], dtype=numpy.int64),
+    'nEntries': numpy.array([nEntries], dtype=numpy.int64),
+    'cutVersion': [cut_version],
+  }
+
+  for table, filename in zip((events, subruns), get_subrun_files(dataset_path, run, subrun)):
+    directory, name = os.path.split(filename)
+    os.makedirs(directory, exist_ok=True)
+    temporary = os.path.join(directory, '.' + name)  # hidden files are ignored by the readers
+    pyarrow.parquet.write_table(pyarrow.table(table), temporary)
+    os.replace(temporary, filename)
+
+# END OF CODE
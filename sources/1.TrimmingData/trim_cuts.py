@@ -0,0 +1,205 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+#  Cut definitions for trimming the MRGD data file.
+#  Cut coefficients are read from the versioned cut configuration files,
+# 'cuts/{version}.json' in this directory. To change cuts, add a new
+# configuration file with a new version instead of editing an existing one,
+# so that the cut version recorded in trimmed files stays meaningful.
+#
+#  The same cuts are built as a TFormula string (TChain.CopyTree and
+# TTreeFormula), as a JIT-compiled C++ function (RDataFrame), or as a
+# vectorized NumPy expression (uproot).
+# Every built cut is cached, so that a worker trimming many subruns parses
+# and compiles each cut only once per crystal and cut version.
+###############################################################################
+
+# Import packages
+import os
+import re
+import json
+import hashlib
+from functools import lru_cache
+
+# Cut version used when nothing is specified
+default_cut_version = 'v1'
+
+# Directory of the cut configuration files
+cut_config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cuts')
+
+# Syntax of each expression dialect
+# In the 'numpy' dialect, leaves are the arrays of the dict 'v'.
+dialects = {
+  'tformula': {'leaf': '{0}', 'and': ' && ', 'not': '!', 'exp': 'TMath::Exp', 'index': '{0}[{1}]'},
+  'cpp': {'leaf': '{1}', 'and': ' && ', 'not': '!', 'exp': 'std::exp', 'index': '{0}[{1}]'},
+  'numpy': {'leaf': 'v[{0!r}]', 'and': ' & ', 'not': '~', 'exp': 'numpy.exp', 'index': '{0}[:, {1}]'},
+}
+
+
+# Read the cut configuration file of the version
+@lru_cache(maxsize=None)
+def load_cut_config(version=default_cut_version):
+  with open(os.path.join(cut_config_path, version + '.json')) as infile:
+    config = json.load(infile)
+  assert config['version'] == version  # file name and version must agree
+  return config
+
+
+# SHA-1 hash of the cut configuration file of the version
+@lru_cache(maxsize=None)
+def cut_config_hash(version=default_cut_version):
+  with open(os.path.join(cut_config_path, version + '.json'), 'rb') as infile:
+    return hashlib.sha1(infile.read()).hexdigest()
+
+
+# Return True if the LS charge correction is applied to the run
+def is_charge_corrected(run, version=default_cut_version):
+  return run > load_cut_config(version)['ls_charge']['correction_after_run']
+
+
+# Build a cut expression in the dialect.
+#  kind: 'shared' for the crystal independent LS cuts, or 'single' / 'multi'
+#        for every cuts of the crystal xtal with that multiplicity.
+#        The cuts of the crystal are also split into the terms routing the
+#        events by multiplicity, 'ls_single' / 'ls_multi', and the rest,
+#        'crystal', so that 'single' is 'shared' && 'ls_single' && 'crystal'.
+#  corrected: apply the LS charge correction or not
+# Return the expression and the tuple of the leaves it reads. The leaves are
+# collected per part, 'shared', 'ls' and 'crystal', so that each kind reads
+# only the leaves of its own expression.
+@lru_cache(maxsize=None)
+def build_cut(kind, xtal, corrected, version, dialect):
+  config = load_cut_config(version)
+  syntax = dialects[dialect]
+  leaves = {'shared': [], 'ls': [], 'crystal': []}
+  part = 'shared'  # part of the cuts being built
+
+  # Name of a leaf in the expression
+  def leaf(name):
+    if name not in leaves[part]:
+      leaves[part].append(name)
+    return syntax['leaf'].format(name, name.replace('.', '_'))
+
+  # Leaves of the parts, each leaf once
+  def leaves_of(*parts):
+    names = []
+    for name in parts:
+      names += [leaf_name for leaf_name in leaves[name] if leaf_name not in names]
+    return tuple(names)
+
+  def all_of(*terms):
+    return '(' + syntax['and'].join(terms) + ')'
+
+  def compare(lhs, op, rhs):
+    return f'({lhs} {op} {rhs})'
+
+  # LS cut
+  CoincidenceCut = compare(leaf('BLSVeto.isCoincident'), '==', repr(config['ls_coincident']))
+  MuonCut = compare(leaf('BMuon.totalDeltaT0') + '/1e6', '>', repr(config['muon_window_ms']))
+  SharedCut = all_of(CoincidenceCut, MuonCut)
+  if kind == 'shared':
+    return SharedCut, leaves_of('shared')
+
+  xtal_config = config['crystals'][str(xtal)]
+  if kind != 'crystal':
+    multiplicity = kind[len('ls_'):] if kind.startswith('ls_') else kind
+
+    # LS coincidence cut
+    part = 'ls'
+    ls_charge = config['ls_charge']
+    LSCharge = leaf('BLSVeto.Charge')
+    if corrected:
+      LSCharge += '*(({0!r})*({1}-{2!r})/3600.0+{3!r})'.format(
+        ls_charge['correction_slope'], leaf('eventsec'),
+        ls_charge['correction_t0'], ls_charge['correction_offset'])
+    LSCharge += '/' + repr(ls_charge['spe'])
+    LSThresCut = compare(LSCharge, '<=', repr(config['ls_threshold'][multiplicity]))
+
+    # Crystal coincidence check
+    SingleCut = all_of(*[compare(leaf(f'crystal{other}.nc'), '<', repr(nc_max))
+                         for other, nc_max in sorted(xtal_config['nc_max'].items())])
+    if multiplicity == 'single':
+      LSSingleCut = all_of(LSThresCut, SingleCut)
+    elif multiplicity == 'multi':
+      LSSingleCut = syntax['not'] + all_of(LSThresCut, SingleCut)
+    if kind.startswith('ls_'):
+      return LSSingleCut, leaves_of('ls')
+
+  # Waveform precuts
+  part = 'crystal'
+  nchargeCut = compare(leaf(f'crystal{xtal}.rqcn'), '>', '-1')
+  ncCut = all_of(compare(leaf(f'pmt{xtal}1.nc'), '>', '0'), compare(leaf(f'pmt{xtal}2.nc'), '>', '0'))
+  t1Cut = all_of(compare(leaf(f'pmt{xtal}1.t1'), '>', '0'), compare(leaf(f'pmt{xtal}2.t1'), '>', '0'))
+
+  # Scintillation-like event cut
+  bdt = syntax['index'].format(leaf('bdt'), xtal)
+  energy = leaf(f'crystal{xtal}.energy')
+  bdt_coef = xtal_config['bdt']
+  bdtCut = compare('({0!r}*{1}({2!r}*{3}) + ({4!r}) + ({5!r})*{3})'.format(
+                     bdt_coef['scale'], syntax['exp'], bdt_coef['slope'], bdt,
+                     bdt_coef['offset'], bdt_coef['linear']),
+                   '<', energy)
+  esVar = '((1.0 - ({0} - {1}))/2.0)'.format(leaf(f'crystal{xtal}.nx2'), leaf(f'crystal{xtal}.nx1'))
+  eshCut = compare(esVar, '>', repr(xtal_config['es_min']))
+  esdCut = compare(f'{esVar} - {xtal_config["es_bdt_slope"]!r}*{bdt}', '<', repr(xtal_config['es_max']))
+
+  if kind == 'crystal':
+    return all_of(nchargeCut, ncCut, t1Cut, bdtCut, eshCut, esdCut), leaves_of('crystal')
+
+  # Merge every cuts
+  allCuts = all_of(SharedCut, LSSingleCut, nchargeCut, ncCut, t1Cut, bdtCut, eshCut, esdCut)
+  return allCuts, leaves_of('shared', 'ls', 'crystal')
+
+
+# TFormula string of the crystal independent LS cuts
+def get_shared_cut(version=default_cut_version):
+  return build_cut('shared', None, False, version, 'tformula')[0]
+
+
+# TFormula string of every cuts for the crystal, run and multiplicity
+def get_cuts(xtal, run, multiplicity, version=default_cut_version):
+  return build_cut(multiplicity, xtal, is_charge_corrected(run, version), version, 'tformula')[0]
+
+
+# Leaves read by the cuts for the crystal, run and multiplicity
+def get_cut_leaves(xtal, run, multiplicity, version=default_cut_version):
+  return build_cut(multiplicity, xtal, is_charge_corrected(run, version), version, 'tformula')[1]
+
+
+# Declare the cuts as a C++ function once per process, and return the
+# RDataFrame filter expression calling it.
+@lru_cache(maxsize=None)
+def declare_cpp_cut(xtal, corrected, multiplicity, version=default_cut_version):
+  import ROOT
+  expr, leaves = build_cut(multiplicity, xtal, corrected, version, 'cpp')
+  name = re.sub(r'\W', '_', f'dqc_cut_{version}_C{xtal}_{multiplicity}_{int(corrected)}')
+  params = ', '.join('const auto &' + leaf.replace('.', '_') for leaf in leaves)
+  assert ROOT.gInterpreter.Declare(f'auto {name} = []({params}) {{ return {expr}; }};')
+  return name + '(' + ', '.join(leaves) + ')'
+
+
+# RDataFrame filter expression of every cuts for the crystal, run and
+# multiplicity. Any kind of build_cut() can be given as multiplicity.
+def get_rdf_cuts(xtal, run, multiplicity, version=default_cut_version):
+  return declare_cpp_cut(xtal, is_charge_corrected(run, version), multiplicity, version)
+
+
+# Compile the cuts as a vectorized NumPy expression once per process.
+# Return the function taking the dict of leaf arrays and returning the
+# boolean mask of the selected events, and the leaves it reads.
+@lru_cache(maxsize=None)
+def compile_numpy_cut(kind, xtal, corrected, version=default_cut_version):
+  import numpy
+  expr, leaves = build_cut(kind, xtal, corrected, version, 'numpy')
+  code = compile(expr, f'<cut {version} C{xtal} {kind}>', 'eval')
+  return (lambda v: eval(code, {'numpy': numpy, 'v': v})), leaves
+
+
+# NumPy function of every cuts for the crystal, run and multiplicity.
+# Any kind of build_cut() can be given as multiplicity.
+def get_numpy_cuts(xtal, run, multiplicity, version=default_cut_version):
+  return compile_numpy_cut(multiplicity, xtal, is_charge_corrected(run, version), version)[0]
+
+
+# END OF CODE
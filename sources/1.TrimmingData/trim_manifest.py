@@ -0,0 +1,207 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+# Usage
+#     $ python trim_manifest.py merge [--manifest DIR]
+#             will merge the manifest files of the finished jobs into one.
+#             Run it only when no trimming job is running.
+#
+#  Trim manifest, recording how every trimmed file was made.
+#  For each (run, subrun, xtal, multiplicity), the manifest keeps the MRGD
+# input path, size, modification time (and optionally SHA-1 checksum), the
+# hash of the cut configuration, and the output size and entry numbers.
+# A task is trimmed again only when its input, its cuts or its output
+# changed since it was recorded. A task whose MRGD file lacks a branch of the
+# cuts is recorded with the status 'NoBranch' and no output, so that
+# consolidate_trim.py knows the subrun was skipped, not forgotten.
+#
+#  The manifest is a directory of JSON lines files, one record per line.
+# Every job appends to its own file,
+#     data/trim_manifest/{job}.jsonl
+# named by its Slurm job (and array task) ID, or by its host and process ID
+# outside of Slurm, so that no two jobs write the same file and no file lock
+# is needed (Lustre is often mounted without 'flock'). Each record is written
+# with a single append, like the profile records (see trim_profile.py). A job
+# reads only 'merged.jsonl' and its own file, not the files of the other jobs,
+# so that opening the manifest does not grow with the number of jobs. The
+# latest record of each task is used.
+#  merge_manifest() packs the job files into 'merged.jsonl'. It must run
+# after every batch of jobs, as schedule_trim.py does at its end: until then,
+# the records of the other jobs are not seen, and their outputs are trimmed
+# again by a later job. Slurm array jobs (perform_trim_bundles.sh) have no
+# such step, so run 'python trim_manifest.py merge' after the array.
+###############################################################################
+
+# Import packages
+import os
+import sys
+import json
+import time
+import socket
+import hashlib
+import argparse
+
+# Name of the file merge_manifest() writes
+merged_name = 'merged.jsonl'
+
+# Opened manifests, one per manifest directory
+manifests = {}
+
+
+# Manifest file of this job in the manifest directory
+def get_job_file(path):
+  job = os.environ.get('SLURM_ARRAY_JOB_ID', os.environ.get('SLURM_JOB_ID'))
+  task = os.environ.get('SLURM_ARRAY_TASK_ID')
+  if job is None:
+    name = f'{socket.gethostname()}-{os.getpid()}'
+  else:
+    name = job if task is None else f'{job}_{task}'
+  return os.path.join(path, name + '.jsonl')
+
+
+# Read the records of the manifest files in the directory. Return a dict
+# (run, subrun, xtal, multiplicity) -> record, keeping the latest record of
+# each task.
+def read_records(path, filenames=None):
+  if filenames is None:
+    filenames = sorted(name for name in os.listdir(path) if name.endswith('.jsonl')) if os.path.isdir(path) else []
+  records = {}
+  for filename in filenames:
+    with open(os.path.join(path, filename)) as infile:
+      for line in infile:
+        line = line.strip()
+        if line == '':
+          continue
+        try:
+          entry = json.loads(line)
+        except ValueError:  # a record cut by a killed job
+          print('BrokenRecord ', filename, line[:80], file=sys.stderr)
+          continue
+        key = (entry['run'], entry['subrun'], entry['xtal'], entry['multiplicity'])
+        if key not in records or records[key]['trimmed_at'] <= entry['trimmed_at']:
+          records[key] = entry
+  return records
+
+
+# Open the manifest directory, reading the merged records and those of this
+# job once. The manifest is kept for the whole process.
+def open_manifest(path):
+  manifest = manifests.get(path)
+  if manifest is None:
+    job_file = get_job_file(path)
+    filenames = [name for name in [merged_name, os.path.basename(job_file)] if os.path.isfile(os.path.join(path, name))]
+    manifest = {'path': path, 'job_file': job_file, 'records': read_records(path, filenames)}
+    manifests[path] = manifest
+  return manifest
+
+
+# SHA-1 checksum of a file
+def file_checksum(path):
+  sha1 = hashlib.sha1()
+  with open(path, 'rb') as infile:
+    for block in iter(lambda: infile.read(1 << 20), b''):
+      sha1.update(block)
+  return sha1.hexdigest()
+
+
+# Fingerprint of an input file: (path, size, mtime, checksum).
+# The checksum is computed only if asked, since it reads the whole file.
+def input_fingerprint(path, checksum=False):
+  stat = os.stat(path)
+  return (path, stat.st_size, stat.st_mtime, file_checksum(path) if checksum else '')
+
+
+# Return True if the output is recorded as made from the same input
+# and cuts, and it was not changed since then.
+def is_up_to_date(manifest, xtal, run, subrun, multiplicity, fingerprint, config_hash, output_file):
+  entry = manifest['records'].get((run, subrun, xtal, multiplicity))
+  if entry is None:  # never trimmed, or trimmed before the manifest was used
+    return False
+  if entry.get('status', 'Trimmed') != 'Trimmed':  # skipped, without output
+    return False
+
+  # output file
+  if not os.path.isfile(output_file) or os.path.getsize(output_file) != entry['output_size']:
+    return False
+
+  # input file. The checksum is compared only when both are known.
+  path, size, mtime, checksum = fingerprint
+  if (entry['input_path'], entry['input_size'], entry['input_mtime']) != (path, size, mtime):
+    return False
+  if checksum and entry['input_checksum'] and checksum != entry['input_checksum']:
+    return False
+
+  # cuts
+  return entry['config_hash'] == config_hash
+
+
+# Record a trimmed output, appending it to the manifest file of this job
+def record(manifest, xtal, run, subrun, multiplicity, fingerprint, config_hash, output_file, nOriginalEntries, nEntries):
+  path, size, mtime, checksum = fingerprint
+  entry = {'run': run, 'subrun': subrun, 'xtal': xtal, 'multiplicity': multiplicity, 'status': 'Trimmed',
+           'input_path': path, 'input_size': size, 'input_mtime': mtime, 'input_checksum': checksum,
+           'config_hash': config_hash, 'output_path': output_file, 'output_size': os.path.getsize(output_file),
+           'nOriginalEntries': nOriginalEntries, 'nEntries': nEntries, 'trimmed_at': time.time()}
+  append_record(manifest, entry)
+
+
+# Record a task skipped without output, e.g. 'NoBranch', appending it to the
+# manifest file of this job
+def record_skipped(manifest, xtal, run, subrun, multiplicity, fingerprint, config_hash, status):
+  path, size, mtime, checksum = fingerprint
+  entry = {'run': run, 'subrun': subrun, 'xtal': xtal, 'multiplicity': multiplicity, 'status': status,
+           'input_path': path, 'input_size': size, 'input_mtime': mtime, 'input_checksum': checksum,
+           'config_hash': config_hash, 'output_path': None, 'output_size': None,
+           'nOriginalEntries': None, 'nEntries': None, 'trimmed_at': time.time()}
+  append_record(manifest, entry)
+
+
+# Append a record to the manifest file of this job
+def append_record(manifest, entry):
+  # A single write of an O_APPEND file, so that a killed job leaves at most
+  # its last line cut.
+  os.makedirs(manifest['path'], exist_ok=True)
+  fd = os.open(manifest['job_file'], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+  try:
+    os.write(fd, (json.dumps(entry) + '\n').encode())
+  finally:
+    os.close(fd)
+  manifest['records'][(entry['run'], entry['subrun'], entry['xtal'], entry['multiplicity'])] = entry
+
+
+# Merge the manifest files of the directory into 'merged.jsonl', keeping the
+# latest record of each task, and remove the merged job files. Run it only
+# when no trimming job is running, since a record appended to a job file
+# while merging would be removed with it.
+def merge_manifest(path):
+  if not os.path.isdir(path):
+    return 0
+  filenames = sorted(name for name in os.listdir(path) if name.endswith('.jsonl'))
+  records = read_records(path, filenames)
+  temporary = os.path.join(path, '.' + merged_name)
+  with open(temporary, 'w') as outfile:
+    for key in sorted(records):
+      print(json.dumps(records[key]), file=outfile)
+  os.replace(temporary, os.path.join(path, merged_name))
+  for filename in filenames:
+    if filename != merged_name:
+      os.remove(os.path.join(path, filename))
+  return len(records)
+
+
+def main():
+  import perform_trim
+  parser = argparse.ArgumentParser(description='Merge the manifest files of the trimming jobs.')
+  parser.add_argument('command', choices=['merge'])
+  parser.add_argument('--manifest', default=perform_trim.manifest_directory, help='trim manifest directory')
+  options = parser.parse_args()
+
+  print(sys.argv[0], 'merged', merge_manifest(options.manifest), sep=',')
+
+
+# Execute the main code
+if __name__ == '__main__':
+  main()
+
+# END OF CODE
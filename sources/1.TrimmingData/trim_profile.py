@@ -0,0 +1,118 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+#  Per-phase timing and I/O record of a trimming task.
+#  perform_trim.py measures each phase of a task,
+#     import: importing ROOT, or uproot and NumPy
+#     open: opening the MRGD file
+#     branches: checking the branches of the MRGD file
+#     subrun_time: reading the start and end time of the subrun
+#     cut: selecting the events (CopyTree, the shared entry list, or the cut
+#          evaluation of the uproot engine)
+#     read: reading the leaves of the uproot engine
+#     fill: the event loop filling the outputs
+#     write: writing and closing the outputs
+#     columnar, summary, manifest: the columnar export, the summary records
+#                                  and the trim manifest
+# with the wall time, the CPU time of every thread of the process, the bytes
+# read and written by the process (rchar and wchar of /proc/self/io, which
+# count network file systems like Lustre too), and the number of read calls
+# (syscr). A phase run several times in a task, like 'read' of each chunk, is
+# summed.
+#  With 'perform_trim.py --profile FILE', the record of every task is appended
+# to FILE as one JSON line. Several jobs may share the file; each record is
+# written with a single append. See summarize_profile.py to aggregate them.
+###############################################################################
+
+# Import packages
+import os
+import sys
+import json
+import time
+import socket
+import resource
+from contextlib import contextmanager
+
+# Names of the counters of read_counters()
+counter_names = ['wall_s', 'cpu_s', 'read_bytes', 'write_bytes', 'read_calls']
+
+
+# Counters of the process: (wall time, CPU time, bytes read, bytes written,
+# number of read calls)
+def read_counters():
+  io = {}
+  try:
+    with open('/proc/self/io') as infile:
+      for line in infile:
+        name, _, value = line.partition(':')
+        io[name] = int(value)
+  except OSError:  # not on Linux
+    pass
+  return time.perf_counter(), time.process_time(), io.get('rchar', 0), io.get('wchar', 0), io.get('syscr', 0)
+
+
+# Start the record of a task, trimming the subrun
+def new_profile(argv, run, subrun, engine):
+  profile = {
+    'argv': argv, 'run': run, 'subrun': subrun, 'engine': engine, 'host': socket.gethostname(), 'pid': os.getpid(),
+    'job': os.environ.get('SLURM_ARRAY_JOB_ID', os.environ.get('SLURM_JOB_ID')),
+    'task': os.environ.get('SLURM_ARRAY_TASK_ID'),
+    'start': time.time(), 'status': None, 'phases': {},
+  }
+  profile['counters'] = read_counters()
+  return profile
+
+
+# Measure a phase of the task. Nothing is measured if profile is None.
+@contextmanager
+def phase(profile, name):
+  if profile is None:
+    yield
+    return
+  start = read_counters()
+  try:
+    yield
+  finally:
+    stop = read_counters()
+    record = profile['phases'].setdefault(name, dict.fromkeys(counter_names, 0))
+    for key, begin, end in zip(counter_names, start, stop):
+      record[key] += end - begin
+
+
+# Finish the record of a task with its status, and append it to the profile
+# file as one JSON line.
+def write_profile(path, profile, status):
+  stop = read_counters()
+  record = {key: value for key, value in profile.items() if key != 'counters'}
+  record['status'] = status
+  for key, begin, end in zip(counter_names, profile['counters'], stop):
+    record[key] = end - begin
+  record['peak_rss_MB'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.  # in kB on Linux
+
+  # A single write of an O_APPEND file, so that the records of several jobs
+  # are not interleaved.
+  os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+  fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+  try:
+    os.write(fd, (json.dumps(record) + '\n').encode())
+  finally:
+    os.close(fd)
+
+
+# Read the records of the profile files
+def read_profiles(paths):
+  records = []
+  for path in paths:
+    with open(path) as infile:
+      for line in infile:
+        line = line.strip()
+        if line == '':
+          continue
+        try:
+          records.append(json.loads(line))
+        except ValueError:  # a record cut by a killed job
+          print('BrokenRecord ', path, line[:80], file=sys.stderr)
+  return records
+
+# END OF CODE
@@ -0,0 +1,81 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+#  Per-subrun summary records, made while trimming.
+#  The trimming engines pass the energies of the selected events, which they
+# already have in memory, and a small JSON summary file is written next to
+# the trimmed file:
+#     data/C{xtal}_summary/summary_T{run:06d}_C{xtal}.json.{subrun:03d}
+# ('C{xtal}_multi_summary' for the multiple hit events.)
+# It holds the subrun timing, the event counts in the energy windows, and a
+# fine energy histogram, so that the rate extraction aggregates the summary
+# files without reading the events again (see dqc_io.read_summaries()).
+###############################################################################
+
+# Import packages
+import os
+import sys
+import json
+import math
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import dqc_io
+
+# Energy windows counted in the summary, name -> (low, high) in keV. Both ends
+# are included, like 'crystal{xtal}.energy >= 1 && crystal{xtal}.energy <= 6'.
+# They are the default windows of the rate extraction (see dqc_io.py).
+energy_windows = {name: dqc_io.parse_energy_window(name) for name in dqc_io.energy_windows}
+
+# Fine energy histogram, in keV
+histogram_min = 0.
+histogram_max = 20.
+histogram_bins = 400
+
+
+# Summary file of a trimmed file
+def get_summary_file(home_directory, xtal, run, subrun, multiplicity):
+  summary_path = home_directory + 'data/'
+  summary_path += f'C{xtal}_summary/' if multiplicity == 'single' else f'C{xtal}_multi_summary/'
+  summary_name = f'summary_T{run:06d}_C{xtal}.json.{subrun:03d}'
+  return summary_path, summary_name
+
+
+# Make the summary record of a subrun.
+# subrun_meta is (iEvtSec, fEvtSec, nOriginalEntries).
+def summarize(xtal, run, subrun, multiplicity, cut_version, subrun_meta, energies):
+  windows = {name: 0 for name in energy_windows}
+  counts = [0] * histogram_bins
+  underflow = overflow = 0
+  bin_width = (histogram_max - histogram_min) / histogram_bins
+  for energy in energies:
+    for name, (low, high) in energy_windows.items():
+      if low <= energy <= high:
+        windows[name] += 1
+    if energy < histogram_min:
+      underflow += 1
+    elif energy >= histogram_max:
+      overflow += 1
+    else:
+      counts[min(int(math.floor((energy - histogram_min) / bin_width)), histogram_bins - 1)] += 1
+
+  iEvtSec, fEvtSec, nOriginalEntries = subrun_meta
+  subrunDuration = fEvtSec - iEvtSec
+  return {
+    'xtal': xtal, 'run': run, 'subrun': subrun, 'multiplicity': multiplicity, 'cutVersion': cut_version,
+    'iEvtSec': iEvtSec, 'fEvtSec': fEvtSec, 'subrunDuration': subrunDuration,
+    'midTime': iEvtSec + subrunDuration/2., 'nOriginalEntries': nOriginalEntries, 'nEntries': len(energies),
+    'windows': windows,
+    'histogram': {'min': histogram_min, 'max': histogram_max, 'bins': histogram_bins,
+                  'counts': counts, 'underflow': underflow, 'overflow': overflow},
+  }
+
+
+# Write a summary record. It is written under a temporary name and renamed,
+# so that readers never see a partially written file.
+def write_summary(summary_path, summary_name, record):
+  os.makedirs(summary_path, exist_ok=True)
+  with open(summary_path + '.' + summary_name, 'w') as outfile:
+    json.dump(record, outfile)
+  os.replace(summary_path + '.' + summary_name, summary_path + summary_name)
+
+# END OF CODE
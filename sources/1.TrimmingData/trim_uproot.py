@@ -0,0 +1,199 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+#  Trimming engine reading the MRGD file with uproot, without PyROOT.
+#  The leaves read by the cuts and the outputs are read into NumPy arrays,
+# a chunk of events at a time, and the cuts of trim_cuts.py are evaluated as
+# vectorized array expressions. The shared cuts and the cuts of each crystal
+# not depending on the multiplicity are evaluated once, and combined with the
+# LS terms of each multiplicity.
+#  The output is the slim output of perform_trim.py: the whitelisted columns
+# are written as flat branches named after the MRGD leaves (e.g.
+# 'crystal2.energy'), so that the later stages read them with the same
+# TTree::Draw expressions. The one-row 'meta' tree and the cut version are
+# written as well.
+#
+#  Used by 'perform_trim.py --engine uproot'. Tested on uproot 4.
+###############################################################################
+
+# Import packages
+import os
+import sys
+import numpy
+import uproot
+import trim_cuts
+import trim_profile
+
+# Number of events read at once, to bound the memory usage
+step_size = 500000
+
+
+# Read a leaf of the MRGD tree into a NumPy array, from entry_start to
+# entry_stop. A leaf can be a branch, a leaf of a split branch written as
+# 'branch.leaf', or a leaf of a leaflist branch.
+def read_leaf(tree, leaf, entry_start, entry_stop):
+  for name in (leaf, leaf.replace('.', '/', 1)):
+    try:
+      values = tree[name].array(library='np', entry_start=entry_start, entry_stop=entry_stop)
+      break
+    except KeyError:
+      continue
+  else:
+    # leaflist branch is read as a structured array
+    parent, child = leaf.split('.', 1)
+    values = tree[parent].array(library='np', entry_start=entry_start, entry_stop=entry_stop)[child]
+
+  # Arrays of variable length are stacked into a 2D array, so that the cuts
+  # index them like bdt[:, xtal]. They have the same length in every event.
+  if values.dtype == object and len(values) > 0:
+    values = numpy.stack(values)
+  return values
+
+
+# Branch type of a column of the output tree, from the interpretation of its
+# leaf in the MRGD tree, so that the tree is made even if no event is read.
+# The length of a variable length leaf is known only from an event: it is
+# read from the first event, or the column is made of variable length if the
+# tree has no event.
+def get_column_type(tree, column):
+  for name in (column, column.replace('.', '/', 1)):
+    try:
+      interpretation = tree[name].interpretation
+      child = None
+      break
+    except KeyError:
+      continue
+  else:
+    # leaflist branch is interpreted as a structured dtype
+    parent, child = column.split('.', 1)
+    interpretation = tree[parent].interpretation
+
+  if isinstance(interpretation, uproot.AsJagged):
+    if tree.num_entries == 0:
+      return 'var * ' + str(interpretation.content.to_dtype)
+    values = read_leaf(tree, column, 0, 1)
+    return numpy.dtype((values.dtype, values.shape[1:]))
+  dtype = interpretation.to_dtype
+  return dtype if child is None else dtype[child]
+
+
+# Trim one subrun for every output, and return ((iEvtSec, fEvtSec,
+# nOriginalEntries), list of (xtal, multiplicity, number of entries after
+# trimming, energies of the selected events)), or None if a branch is missing.
+#  outputs: list of (xtal, multiplicity, output_path, output_name, columns)
+#  compression: (algorithm, level), or None for the uproot default
+#  summary: return the energies for the summary record, or None instead
+#  profile: record of the phases of the task (see trim_profile.py), or None
+def trim_subrun(input_file, outputs, run, cut_version, branch_list, argv, compression=None, summary=False,
+                profile=None):
+  # 1. Read MRGD data file
+  with trim_profile.phase(profile, 'open'):
+    infile = uproot.open(input_file)
+    tree = infile['ntp']
+  with infile:
+    # Check branch existence
+    with trim_profile.phase(profile, 'branches'):
+      branches = tree.keys(recursive=False)
+    for branch in branch_list:
+      if branch not in branches:  # a branch is not in the MRGD file.
+        print('No' + branch + ' ', argv, file=sys.stderr)
+        return None
+
+    # Get total number of events before trimming
+    nOriginalEntries = tree.num_entries
+
+    # 2. Define cuts for trimming
+    # Every leaf is read only once, even if several outputs use it.
+    shared_cut = trim_cuts.get_numpy_cuts(None, run, 'shared', cut_version)
+    crystal_cuts = {xtal: trim_cuts.get_numpy_cuts(xtal, run, 'crystal', cut_version)
+                    for xtal, multiplicity, output_path, output_name, columns in outputs}
+    ls_cuts = [trim_cuts.get_numpy_cuts(xtal, run, 'ls_' + multiplicity, cut_version)
+               for xtal, multiplicity, output_path, output_name, columns in outputs]
+    leaves = ['eventsec']
+    for xtal, multiplicity, output_path, output_name, columns in outputs:
+      for leaf in list(trim_cuts.get_cut_leaves(xtal, run, multiplicity, cut_version)) + columns + [f'crystal{xtal}.energy']:
+        if leaf not in leaves:
+          leaves.append(leaf)
+
+    # 3. Create trimmed output files
+    # if you encounter permission problem, change the output directory or its permission using chmod.
+    # The 'ntp' tree is made before the event loop, like CloneTree(0) of the
+    # ROOT engine, so that a subrun of no event still has it.
+    newfiles = []
+    for xtal, multiplicity, output_path, output_name, columns in outputs:
+      os.makedirs(output_path, exist_ok=True)
+      if compression is None:
+        newfile = uproot.recreate(output_path + output_name)
+      else:
+        algorithm, level = compression
+        newfile = uproot.recreate(output_path + output_name, compression=getattr(uproot, algorithm.upper())(level))
+      newfile.mktree('ntp', {column: get_column_type(tree, column) for column in columns})
+      newfiles.append(newfile)
+    nEntries = [0] * len(outputs)
+    energies = [[] for output in outputs]
+
+    # 4. Write the events passing the cuts, a chunk at a time
+    iEvtSec = fEvtSec = 0
+    for entry_start in range(0, nOriginalEntries, step_size):
+      entry_stop = min(entry_start + step_size, nOriginalEntries)
+      with trim_profile.phase(profile, 'read'):
+        v = {leaf: read_leaf(tree, leaf, entry_start, entry_stop) for leaf in leaves}
+      if entry_start == 0:
+        iEvtSec = int(v['eventsec'][0])
+      fEvtSec = int(v['eventsec'][-1])
+
+      with trim_profile.phase(profile, 'cut'):
+        shared = shared_cut(v)
+        crystals = {xtal: shared & crystal_cut(v) for xtal, crystal_cut in crystal_cuts.items()}
+        selections = [crystals[output[0]] & ls_cut(v) for output, ls_cut in zip(outputs, ls_cuts)]
+      with trim_profile.phase(profile, 'fill'):
+        for i, ((xtal, multiplicity, output_path, output_name, columns), selected, newfile) in enumerate(zip(outputs, selections, newfiles)):
+          nEntries[i] += int(numpy.count_nonzero(selected))
+          if summary:
+            energies[i].append(v[f'crystal{xtal}.energy'][selected])
+          if numpy.any(selected):
+            newfile['ntp'].extend({column: v[column][selected] for column in columns})
+
+  # 5. Include run duration info, write and close files
+  subrun_meta = (iEvtSec, fEvtSec, nOriginalEntries)
+  with trim_profile.phase(profile, 'write'):
+    for newfile, nEntry in zip(newfiles, nEntries):
+      write_subrun_meta(newfile, subrun_meta, cut_version, nEntry)
+      newfile.close()
+
+  results = []
+  for output, nEntry, energy in zip(outputs, nEntries, energies):
+    results.append((output[0], output[1], nEntry, numpy.concatenate(energy).tolist() if summary else None))
+  return subrun_meta, results
+
+
+# Store the run duration info once per file, as a one-row 'meta' tree with
+# the same branches as perform_trim.write_subrun_meta().
+# The cut version and the hash of its configuration file are stored as
+# TObjString 'cutVersion' and 'cutHash'.
+def write_subrun_meta(newfile, subrun_meta, cut_version, nEntries):
+  newfile['meta'] = {
+    'iEvtSec': numpy.array([subrun_meta[0]], dtype=numpy.int64),
+    'fEvtSec': numpy.array([subrun_meta[1]], dtype=numpy.int64),
+    'subrunDuration': numpy.array([subrun_meta[1] - subrun_meta[0]], dtype=numpy.uint16),
+    'nOriginalEntries': numpy.array([subrun_meta[2]], dtype=numpy.int64),
+    'nEntries': numpy.array([nEntries], dtype=numpy.int64),
+  }
+  newfile['cutVersion'] = cut_version
+  newfile['cutHash'] = trim_cuts.cut_config_hash(cut_version)
+
+
+# Return True if the trimmed file is complete, like
+# dqc_io.read_valid_subrun_meta(): it has 'ntp' and the 'meta' tree, whose
+# nEntries is the number of entries of 'ntp'.
+def is_complete_output(output_file):
+  try:
+    with uproot.open(output_file) as infile:
+      if 'ntp' not in infile or 'meta' not in infile:
+        return False
+      return int(infile['meta']['nEntries'].array(library='np')[0]) == infile['ntp'].num_entries
+  except (OSError, ValueError, KeyError, uproot.deserialization.DeserializationError):
+    return False  # a broken file, e.g. of a killed job
+
+# END OF CODE
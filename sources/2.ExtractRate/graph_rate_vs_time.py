@@ -4,92 +4,363 @@
 #            physmlee@gmail.com
 #
 # This script loops over trimmed files, recording the number of events after
-# cuts in each file. Output is saved as a TGraph and as a text file.
+# cuts in each file. Output is saved as a NumPy rate store, and optionally as
+# a TGraph and as a text file.
 #
 #  Change output directories to your own directories.
 # Find '# SETTING: directory' comments and modify directories.
 #
 # Usage
-#     (pyroot) $ python graph_rate_vs_time.py 'xtal'
-#             xtal: 2, 3, 4, 6 or 7
+#     (pyroot) $ python graph_rate_vs_time.py 'xtal' ['read_mode'] [options]
+#             xtal: 2, 3, 4, 6 or 7, a comma separated list of them, or 'all'
+#             read_mode: 'root' (default) reads every trimmed ROOT file,
+#                        'columnar' reads the Parquet dataset written by
+#                        'perform_trim.py --columnar' in bulk,
+#                        'summary' aggregates the summary records written by
+#                        'perform_trim.py --summary'
+#             --workers: number of processes reading the trimmed ROOT files
+#                        at once, shared by the crystals, 0 for every core
+#                        allocated to the job (default: 1)
+#             --incremental: read only the trimmed ROOT files which are new
+#                            or changed since the last run, keeping the
+#                            counts of every file in the rate cache
+#             --windows: comma separated energy windows to count, named
+#                        '{low}to{high}keV'. The first one is the default
+#                        window of the later stages. The 'summary' read mode
+#                        has the windows of the summary records only.
+#                        (default: '1to6keV,2to6keV,1to2keV,6to20keV', those
+#                        of dqc_io.energy_windows)
+#             --export: also write the rate of the first window in the csv
+#                       file 'RawRateTime_xtal{xtal}.csv' and as TGraph
+#                       'graph' of 'RateTime_xtal{xtal}.root', for the tools
+#                       outside of this repository
 # Example
 #     (pyroot) $ python graph_rate_vs_time.py  2
 #             will record the number of single hit events of crystal 2.
+#     (pyroot) $ python graph_rate_vs_time.py  2 --workers 0
+#             will do the same, reading the trimmed files with a process per
+#             core.
+#     (pyroot) $ python graph_rate_vs_time.py  2 --incremental
+#             will do the same, reading only the files trimmed since the last
+#             run.
+#     (pyroot) $ python graph_rate_vs_time.py  2 --windows 1to6keV,1to2keV
+#             will count the events in 1~6 keV and 1~2 keV.
+#     (pyroot) $ python graph_rate_vs_time.py  all --workers 0 --incremental
+#             will record the rate of every good crystal in one job, reading
+#             the new trimmed files of every crystal with a process per core.
+#     (pyroot) $ python graph_rate_vs_time.py  2 columnar
+#             will do the same, reading the columnar dataset.
+#     (pyroot) $ python graph_rate_vs_time.py  2 summary
+#             will do the same, reading the summary records only.
 #
 # Update logs
 #  Changes suited for Olaf server.
+#  Reading the columnar dataset was added.
+#  Aggregating the summary records was added.
+#  Run files packed by consolidate_trim.py are read as well.
+#  The trimmed files can be read by several processes.
+#  The incremental mode was added.
+#  Several energy windows are counted in one pass.
+#  Several crystals are recorded in one run.
+#  The rate store replaced the csv file and the TGraph.
+#
+#  Every energy window is counted from one read of each subrun. The rate of
+# every window is written in the rate store 'Rates_xtal{xtal}.npy', a NumPy
+# structured array of one row per subrun,
+#     run, subrun, mid_time, duration, counts_{window}, rate_{window}, err_{window}, ...
+# which every later stage reads, selecting a window by its name (see
+# dqc_io.get_rate_store_file() and dqc_io.read_rate_store()).
+#
+#  With --incremental, the counts of every trimmed file are kept in the rate
+# cache 'RateCache_xtal{xtal}.jsonl' of the output directory, one JSON line per
+# file, with the size and the mtime of the file. A file is read again only if
+# its size or mtime changed. The line of each file is appended as soon as the
+# file is read, so that an interrupted run keeps the files read so far. The
+# rate store is then rebuilt from the cache, and the cache is rewritten with
+# the current files only.
+#  With several crystals, the trimmed directories are listed once, and the
+# files of every crystal are shared among the same worker processes. Each
+# crystal still gets its own outputs and rate cache.
 ###############################################################################
 
 # 0. Prepare
 # import packages
 import sys
 import os
-import math
+import json
+import argparse
+import multiprocessing
+import numpy
 import ROOT
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import dqc_io
 
-# set root, make TCanvas and TGraphErrors instances
+# set root in batch mode. No TCanvas is made, since nothing is drawn here
+# and the count workers are forked from this process.
 ROOT.gROOT.SetBatch(1)
-canvas = ROOT.TCanvas('c','c',1000,600)
-graph = ROOT.TGraphErrors()
 
-xtal = sys.argv[1]  # first parameter
+good_xtals = [2, 3, 4, 6, 7]
+
+parser = argparse.ArgumentParser(description='Record the event rate of every subrun.')
+parser.add_argument('xtal', help="2, 3, 4, 6 or 7, a comma separated list of them, or 'all'")
+parser.add_argument('read_mode', nargs='?', choices=['root', 'columnar', 'summary'], default='root')
+parser.add_argument('--workers', type=int, default=1, help='number of processes reading the trimmed files, 0 for every core')
+parser.add_argument('--incremental', action='store_true', help='read only the trimmed files new or changed since the last run')
+parser.add_argument('--windows', default=','.join(dqc_io.energy_windows), help="comma separated energy windows, named '{low}to{high}keV'")
+parser.add_argument('--export', action='store_true', help='also write the csv file and the TGraph of the first window')
+options = parser.parse_args()
+xtals = good_xtals if options.xtal == 'all' else [int(xtal) for xtal in options.xtal.split(',')]  # first parameter
+read_mode = options.read_mode  # second parameter, optional
+workers = options.workers if options.workers > 0 else len(os.sched_getaffinity(0))  # cores of the job
+for xtal in xtals:
+  assert xtal in good_xtals  # Use good crystals only
+
+# energy windows, name -> (low, high) in keV
+window_names = options.windows.split(',')
+try:
+  windows = {name: dqc_io.parse_energy_window(name) for name in window_names}
+except ValueError as error:
+  parser.error(str(error))
+if read_mode == 'summary':  # the summary records have the default windows only
+  missing = [name for name in window_names if name not in dqc_io.energy_windows]
+  if len(missing) > 0:
+    parser.error('energy windows not in the summary records: ' + ','.join(missing))
+energy_min = min(low for low, high in windows.values())
+energy_max = max(high for low, high in windows.values())
 
 # 1. Prepare for reading data file
 # set directory
 home_directory = './../../'  # SETTING: directory
-trimmed_path = home_directory + 'data/C{}/'.format(xtal)
 output_path = home_directory + 'graphs/'
 
 # create output directory
 # if you encounter permission problem, change the output directory or its permission using chmod.
 os.makedirs(output_path, exist_ok=True)
 
-# 2. Read data and write event rate into csv file
-# create output csv (.csv) file
-with open(output_path + 'RawRateTime_xtal{0}.csv'.format(xtal), 'w') as outfile:
-  # for each trimmed data files,
-  filenamelist = sorted(os.listdir(trimmed_path))
-  filenum = len(filenamelist)
-  for filename in filenamelist:
-    # get run/subrun info
-    run = int(filename[8:12])
-    subrun = int(filename[-3:])
-    
-    # if file smaller than 10kB, it is probably empty or processed incorrectly, so skip
-    if os.path.getsize(trimmed_path + filename) > 10000:
-      data_file = ROOT.TFile(trimmed_path + filename)  # read file
-      tree = data_file.Get('ntp')  # read tree
-      nTotal_events = tree.Draw('crystal{0}.energy'.format(xtal), 'crystal{0}.energy >= 1 && crystal{0}.energy <= 6'.format(xtal), 'gOff')  # count event number in 1~6 keV
-      
-      # evaluate event rate (=event number / subrun duration)
-      tree.GetEntry(0)
+# directory of the trimmed files of a crystal
+def get_trimmed_path(xtal):
+  return home_directory + 'data/C{}/'.format(xtal)
+
+# rate cache of a crystal
+def get_cache_file(xtal):
+  return output_path + 'RateCache_xtal{0}.jsonl'.format(xtal)
+
+# count events of each window in the energies (NumPy array)
+def count_windows(energies):
+  return [int(numpy.count_nonzero((energies >= low) & (energies <= high))) for low, high in windows.values()]
+
+# count event number in every window of every subrun of a trimmed file of a
+# crystal, task = (xtal, filename). Return (xtal, filename, the list of (run,
+# subrun, mid_time, counts, subrunDuration)), where counts is the list of the
+# event numbers of the windows. This is run by the worker processes too.
+def count_file(task):
+  xtal, filename = task
+  selection = 'crystal{0}.energy >= {1} && crystal{0}.energy <= {2}'.format(xtal, energy_min, energy_max)  # every window
+  records = []
+  for run, subrun, tree, firstEntry, meta in dqc_io.iter_file_subruns(ROOT, get_trimmed_path(xtal), filename):
+    counts = [0] * len(windows)
+    if meta['nEntries'] > 0:
+      # read the energies in every window once, and count each window
+      tree.SetEstimate(meta['nEntries'] + 1)
+      nSelected = tree.Draw('crystal{0}.energy'.format(xtal), selection, 'goff', meta['nEntries'], firstEntry)
+      if nSelected > 0:
+        energies = tree.GetV1()
+        energies.reshape((nSelected,))
+        counts = count_windows(numpy.array(energies, dtype=numpy.float64))
+    records.append(make_record(run, subrun, counts, meta))
+  return xtal, filename, records
+
+# count every trimmed file of the tasks (xtal, filename), with the worker
+# processes if there are several. Yield (xtal, filename, records) of each file
+# as it is counted.
+#  catalog: dict xtal -> dict filename -> [size, mtime] of the trimmed files
+def count_files(tasks, catalog):
+  if workers > 1 and len(tasks) > 1:
+    # the files of every crystal are shared among the worker processes, largest first
+    tasks = sorted(tasks, key=lambda task: -catalog[task[0]][task[1]][0])
+    with multiprocessing.get_context('fork').Pool(min(workers, len(tasks))) as pool:
+      yield from pool.imap_unordered(count_file, tasks)
+  else:
+    for task in tasks:
+      yield count_file(task)
+
+# list the trimmed files of every crystal once. Return the catalog, a dict
+# xtal -> dict filename -> [size, mtime], in the order of run and subrun. The
+# size and the mtime tell whether a file changed.
+def make_catalog(xtals):
+  catalog = {}
+  for xtal in xtals:
+    trimmed_path = get_trimmed_path(xtal)
+    catalog[xtal] = {}
+    for filename in dqc_io.list_trimmed_files(trimmed_path):
+      stat = os.stat(trimmed_path + filename)
+      catalog[xtal][filename] = [stat.st_size, stat.st_mtime_ns]
+  return catalog
+
+# read the rate cache. Return a dict filename -> cache entry of the files
+# counted with the same windows. The last entry of a file is used.
+def read_cache(cache_file):
+  cache = {}
+  if not os.path.isfile(cache_file):
+    return cache
+  with open(cache_file) as infile:
+    for line in infile:
       try:
-        pct_of_full_subrun = tree.subrunDuration / 7200
-        event_rate = nTotal_events / pct_of_full_subrun
-        event_rate_err = math.sqrt(nTotal_events) / pct_of_full_subrun
-      except ZeroDivisionError:
-        event_rate = 0
-        event_rate_err = 0
-      mid_time = tree.iEvtSec + tree.subrunDuration/2.
-
-      # plot the point into TGraph instance
-      graph.SetPoint(graph.GetN(), mid_time, event_rate)
-      graph.SetPointError(graph.GetN()-1, 0, event_rate_err)
-
-      # write the data into csv (.csv) file
-      print(run, subrun, mid_time, event_rate, event_rate_err, file=outfile, sep=',')
-
-      # close the trimmed data file
-      data_file.Close()
-
-# 3. Write TGraph into root file
-# create output root file to write TGraph instance
-out_graph_file = ROOT.TFile(output_path + 'RateTime_xtal{0}.root'.format(xtal), 'recreate')
-
-# write
-graph.SetName('graph')
-#canvas.Draw()  # use this line if you want to see the graph immediately.
-graph.Write()
-out_graph_file.Close()
-
-# END OF CODE
\ No newline at end of file
+        entry = json.loads(line)
+      except ValueError:  # cut by an interrupted run
+        continue
+      if entry.get('windows') == window_names:
+        cache[entry['file']] = entry
+  return cache
+
+# append the cache entry of a file as one JSON line, with a single write
+def append_cache(cache_file, entry):
+  fd = os.open(cache_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+  try:
+    os.write(fd, (json.dumps(entry) + '\n').encode())
+  finally:
+    os.close(fd)
+
+# rewrite the rate cache with the entries, under a temporary name
+def write_cache(cache_file, entries):
+  temporary = output_path + '.' + os.path.basename(cache_file)
+  with open(temporary, 'w') as outfile:
+    for entry in entries:
+      print(json.dumps(entry), file=outfile)
+  os.replace(temporary, cache_file)
+
+# record of a subrun, (run, subrun, mid_time, counts, subrunDuration)
+def make_record(run, subrun, counts, meta):
+  return run, subrun, meta['iEvtSec'] + meta['subrunDuration']/2., counts, meta['subrunDuration']
+
+# evaluate event rate (=event number / subrun duration) and its error of
+# every subrun, as NumPy arrays. The rate of a subrun of no duration is 0.
+def get_rate(nTotal_events, subrunDuration):
+  pct_of_full_subrun = subrunDuration / 7200
+  has_duration = pct_of_full_subrun != 0
+  safe_pct = numpy.where(has_duration, pct_of_full_subrun, 1)
+  event_rate = numpy.where(has_duration, nTotal_events / safe_pct, 0)
+  event_rate_err = numpy.where(has_duration, numpy.sqrt(nTotal_events) / safe_pct, 0)
+  return event_rate, event_rate_err
+
+# count events of every subrun of a crystal from the columnar dataset.
+# Return the list of the records.
+def count_columnar(xtal):
+  # read the subrun metadata and the events in every window of every subrun in bulk
+  dataset_path = dqc_io.get_columnar_path(home_directory, xtal)
+  subruns = dqc_io.read_columnar(dataset_path, 'subruns', ['run', 'subrun', 'iEvtSec', 'subrunDuration'])
+  events = dqc_io.read_columnar(dataset_path, 'events', ['run', 'subrun', 'energy'], energy_range=(energy_min, energy_max))
+
+  # count event number in each window of each subrun
+  event_keys = events['run'].astype(numpy.int64)*1000 + events['subrun']
+  event_counts = {}  # window name -> dict run*1000+subrun -> counts
+  for name, (low, high) in windows.items():
+    in_window = (events['energy'] >= low) & (events['energy'] <= high)
+    keys, counts = numpy.unique(event_keys[in_window], return_counts=True)
+    event_counts[name] = dict(zip(keys.tolist(), counts.tolist()))
+
+  records = []
+  for i in range(len(subruns['run'])):
+    run = int(subruns['run'][i])
+    subrun = int(subruns['subrun'][i])
+    meta = {'iEvtSec': int(subruns['iEvtSec'][i]), 'subrunDuration': int(subruns['subrunDuration'][i])}
+    counts = [event_counts[name].get(run*1000 + subrun, 0) for name in window_names]
+    records.append(make_record(run, subrun, counts, meta))
+  return records
+
+# count events of every subrun of a crystal from the summary records.
+# Return the list of the records.
+def count_summaries(xtal):
+  # the event number in each window is counted while trimming
+  records = []
+  for record in dqc_io.read_summaries(dqc_io.get_summary_path(home_directory, xtal)):
+    missing = [name for name in window_names if name not in record['windows']]
+    if len(missing) > 0:
+      print('NoWindow ', ','.join(missing), xtal, record['run'], record['subrun'], file=sys.stderr)
+      sys.exit(1)
+    records.append(make_record(record['run'], record['subrun'], [record['windows'][name] for name in window_names], record))
+  return records
+
+# make the rate store of a crystal from its records, in the order of run and
+# subrun. Return the structured array (see dqc_io.get_rate_store_file()).
+def make_rates(records):
+  records = sorted(records, key=lambda record: record[:2])
+  rates = numpy.zeros(len(records), dtype=dqc_io.get_rate_dtype(window_names))
+  rates['run'] = [record[0] for record in records]
+  rates['subrun'] = [record[1] for record in records]
+  rates['mid_time'] = [record[2] for record in records]
+  rates['duration'] = [record[4] for record in records]
+  counts = numpy.array([record[3] for record in records], dtype=numpy.int64).reshape(len(records), len(window_names))
+  for i, name in enumerate(window_names):
+    rates['counts_' + name] = counts[:, i]
+    rates['rate_' + name], rates['err_' + name] = get_rate(counts[:, i], rates['duration'])
+  return rates
+
+# write the csv file and the TGraph of the first window, as before the rate
+# store. They are written under temporary names and renamed, so that an
+# interrupted run never leaves them partially written.
+def export_rates(xtal, rates):
+  event_rate, event_rate_err = dqc_io.get_rate_columns(rates)
+
+  # write event rate into csv file
+  with open(output_path + '.RawRateTime_xtal{0}.csv'.format(xtal), 'w') as outfile:
+    for i in range(len(rates)):
+      print(rates['run'][i], rates['subrun'][i], rates['mid_time'][i], event_rate[i], event_rate_err[i], file=outfile, sep=',')
+  os.replace(output_path + '.RawRateTime_xtal{0}.csv'.format(xtal), output_path + 'RawRateTime_xtal{0}.csv'.format(xtal))
+
+  # create output root file to write TGraph instance
+  out_graph_file = ROOT.TFile(output_path + '.RateTime_xtal{0}.root'.format(xtal), 'recreate')
+  graph = ROOT.TGraphErrors(len(rates), numpy.ascontiguousarray(rates['mid_time']), numpy.ascontiguousarray(event_rate),
+                            numpy.zeros(len(rates)), numpy.ascontiguousarray(event_rate_err))
+
+  # write
+  graph.SetName('graph')
+  graph.Write()
+  out_graph_file.Close()
+  os.replace(output_path + '.RateTime_xtal{0}.root'.format(xtal), output_path + 'RateTime_xtal{0}.root'.format(xtal))
+
+
+# 2. Count events of every subrun of every crystal
+records = {xtal: [] for xtal in xtals}  # xtal -> list of the records
+if read_mode == 'columnar':
+  for xtal in xtals:
+    records[xtal] = count_columnar(xtal)
+
+elif read_mode == 'summary':
+  for xtal in xtals:
+    records[xtal] = count_summaries(xtal)
+
+elif options.incremental:
+  # count only the trimmed files new or changed since the cache entry
+  catalog = make_catalog(xtals)
+  caches = {xtal: read_cache(get_cache_file(xtal)) for xtal in xtals}
+  tasks = [(xtal, filename) for xtal in xtals for filename, key in catalog[xtal].items()
+           if filename not in caches[xtal] or caches[xtal][filename]['key'] != key]
+  print(sys.argv[0], 'files', len(tasks), sum(len(files) for files in catalog.values()), sep=',')
+  for xtal, filename, file_records in count_files(tasks, catalog):
+    caches[xtal][filename] = {'file': filename, 'key': catalog[xtal][filename], 'windows': window_names, 'records': file_records}
+    append_cache(get_cache_file(xtal), caches[xtal][filename])  # checkpoint
+
+  # the records of the current files only
+  for xtal in xtals:
+    entries = [caches[xtal][filename] for filename in catalog[xtal]]
+    for entry in entries:
+      records[xtal] += [tuple(record) for record in entry['records']]
+    write_cache(get_cache_file(xtal), entries)
+
+else:
+  # for each trimmed data file, per-subrun files or run files, and merge the
+  # records of every file
+  catalog = make_catalog(xtals)
+  tasks = [(xtal, filename) for xtal in xtals for filename in catalog[xtal]]
+  for xtal, filename, file_records in count_files(tasks, catalog):
+    records[xtal] += file_records
+
+# 3. Write event rate into the rate store, per crystal
+for xtal in xtals:
+  rates = make_rates(records[xtal])
+  dqc_io.write_rate_store(dqc_io.get_rate_store_file(home_directory, xtal), rates)
+  if options.export:
+    export_rates(xtal, rates)
+
+# END OF CODE
@@ -1,14 +1,15 @@
 #!/bin/bash
 #SBATCH -J perform_graph_rate_time
-#SBATCH --array=2,3,4,6,7
 #SBATCH --partition jepyc
+#SBATCH --cpus-per-task 64
 #SBATCH --time 99:00:00
 #SBATCH --output out/%x_%A.out
 #SBATCH --error out/%x_%A.err
 #SBATCH --open-mode append
 
-xtal=$SLURM_ARRAY_TASK_ID
+# record the rate of every good crystal in one job.
+# the trimmed files of every crystal are read by a process per allocated core.
 
 cd "$SLURM_SUBMIT_DIR" || exit
 
-python graph_rate_vs_time.py "$xtal"
+python graph_rate_vs_time.py all --workers 0 --incremental
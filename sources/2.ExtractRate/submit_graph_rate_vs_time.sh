@@ -11,9 +11,22 @@ mkdir -p "$SLURM_SUBMIT_DIR/out/"
 extr_job_id_file="$SLURM_SUBMIT_DIR/out/extr_job_id.txt"
 [ -e "$extr_job_id_file" ] && rm "$extr_job_id_file"  # remove if file exists
 
-trim_job_list_file="../4.TrimmingData/out/trim_job_list.txt"
-read -r trim_job_list < $trim_job_list_file  # read trim job ids
+# the trimming job ids are the arguments, e.g. the id printed by
+#     $ sbatch ../1.TrimmingData/submit_trim_singlehit.sh
+#     Submitted batch job 123456
+#     $ sbatch submit_graph_rate_vs_time.sh 123456
+# submit_trim_singlehit.sh waits for every trimming job it submits, so its own id is enough.
+# without arguments, the rate extracting job starts without dependency.
+# (run_pipeline.py runs the stages in order, without this script.)
+trim_job_list=""
+for trim_job_id in "$@"; do
+  trim_job_list="$trim_job_list:$trim_job_id"
+done
 
 # submit rate extracting job with dependency on the trimming data jobs
-JOB_ID=$(sbatch --parsable --dependency=afterok"$trim_job_list" perform_graph_rate_vs_time.sh)
+if [ -n "$trim_job_list" ]; then
+  JOB_ID=$(sbatch --parsable --dependency=afterok"$trim_job_list" perform_graph_rate_vs_time.sh)
+else
+  JOB_ID=$(sbatch --parsable perform_graph_rate_vs_time.sh)
+fi
 printf ":%s" "$JOB_ID" >> "$extr_job_id_file"  # save job id
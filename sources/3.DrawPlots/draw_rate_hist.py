@@ -4,7 +4,7 @@
 #            physmlee@gmail.com
 #
 # This script draws the distribution of number of events in each sub-run from
-# the file output by graph_rate_vs_time.py. Distribution then fit and
+# the rate store output by graph_rate_vs_time.py. Distribution then fit and
 # various exclusion levels / criteria are applied to idenfity bad sub-runs.
 # Also provides functionality to write output to database file, but not
 # currently used.
@@ -13,29 +13,40 @@
 # Find '# SETTING: directory' comments and modify directories.
 #
 # Usage
-#     (pyroot) $ python draw_rate_hist.py 'xtal' ('database_name')
+#     (pyroot) $ python draw_rate_hist.py 'xtal' ['window'] ('database_name')
 #             xtal: 2, 3, 4, 6 or 7
+#             window(optional): energy window of the rate store written by
+#                               graph_rate_vs_time.py (e.g. '2to6keV').
+#                               The first window of the rate store (1~6 keV
+#                               by default) if not given.
 #             database_name(optional, deprecated): database file name
 #                                                  ends with .db extension
 # Example
 #     (pyroot) $ python draw_rate_hist.py  2
 #             will draw the rate histogram of crystal 2.
+#     (pyroot) $ python draw_rate_hist.py  2 6to20keV
+#             will do the same in 6~20 keV. The window name is appended to
+#             the names of the plots and the bad sub-run lists.
 #
 # Update logs
 #  Changes suited for Olaf server.
+#  The energy window can be selected by name.
+#  The rate store is read instead of the csv file and the TGraph.
 ###############################################################################
 
 # 0. Prepare
 # import packages
 import ROOT
 import sys
-import csv
 import statistics as stats
 import math
 from scipy.stats import poisson
 from array import array
 import sqlite3
 import os
+import numpy
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import dqc_io
 
 # set Root
 ROOT.gStyle.SetOptStat(0)
@@ -64,25 +75,38 @@ def calc_chauvenet(nSubruns, mu):
   return k
 
 
+# define reader
+# read the rate store of the crystal in one call. Return (the rate store, the
+# rate and its error columns of the window, the window name).
+# window: energy window of the rate store, or None for its first window
+def read_rates(home_directory, xtal, window=None):
+  rates = dqc_io.read_rate_store(dqc_io.get_rate_store_file(home_directory, xtal))
+  try:
+    rate, rate_err = dqc_io.get_rate_columns(rates, window)
+  except KeyError:
+    print('NoWindow ', window, xtal, file=sys.stderr)
+    sys.exit(1)
+  return rates, rate, rate_err, window or dqc_io.get_rate_windows(rates)[0]
+
+
 # define printer
 # prints excluded subruns to stdout. Also writes to outfilename if provided
-def print_excluded_subruns(xtal, cutoff, conversion_factor_subrun, filename, outfilename=''):
-  with open(filename) as infile:
-    csv_data = csv.reader(infile, delimiter=',')
-    excluded_runs = []
-    excluded_subruns = []
-    if outfilename != '':
-      outfile = open(outfilename, 'w')
-    for row in csv_data:
-      if float(row[3])*conversion_factor_subrun >= cutoff:
-        output = str(row[0]) + '.' + str(row[1]).zfill(3) + ': ' + str(float(row[3])*conversion_factor_subrun)
-        print(output)
-        if outfilename != '':
-          outfile.write(output + '\n')  
-        excluded_runs.append(row[0])
-        excluded_subruns.append(row[1])
+# rates, rate: the rate store and the rate column of read_rates()
+def print_excluded_subruns(xtal, cutoff, conversion_factor_subrun, rates, rate, outfilename=''):
+  excluded_runs = []
+  excluded_subruns = []
+  if outfilename != '':
+    outfile = open(outfilename, 'w')
+  for i in numpy.flatnonzero(rate*conversion_factor_subrun >= cutoff):
+    run, subrun = str(rates['run'][i]), str(rates['subrun'][i])
+    output = run + '.' + subrun.zfill(3) + ': ' + str(float(rate[i])*conversion_factor_subrun)
+    print(output)
     if outfilename != '':
-      outfile.close()
+      outfile.write(output + '\n')  
+    excluded_runs.append(run)
+    excluded_subruns.append(subrun)
+  if outfilename != '':
+    outfile.close()
   
   return excluded_runs, excluded_subruns
 
@@ -91,10 +115,8 @@ def print_excluded_subruns(xtal, cutoff, conversion_factor_subrun, filename, out
 # color good subruns as blue and bad subruns as red
 # criteria is cutoff
 # return the colored graph
-def color_code_graph(filename, cutoff):
-  infile = ROOT.TFile(filename)
-  g_in = infile.Get('graph')
-  
+# rates, rate, rate_err: the rate store and the columns of read_rates()
+def color_code_graph(rates, rate, rate_err, cutoff):
   x_good = []
   y_good = []
   y_good_err = []
@@ -102,19 +124,20 @@ def color_code_graph(filename, cutoff):
   y_bad = []
   y_bad_err = []
 
-  x_graph = g_in.GetX()
-  y_graph = g_in.GetY()
-  for i in range(g_in.GetN()):
+  x_graph = rates['mid_time'].tolist()
+  y_graph = rate.tolist()
+  y_graph_err = rate_err.tolist()
+  for i in range(len(x_graph)):
     # Subtracting 788918400 to account for time offset
     #if y_graph[i] < cutoff:
     if y_graph[i] < cutoff:
       x_good.append(x_graph[i]-788918400)
       y_good.append(y_graph[i])
-      y_good_err.append(g_in.GetErrorY(i))
+      y_good_err.append(y_graph_err[i])
     else:
       x_bad.append(x_graph[i]-788918400)
       y_bad.append(y_graph[i])
-      y_bad_err.append(g_in.GetErrorY(i))
+      y_bad_err.append(y_graph_err[i])
   
   x_good_arr = array('d', x_good)
   y_good_arr = array('d', y_good)
@@ -187,29 +210,31 @@ def update_subrun(conn, xtal, task1, task2):
 def main():
   # 1. Prepare in main function
   xtal = int(sys.argv[1])  # first parameter
+  # energy window, optional second parameter
+  window = sys.argv[2] if len(sys.argv) > 2 and not sys.argv[2].endswith('.db') else None
+  suffix = '' if window is None else '_' + window  # of the output file names
   
   conversion_factor_subrun = 1  # Number is in counts
   
-  # set canvas and histogram
-  canvas = ROOT.TCanvas('c','c',800,600)
-  hist_min = 0
-  hist_maxes = [0, 0, 60, 60, 60, 200, 60, 60, 200]
-  hist = ROOT.TH1D('h','',hist_maxes[xtal]-hist_min, hist_min, hist_maxes[xtal])
-  
-  # 2. Read .csv Data File
+  # 2. Read the Rate Store
   # file path & name
   home_directory = './../../'  # SETTING: directory
-  filepath = home_directory + 'graphs/'
-  filename = filepath + f'RawRateTime_xtal{xtal}.csv'
   
   # read file
-  with open(filename) as infile:
-    csv_data = csv.reader(infile, delimiter=',')
-    rates = []
-    for row in csv_data:
-      if float(row[3]) != 0:
-        hist.Fill(float(row[3]) * conversion_factor_subrun)
-        rates.append(float(row[3]) * conversion_factor_subrun)
+  rate_store, rate, rate_err, window_name = read_rates(home_directory, xtal, window)
+  window_range = dqc_io.parse_energy_window(window_name)
+  rates = (rate[rate != 0] * conversion_factor_subrun).tolist()
+  
+  # set canvas and histogram
+  canvas = ROOT.TCanvas('c','c',800,600)
+  hist_min = 0
+  hist_maxes = [0, 0, 60, 60, 60, 200, 60, 60, 200]
+  hist_max = hist_maxes[xtal]
+  if window is not None:  # other windows may count more
+    hist_max = max(hist_max, int(3*stats.median(rates)) + 1)
+  hist = ROOT.TH1D('h','',hist_max-hist_min, hist_min, hist_max)
+  for value in rates:
+    hist.Fill(value)
   
   # 3. Analysis; Fit with Poissonian Function
   median = stats.median(rates)
@@ -248,7 +273,7 @@ def main():
   canvas.SetLogy(1)
   
   hist.GetXaxis().SetTitle('Counts per sub-run')
-  hist.SetTitle('Crystal {0} (1-6 keV)'.format(xtal))
+  hist.SetTitle('Crystal {0} ({1:g}-{2:g} keV)'.format(xtal, *window_range))
   hist.SetLineWidth(2)
   
   mu_line = ROOT.TLine(mu, 0., mu, hist.GetMaximum())
@@ -295,30 +320,30 @@ def main():
   # save plot
   plot_path = home_directory + 'plots/'
   os.makedirs(plot_path, exist_ok=True)
-  canvas.SaveAs(plot_path + 'RateHist_xtal{0}.pdf'.format(xtal))
+  canvas.SaveAs(plot_path + 'RateHist_xtal{0}{1}.pdf'.format(xtal, suffix))
   
   # 6. Exclude Bad Subruns & Print the Result
   result_path = home_directory + 'result/'
   os.makedirs(result_path, exist_ok=True)
 
   # Print out sub-runs whose rates exceed given CLs
-  outfile_99 = result_path + f'bad_subruns_999pct_xtal{xtal}.txt'
-  outfile_chauvenet = result_path + f'bad_subruns_chauvenet_xtal{xtal}.txt'
+  outfile_99 = result_path + f'bad_subruns_999pct_xtal{xtal}{suffix}.txt'
+  outfile_chauvenet = result_path + f'bad_subruns_chauvenet_xtal{xtal}{suffix}.txt'
   
   print('The following sub-runs exceed 3-sigma')
-  print_excluded_subruns(xtal, cutoff_3_sig, conversion_factor_subrun, filename)
+  print_excluded_subruns(xtal, cutoff_3_sig, conversion_factor_subrun, rate_store, rate)
   print('The following sub-runs exceed 99.9% CL')
-  excluded_runs, excluded_subruns = print_excluded_subruns(xtal, cutoff_99, conversion_factor_subrun, filename, outfile_99)
+  excluded_runs, excluded_subruns = print_excluded_subruns(xtal, cutoff_99, conversion_factor_subrun, rate_store, rate, outfile_99)
   print('The following sub-runs exceed 4-sigma')
-  print_excluded_subruns(xtal, cutoff_4_sig, conversion_factor_subrun, filename)
+  print_excluded_subruns(xtal, cutoff_4_sig, conversion_factor_subrun, rate_store, rate)
   print('The following sub-runs exceed 5-sigma')
-  print_excluded_subruns(xtal, cutoff_5_sig, conversion_factor_subrun, filename)
+  print_excluded_subruns(xtal, cutoff_5_sig, conversion_factor_subrun, rate_store, rate)
   print('The following sub-runs excluded by Chauvenet\'s criterion')
-  print_excluded_subruns(xtal, cutoff_chauvenet, conversion_factor_subrun, filename, outfile_chauvenet)
+  print_excluded_subruns(xtal, cutoff_chauvenet, conversion_factor_subrun, rate_store, rate, outfile_chauvenet)
   
   # 7. Draw Colored Subruns vs Time Graph
   # Draw graph with excluded sub-runs in red
-  colored_graph, (t_min, t_max) = color_code_graph(home_directory + f'graphs/RateTime_xtal{xtal}.root', cutoff_99)
+  colored_graph, (t_min, t_max) = color_code_graph(rate_store, rate, rate_err, cutoff_99)
   time_canvas = ROOT.TCanvas('c_t', 'c_t', 1600, 600)
   colored_graph.Draw('a')
   
@@ -336,13 +361,13 @@ def main():
   #time_canvas.Draw();input('Waiting')  # use this line if you want to see the graph immediately.
   
   # save plot
-  time_canvas.SaveAs(plot_path + 'ColoredRateHist_xtal{0}.pdf'.format(xtal))
+  time_canvas.SaveAs(plot_path + 'ColoredRateHist_xtal{0}{1}.pdf'.format(xtal, suffix))
   
   # !deprecated
   # 8. If a db file is passed in on command line, update it with sub-runs over
   # rate limit
-  if len(sys.argv)==3 and sys.argv[2].endswith('.db'):
-    database = sys.argv[2]
+  if len(sys.argv) > 2 and sys.argv[-1].endswith('.db'):
+    database = sys.argv[-1]
     conn = create_connection(database)
     with conn:
       for run, subrun in zip(excluded_runs, excluded_subruns):
@@ -3,21 +3,28 @@
 # Edited by: Seung-mok Lee 
 #            physmlee@gmail.com
 #
-# This helper script draws a preexisting TGraph with a human-readable x-axis.
+# This helper script draws the rate store with a human-readable x-axis.
 # Can draw graph in counts or dru (or other units).
 #
 #  Change output directories to your own directories.
 # Find '# SETTING: directory' comments and modify directories.
 #
 # Usage
-#     (pyroot) $ python draw_rate_vs_time.py 'xtal'
+#     (pyroot) $ python draw_rate_vs_time.py 'xtal' ['window']
 #             xtal: 2, 3, 4, 6 or 7
+#             window: energy window counted by graph_rate_vs_time.py
+#                     (e.g. '2to6keV'). The first window of the rate store
+#                     (1~6 keV by default) if not given.
 # Example
 #     (pyroot) $ python draw_rate_vs_time.py  2
 #             will draw the event rate vs time graph of crystal 2.
+#     (pyroot) $ python draw_rate_vs_time.py  2 6to20keV
+#             will do the same in 6~20 keV.
 #
 # Update logs
 #  Changes suited for Olaf server.
+#  The energy window can be selected by name.
+#  The rate store is read instead of the TGraph.
 ###############################################################################
 
 # 0. Prepare
@@ -25,11 +32,14 @@
 import ROOT
 import sys
 import os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import dqc_io
 
 xtal = int(sys.argv[1])  # first parameter
+window = sys.argv[2] if len(sys.argv) > 2 else None  # second parameter, optional
+suffix = '' if window is None else '_' + window  # of the output file name
 
 mass = [-1000000, 8.26, 9.15, 9.16, 18.01, 18.28, 12.5, 12.5, 18.28]  # crystal mass
-keV_window_width = 5.  # how many keV rate was integrated over
 
 # create output directory
 # if you encounter permission problem, change the output directory or its permission using chmod.
@@ -41,10 +51,17 @@ os.makedirs(plot_path, exist_ok=True)
 canvas = ROOT.TCanvas('c','c',1600,600)
 
 # 1. Read data
-infile = ROOT.TFile.Open(home_directory + f'graphs/RateTime_xtal{xtal}.root')
-in_graph = infile.graph
+rates = dqc_io.read_rate_store(dqc_io.get_rate_store_file(home_directory, xtal))
+try:
+  rate, rate_err = dqc_io.get_rate_columns(rates, window)
+except KeyError:
+  print('NoWindow ', window, xtal, file=sys.stderr)
+  sys.exit(1)
+low, high = dqc_io.parse_energy_window(window or dqc_io.get_rate_windows(rates)[0])
+keV_window_width = high - low  # how many keV rate was integrated over
 
-nPoints = in_graph.GetN()  # number of graph points
+mid_times = rates['mid_time'].tolist()
+nPoints = len(mid_times)  # number of graph points
 
 # 2. Convert rate to dru
 # convert number of events in 2 hours to dru
@@ -52,13 +69,13 @@ conversion_factor = 12/mass[xtal]/keV_window_width
 
 graph = ROOT.TGraphErrors()
 for i in range(nPoints):  # for each points,
-  if ROOT.TMath.AreEqualRel(0.0, in_graph.GetX()[i], 1e-6):
+  if ROOT.TMath.AreEqualRel(0.0, mid_times[i], 1e-6):
     pass
   else:
     # convert to ROOT time. ROOT time starts Jan 1, 1995
     # and convert rate to dru
-    graph.SetPoint(graph.GetN(), in_graph.GetX()[i]-788940000, in_graph.GetY()[i] * conversion_factor)
-    graph.SetPointError(graph.GetN()-1, 0, in_graph.GetEY()[i] * conversion_factor)
+    graph.SetPoint(graph.GetN(), mid_times[i]-788940000, float(rate[i]) * conversion_factor)
+    graph.SetPointError(graph.GetN()-1, 0, float(rate_err[i]) * conversion_factor)
 
 # 3. Set graph format
 graph.Draw('AP')
@@ -72,6 +89,6 @@ graph.SetTitle(f'Crystal {xtal} Rate vs. Time')
 
 # 4. Show and save
 #canvas.Draw();input('Waiting')  # use this line if you want to see the graph immediately.
-canvas.SaveAs(plot_path + f'RawRateTime_xtal{xtal}.pdf')
+canvas.SaveAs(plot_path + f'RawRateTime_xtal{xtal}{suffix}.pdf')
 
 # END OF CODE
\ No newline at end of file
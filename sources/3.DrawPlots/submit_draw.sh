@@ -8,7 +8,7 @@
 cd "$SLURM_SUBMIT_DIR" || exit
 mkdir -p "$SLURM_SUBMIT_DIR/out/"
 
-extr_job_id_file="../5.ExtractRate/out/extr_job_id.txt"
+extr_job_id_file="../2.ExtractRate/out/extr_job_id.txt"
 read -r extr_job_list < $extr_job_id_file  # read extract job id
 
 # submit draw job with dependency on the extract rate job
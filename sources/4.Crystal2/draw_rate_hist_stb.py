@@ -3,7 +3,7 @@
 #             physmlee@gmail.com
 #
 # This script draws the distribution of number of events in each sub-run from
-# the file output by graph_rate_vs_time.py, except for long instable period
+# the rate store output by graph_rate_vs_time.py, except for long instable period
 # specified in 'unstables' list. (find comment # NOTE: unstable periods)
 # Various exclusion levels / criteria are applied to idenfity bad sub-runs.
 # This script is for crystal 2.
@@ -12,20 +12,30 @@
 # Find '# SETTING: directory' comments and modify directories.
 #
 # Usage
-#     (pyroot) $ python draw_rate_hist_stb.py
+#     (pyroot) $ python draw_rate_hist_stb.py ['window']
+#             window(optional): energy window of the rate store written by
+#                               graph_rate_vs_time.py (e.g. '2to6keV').
+#                               The first window of the rate store (1~6 keV
+#                               by default) if not given.
+# Example
+#     (pyroot) $ python draw_rate_hist_stb.py 2to6keV
+#             will draw the rate histogram of crystal 2 in 2~6 keV. The window
+#             name is appended to the names of the plots and the bad sub-run
+#             lists.
 ###############################################################################
 
 # 0. Prepare
 # import packages
 import ROOT
 import sys
-import csv
 import statistics as stats
 import math
 from scipy.stats import poisson
-from array import array
 import sqlite3
 import os
+import numpy
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import dqc_io
 
 # set Root
 ROOT.gStyle.SetOptStat(0)
@@ -56,114 +66,71 @@ def calc_chauvenet(nSubruns, mu):
 
 # define printer
 # prints excluded subruns to stdout. Also writes to outfilename if provided
-def print_excluded_subruns(xtal, cutoff, conversion_factor_subrun, filename, outfilename=''):
-  with open(filename) as infile:
-    csv_data = csv.reader(infile, delimiter=',')
-    excluded_runs = []
-    excluded_subruns = []
+# rates, rate: the rate store and the rate column of its energy window
+# excluded: boolean mask of the sub-runs to print
+def print_subruns(conversion_factor_subrun, rates, rate, excluded, outfilename=''):
+  excluded_runs = []
+  excluded_subruns = []
+  if outfilename != '':
+    outfile = open(outfilename, 'w')
+  for i in numpy.flatnonzero(excluded):
+    run, subrun = str(rates['run'][i]), str(rates['subrun'][i])
+    output = run + '.' + subrun.zfill(3) + ': ' + str(float(rate[i])*conversion_factor_subrun)
+    print(output)
     if outfilename != '':
-      outfile = open(outfilename, 'w')
-    for row in csv_data:
-      if float(row[3])*conversion_factor_subrun >= cutoff:
-        output = str(row[0]) + '.' + str(row[1]).zfill(3) + ': ' + str(float(row[3])*conversion_factor_subrun)
-        print(output)
-        if outfilename != '':
-          outfile.write(output + '\n')  
-        excluded_runs.append(row[0])
-        excluded_subruns.append(row[1])
-    if outfilename != '':
-      outfile.close()
-  
+      outfile.write(output + '\n')  
+    excluded_runs.append(run)
+    excluded_subruns.append(subrun)
+  if outfilename != '':
+    outfile.close()
+
   return excluded_runs, excluded_subruns
 
 
-def print_excluded_subruns_period(xtal, cutoff, conversion_factor_subrun, filename, time_start, time_end, outfilename=''):
-  with open(filename) as infile:
-    csv_data = csv.reader(infile, delimiter=',')
-    excluded_runs = []
-    excluded_subruns = []
-    if outfilename != '':
-      outfile = open(outfilename, 'w')
-    for row in csv_data:
-      if float(row[3])*conversion_factor_subrun >= cutoff and float(row[2]) >= time_start and float(row[2]) <= time_end:
-        output = str(row[0]) + '.' + str(row[1]).zfill(3) + ': ' + str(float(row[3])*conversion_factor_subrun)
-        print(output)
-        if outfilename != '':
-          outfile.write(output + '\n')  
-        excluded_runs.append(row[0])
-        excluded_subruns.append(row[1])
-    if outfilename != '':
-      outfile.close()
-  
-  return excluded_runs, excluded_subruns
+# boolean mask of the sub-runs in any of the unstable periods
+def get_unstable(rates, unstables):
+  times = rates['mid_time']
+  unstable = numpy.zeros(len(times), dtype=bool)
+  for time_start, time_end in unstables:
+    unstable |= (times >= time_start) & (times <= time_end)
+  return unstable
 
 
-def print_excluded_subruns_stable(xtal, cutoff, conversion_factor_subrun, filename, unstables, outfilename=''):
-  with open(filename) as infile:
-    csv_data = csv.reader(infile, delimiter=',')
-    excluded_runs = []
-    excluded_subruns = []
-    if outfilename != '':
-      outfile = open(outfilename, 'w')
-    for row in csv_data:
-      time = float(row[2])
-      unstable = False
-      for time_start, time_end in unstables:
-        unstable = unstable or (time >= time_start and time <= time_end)
-      if float(row[3])*conversion_factor_subrun >= cutoff or unstable:
-        output = str(row[0]) + '.' + str(row[1]).zfill(3) + ': ' + str(float(row[3])*conversion_factor_subrun)
-        print(output)
-        if outfilename != '':
-          outfile.write(output + '\n')  
-        excluded_runs.append(row[0])
-        excluded_subruns.append(row[1])
-    if outfilename != '':
-      outfile.close()
-  
-  return excluded_runs, excluded_subruns
+# rates, rate: the rate store and the rate column of its energy window
+def print_excluded_subruns(xtal, cutoff, conversion_factor_subrun, rates, rate, outfilename=''):
+  excluded = rate*conversion_factor_subrun >= cutoff
+  return print_subruns(conversion_factor_subrun, rates, rate, excluded, outfilename)
+
+
+# rates, rate: the rate store and the rate column of its energy window
+def print_excluded_subruns_period(xtal, cutoff, conversion_factor_subrun, rates, rate, time_start, time_end, outfilename=''):
+  times = rates['mid_time']
+  excluded = (rate*conversion_factor_subrun >= cutoff) & (times >= time_start) & (times <= time_end)
+  return print_subruns(conversion_factor_subrun, rates, rate, excluded, outfilename)
+
+
+# rates, rate: the rate store and the rate column of its energy window
+def print_excluded_subruns_stable(xtal, cutoff, conversion_factor_subrun, rates, rate, unstables, outfilename=''):
+  excluded = (rate*conversion_factor_subrun >= cutoff) | get_unstable(rates, unstables)
+  return print_subruns(conversion_factor_subrun, rates, rate, excluded, outfilename)
 
 
 # define color painter
 # color good subruns as blue and bad subruns as red
-# criteria is cutoff
+# good: boolean mask of the good sub-runs
 # return the colored graph
-def color_code_graph(filename, cutoff):
-  infile = ROOT.TFile(filename)
-  g_in = infile.Get('graph')
-  
-  x_good = []
-  y_good = []
-  y_good_err = []
-  x_bad = []
-  y_bad = []
-  y_bad_err = []
-  
-  x_graph = g_in.GetX()
-  y_graph = g_in.GetY()
-  for i in range(g_in.GetN()):
-    # Subtracting 788918400 to account for time offset
-    #if y_graph[i] < cutoff:
-    if y_graph[i] < cutoff:
-      x_good.append(x_graph[i]-788918400)
-      y_good.append(y_graph[i])
-      y_good_err.append(g_in.GetErrorY(i))
-    else:
-      x_bad.append(x_graph[i]-788918400)
-      y_bad.append(y_graph[i])
-      y_bad_err.append(g_in.GetErrorY(i))
-  
-  x_good_arr = array('d', x_good)
-  y_good_arr = array('d', y_good)
-  x_good_err_arr = array('d', [0]*len(x_good))
-  y_good_err_arr = array('d', y_good_err)
-  x_bad_arr = array('d', x_bad)
-  y_bad_arr = array('d', y_bad)
-  x_bad_err_arr = array('d', [0]*len(x_bad))
-  y_bad_err_arr = array('d', y_bad_err)
-  g_good = ROOT.TGraphErrors( len(x_good), x_good_arr, y_good_arr,
-                x_good_err_arr, y_good_err_arr )
-  g_bad = ROOT.TGraphErrors( len(x_bad), x_bad_arr, y_bad_arr,
-                x_bad_err_arr, y_bad_err_arr )
+# rates, rate, rate_err: the rate store and the columns of its energy window
+def color_graph(rates, rate, rate_err, good):
+  # Subtracting 788918400 to account for time offset
+  x_graph = numpy.asarray(rates['mid_time'], dtype='d') - 788918400.
+  y_graph = numpy.asarray(rate, dtype='d')
+  y_graph_err = numpy.asarray(rate_err, dtype='d')
+  bad = ~good
+
+  g_good = ROOT.TGraphErrors( int(good.sum()), x_graph[good], y_graph[good],
+                numpy.zeros(int(good.sum())), y_graph_err[good] )
+  g_bad = ROOT.TGraphErrors( int(bad.sum()), x_graph[bad], y_graph[bad],
+                numpy.zeros(int(bad.sum())), y_graph_err[bad] )
   
   g_good.SetMarkerColor(ROOT.kBlue)
   g_bad.SetMarkerColor(ROOT.kRed)
@@ -173,66 +140,22 @@ def color_code_graph(filename, cutoff):
   g_total.Add(g_good, 'p*')
   g_total.Add(g_bad, 'p*')
   
-  x_i = x_graph[0] - 788918400
-  x_f = x_graph[-1] - 788918400
+  x_i = x_graph[0]
+  x_f = x_graph[-1]
   
   return g_total, (x_i, x_f)
 
 
-def color_code_graph_stable(filename, cutoff, unstables):
-  infile = ROOT.TFile(filename)
-  g_in = infile.Get('graph')
-  
-  x_good = []
-  y_good = []
-  y_good_err = []
-  x_bad = []
-  y_bad = []
-  y_bad_err = []
-  
-  x_graph = g_in.GetX()
-  y_graph = g_in.GetY()
-  for i in range(g_in.GetN()):
-    # Subtracting 788918400 to account for time offset
-    time = x_graph[i]
-    unstable = False
-    for time_start, time_end in unstables:
-      unstable = unstable or (time >= time_start and time <= time_end)
-    
-    if y_graph[i] < cutoff and not unstable:
-      x_good.append(x_graph[i]-788918400)
-      y_good.append(y_graph[i])
-      y_good_err.append(g_in.GetErrorY(i))
-    else:
-      x_bad.append(x_graph[i]-788918400)
-      y_bad.append(y_graph[i])
-      y_bad_err.append(g_in.GetErrorY(i))
-  
-  x_good_arr = array('d', x_good)
-  y_good_arr = array('d', y_good)
-  x_good_err_arr = array('d', [0]*len(x_good))
-  y_good_err_arr = array('d', y_good_err)
-  x_bad_arr = array('d', x_bad)
-  y_bad_arr = array('d', y_bad)
-  x_bad_err_arr = array('d', [0]*len(x_bad))
-  y_bad_err_arr = array('d', y_bad_err)
-  g_good = ROOT.TGraphErrors( len(x_good), x_good_arr, y_good_arr,
-                x_good_err_arr, y_good_err_arr )
-  g_bad = ROOT.TGraphErrors( len(x_bad), x_bad_arr, y_bad_arr,
-                x_bad_err_arr, y_bad_err_arr )
-  
-  g_good.SetMarkerColor(ROOT.kBlue)
-  g_bad.SetMarkerColor(ROOT.kRed)
-  g_good.SetLineColor(ROOT.kBlue)
-  g_bad.SetLineColor(ROOT.kRed)
-  g_total = ROOT.TMultiGraph()
-  g_total.Add(g_good, 'p*')
-  g_total.Add(g_bad, 'p*')
-  
-  x_i = x_graph[0] - 788918400
-  x_f = x_graph[-1] - 788918400
-  
-  return g_total, (x_i, x_f)
+# criteria is cutoff
+# rates, rate, rate_err: the rate store and the columns of its energy window
+def color_code_graph(rates, rate, rate_err, cutoff):
+  return color_graph(rates, rate, rate_err, rate < cutoff)
+
+
+# criteria is cutoff and the unstable periods
+# rates, rate, rate_err: the rate store and the columns of its energy window
+def color_code_graph_stable(rates, rate, rate_err, cutoff, unstables):
+  return color_graph(rates, rate, rate_err, (rate < cutoff) & ~get_unstable(rates, unstables))
 
 
 # define sqlite database writer functions
@@ -281,38 +204,36 @@ xtal = 2  # first parameter
 unstables = [
   (1587218412.0, 1589731377.0)
 ]  # NOTE: unstable periods
+# energy window, optional parameter
+window = sys.argv[1] if len(sys.argv) > 1 else None
+suffix = '' if window is None else '_' + window  # of the output file names
 
 conversion_factor_subrun = 1  # Number is in counts
 
+# 2. Read the Rate Store
+# file path & name
+home_directory = './../../'  # SETTING: directory
+store = dqc_io.read_rate_store(dqc_io.get_rate_store_file(home_directory, xtal))
+try:
+  rate, rate_err = dqc_io.get_rate_columns(store, window)
+except KeyError:
+  print('NoWindow ', window, xtal, file=sys.stderr)
+  sys.exit(1)
+window_range = dqc_io.parse_energy_window(window or dqc_io.get_rate_windows(store)[0])
+
+# select the sub-runs out of the unstable periods
+rates = (rate[(rate != 0) & ~get_unstable(store, unstables)] * conversion_factor_subrun).tolist()
+
 # set canvas and histogram
 canvas = ROOT.TCanvas('c','c',800,600)
 hist_min = 0
 hist_maxes = [0, 0, 60, 60, 60, 200, 60, 60, 200]
-hist = ROOT.TH1D('h','',hist_maxes[xtal]-hist_min, hist_min, hist_maxes[xtal])
-
-# 2. Read .csv Data File
-# file path & name
-home_directory = './../../'  # SETTING: directory
-filepath = home_directory + 'graphs/'
-filename = filepath + f'RawRateTime_xtal{xtal}.csv'
-
-# read file
-with open(filename) as infile:
-  csv_data = csv.reader(infile, delimiter=',')
-  rates = []
-  times = []
-  for row in csv_data:
-    time = float(row[2])
-    rate = float(row[3])
-    
-    unstable = False
-    for time_start, time_end in unstables:
-      unstable = unstable or (time >= time_start and time <= time_end)
-    
-    if rate != 0 and not unstable:
-      _=hist.Fill(rate * conversion_factor_subrun)
-      rates.append(rate * conversion_factor_subrun)
-      times.append(time)
+hist_max = hist_maxes[xtal]
+if window is not None:  # other windows may count more
+  hist_max = max(hist_max, int(3*stats.median(rates)) + 1)
+hist = ROOT.TH1D('h','',hist_max-hist_min, hist_min, hist_max)
+for value in rates:
+  _=hist.Fill(value)
 
 # 3. Analysis; Fit with Poissonian Function
 median = stats.median(rates)
@@ -351,7 +272,7 @@ fxn.Draw('same')
 canvas.SetLogy(1)
 
 hist.GetXaxis().SetTitle('Counts per sub-run')
-hist.SetTitle('Crystal {0} (1-6 keV)'.format(xtal))
+hist.SetTitle('Crystal {0} ({1:g}-{2:g} keV)'.format(xtal, *window_range))
 hist.SetLineWidth(2)
 
 mu_line = ROOT.TLine(mu, 0., mu, hist.GetMaximum())
@@ -398,7 +319,7 @@ print(f'The Chauvenet count cutoff is {cutoff_chauvenet} counts')
 # save plot
 plot_path = home_directory + 'plots/'
 os.makedirs(plot_path, exist_ok=True)
-hist_plot_name = f'StableRateHist_xtal{xtal}.pdf'
+hist_plot_name = f'StableRateHist_xtal{xtal}{suffix}.pdf'
 canvas.SaveAs(plot_path + hist_plot_name)
 
 # 6. Exclude Bad Subruns & Print the Result
@@ -406,23 +327,23 @@ result_path = home_directory + 'result/'
 os.makedirs(result_path, exist_ok=True)
 
 # Print out sub-runs whose rates exceed given CLs
-outfile_99 = result_path + f'stb_bad_subruns_999pct_xtal{xtal}.txt'
-outfile_chauvenet = result_path + f'stb_bad_subruns_chauvenet_xtal{xtal}.txt'
+outfile_99 = result_path + f'stb_bad_subruns_999pct_xtal{xtal}{suffix}.txt'
+outfile_chauvenet = result_path + f'stb_bad_subruns_chauvenet_xtal{xtal}{suffix}.txt'
 
 print('The following sub-runs exceed 3-sigma')
-print_excluded_subruns_stable(xtal, cutoff_3_sig, conversion_factor_subrun, filename, unstables)
+print_excluded_subruns_stable(xtal, cutoff_3_sig, conversion_factor_subrun, store, rate, unstables)
 print('The following sub-runs exceed 99.9% CL')
-excluded_runs, excluded_subruns = print_excluded_subruns_stable(xtal, cutoff_99, conversion_factor_subrun, filename, unstables, outfile_99)
+excluded_runs, excluded_subruns = print_excluded_subruns_stable(xtal, cutoff_99, conversion_factor_subrun, store, rate, unstables, outfile_99)
 print('The following sub-runs exceed 4-sigma')
-print_excluded_subruns_stable(xtal, cutoff_4_sig, conversion_factor_subrun, filename, unstables)
+print_excluded_subruns_stable(xtal, cutoff_4_sig, conversion_factor_subrun, store, rate, unstables)
 print('The following sub-runs exceed 5-sigma')
-print_excluded_subruns_stable(xtal, cutoff_5_sig, conversion_factor_subrun, filename, unstables)
+print_excluded_subruns_stable(xtal, cutoff_5_sig, conversion_factor_subrun, store, rate, unstables)
 print('The following sub-runs excluded by Chauvenet\'s criterion')
-print_excluded_subruns_stable(xtal, cutoff_chauvenet, conversion_factor_subrun, filename, unstables, outfile_chauvenet)
+print_excluded_subruns_stable(xtal, cutoff_chauvenet, conversion_factor_subrun, store, rate, unstables, outfile_chauvenet)
 
 # 7. Draw Colored Subruns vs Time Graph
 # Draw graph with excluded sub-runs in red
-colored_graph, (t_min, t_max) = color_code_graph(home_directory + f'graphs/RateTime_xtal{xtal}.root', cutoff_99)
+colored_graph, (t_min, t_max) = color_code_graph(store, rate, rate_err, cutoff_99)
 time_canvas = ROOT.TCanvas('c_t', 'c_t', 1600, 600)
 colored_graph.Draw('a')
 
@@ -440,7 +361,7 @@ time_canvas.Update()
 #time_canvas.Draw();input('Waiting')  # use this line if you want to see the graph immediately.
 
 # save plot
-time_plot_name = f'StbColoredRateHist_xtal{xtal}.pdf'
+time_plot_name = f'StbColoredRateHist_xtal{xtal}{suffix}.pdf'
 time_canvas.SaveAs(plot_path + time_plot_name)
 
 # END
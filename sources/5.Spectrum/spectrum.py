@@ -15,33 +15,51 @@
 # 1544.123: 24.0
 # 
 # The bad sub-run list file name format is 'bad_subruns_999pct_xtal#.txt', 
-# where # is the crystal number.
+# where # is the crystal number, or 'bad_subruns_999pct_xtal#_window.txt' for
+# the energy window 'window' (see 3.DrawPlots/draw_rate_hist.py).
 #
 #  Change output directories to your own directories.
 #  Change final result directory & file name for you.
 # Find '# SETTING: directory' comments and modify directories.
 #
 # Usage
-#     (pyroot) $ python spectrum.py 'xtal'
+#     (pyroot) $ python spectrum.py 'xtal' ['read_mode'] ['window']
 #             xtal: 2, 3, 4, 6 or 7
+#             read_mode: 'root' (default) reads every trimmed ROOT file,
+#                        'columnar' reads the Parquet dataset written by
+#                        'perform_trim.py --columnar' in bulk
+#             window: energy window of the spectrum and of the bad sub-run
+#                     list (e.g. '2to6keV'). 1~6 keV if not given.
 # Example
 #     (pyroot) $ python spectrum.py  2
 #             will draw the spectrum of crystal 2.
+#     (pyroot) $ python spectrum.py  2 root 6to20keV
+#             will draw the spectrum of crystal 2 in 6~20 keV, with the bad
+#             sub-runs found in 6~20 keV.
 ###############################################################################
 
 # %%0. Prepare
 # import packages
 import os
 import sys
+import numpy
 import ROOT
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import dqc_io
 
 # %% set root, make TCanvas and spectrum (TH1D) instances
 ROOT.gROOT.SetBatch(1)
 xtal = sys.argv[1]  # first parameter
+read_mode = sys.argv[2] if len(sys.argv) > 2 else 'root'  # second parameter, optional
+window = sys.argv[3] if len(sys.argv) > 3 else None  # third parameter, optional
+assert read_mode in ['root', 'columnar']
+suffix = '' if window is None else '_' + window  # of the file names
 
 canvas = ROOT.TCanvas('c', 'c', 1000, 600)
 spectrum_min = 1.  # keV
 spectrum_max = 6.  # keV
+if window is not None:
+  spectrum_min, spectrum_max = dqc_io.parse_energy_window(window)
 spectrum_bin_size = 0.25  # keV
 spectrum_good = ROOT.TH1D('good', f'Crystal {xtal} Spectrum (Normed)', int((spectrum_max - spectrum_min) /
                           spectrum_bin_size), spectrum_min, spectrum_max)
@@ -59,7 +77,7 @@ output_path = home_directory + 'spectrum/'
 # Read bad sub-run list
 # SETTING: final result
 bad_sub_path = home_directory + 'BadCandidates/'
-bad_sub_name = 'bad_subruns_999pct_xtal{}.txt'.format(xtal)
+bad_sub_name = 'bad_subruns_999pct_xtal{}{}.txt'.format(xtal, suffix)
 bad_sub_file = open(bad_sub_path + bad_sub_name, "r")
 
 # the tuple (run, sub-run) of bad sub-runs are in list 'bad_subs'
@@ -70,33 +88,36 @@ for line in bad_sub_file:
   bad_subs.append((run, sub))
 
 # 2. Read data and stack histogram
-filenamelist = sorted(os.listdir(trimmed_path))
-filenum = len(filenamelist)
-for fileidx, filename in enumerate(filenamelist):
-  print(fileidx, ' / ', filenum)
+if read_mode == 'columnar':
+  # read the events in the window of every sub-run in bulk
+  events = dqc_io.read_columnar(dqc_io.get_columnar_path(home_directory, xtal), 'events',
+                                ['run', 'subrun', 'energy'], energy_range=(spectrum_min, spectrum_max))
+  bad = numpy.isin(events['run'].astype(numpy.int64)*1000 + events['subrun'],
+                   [int(run)*1000 + int(sub) for run, sub in bad_subs])
+  for spectrum, selected in ((spectrum_bad, bad), (spectrum_good, ~bad)):
+    energy = numpy.ascontiguousarray(events['energy'][selected], dtype=numpy.float64)
+    spectrum.FillN(len(energy), energy, numpy.ones(len(energy)))
+else:
+  # for each sub-run of the trimmed data files, per-subrun files or run files
+  for run, subrun, tree, firstEntry, meta in dqc_io.iter_subruns(ROOT, trimmed_path):
+    print(run, subrun)
+
+    # select spectrum to write
+    run = str(run)
+    sub = '{:03d}'.format(subrun)
+    spectrum = spectrum_bad if (run, sub) in bad_subs else spectrum_good
   
-  # if file smaller than 10kB, it is probably empty or processed incorrectly, so skip
-  if os.path.getsize(trimmed_path + filename) <= 10000:
-    continue
+    # skip the sub-run without trimmed event, reading the metadata only
+    if meta['nEntries'] == 0:
+      continue
   
-  # select spectrum to write
-  run = filename[8:12]
-  sub = filename[-3:]
-  spectrum = spectrum_bad if (run, sub) in bad_subs else spectrum_good
-  
-  # open the data file
-  data_file = ROOT.TFile(trimmed_path + filename)  # read file
-  tree = data_file.Get('ntp')  # read tree
-  
-  try:
-    tree.Draw('crystal{0}.energy>>'.format(xtal) + spectrum_this, 'crystal{0}.energy >= 1 && crystal{0}.energy <= 6'.format(xtal), 'gOff')
-    this = ROOT.gDirectory.Get("this")
-    spectrum.Add(this)
-  except:
-    print('histogram error for {run}.{sub}'.format(run=run, sub=sub))
-  
-  # close
-  data_file.Close()
+    try:
+      tree.Draw('crystal{0}.energy>>'.format(xtal) + spectrum_this, 'crystal{0}.energy >= {1} && crystal{0}.energy <= {2}'.format(xtal, spectrum_min, spectrum_max), 'gOff',
+                meta['nEntries'], firstEntry)
+      this = ROOT.gDirectory.Get("this")
+      spectrum.Add(this)
+    except:
+      print('histogram error for {run}.{sub}'.format(run=run, sub=sub))
 
 # 3. Draw spectrums and save
 good_max = spectrum_good.GetMaximum()
@@ -145,10 +166,10 @@ canvas.Update()
 # create output directory
 # if you encounter permission problem, change the output directory or its permission using chmod.
 os.makedirs(output_path, exist_ok=True)
-canvas.SaveAs(output_path + 'Spectrum_xtal{0}.pdf'.format(xtal))
+canvas.SaveAs(output_path + 'Spectrum_xtal{0}{1}.pdf'.format(xtal, suffix))
 
 # create output root file
-out_root_file = ROOT.TFile(output_path + 'Spectrum_xtal{0}.root'.format(xtal), 'recreate')
+out_root_file = ROOT.TFile(output_path + 'Spectrum_xtal{0}{1}.root'.format(xtal, suffix), 'recreate')
 
 # write
 spectrum_good.SetName('good')
@@ -20,7 +20,10 @@
 # Find '# SETTING: directory' comments and modify directories.
 #
 # Usage
-#     (pyroot) $ python spectrum_c7_1544.py
+#     (pyroot) $ python spectrum_c7_1544.py ['read_mode']
+#             read_mode: 'root' (default) reads every trimmed ROOT file,
+#                        'columnar' reads the Parquet dataset written by
+#                        'perform_trim.py --columnar' in bulk
 # Example
 #     (pyroot) $ python spectrum_c7_1544.py
 #             will draw the spectrum of crystal 7, sub-run 1544.521~522.
@@ -29,11 +32,17 @@
 # 0. Prepare
 # import packages
 import os
+import sys
+import numpy
 import ROOT
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import dqc_io
 
 # set root, make TCanvas and spectrum (TH1D) instances
 ROOT.gROOT.SetBatch(1)
 xtal = '7'
+read_mode = sys.argv[1] if len(sys.argv) > 1 else 'root'  # first parameter, optional
+assert read_mode in ['root', 'columnar']
 
 canvas = ROOT.TCanvas('c', 'c', 1000, 600)
 spectrum_min = 1.  # keV
@@ -74,35 +83,32 @@ spectrum_file = ROOT.TFile(output_path + spectrum_file_name)
 spectrum_good = spectrum_file.Get('good')
 
 # 2. Read data and stack histogram
-filenamelist = sorted(os.listdir(trimmed_path))
-filenum = len(filenamelist)
-for fileidx, filename in enumerate(filenamelist):
-  print(fileidx, ' / ', filenum)
-  
-  # if file smaller than 10kB, it is probably empty or processed incorrectly, so skip
-  if os.path.getsize(trimmed_path + filename) <= 10000:
-    continue
-  
-  # select spectrum to write
-  run = filename[8:12]
-  sub = filename[-3:]
-  
-  if (run, sub) not in bad_subs:
-    continue
-  
-  # open the data file
-  data_file = ROOT.TFile(trimmed_path + filename)  # read file
-  tree = data_file.Get('ntp')  # read tree
+if read_mode == 'columnar':
+  # read the events in 1~6 keV of every sub-run in bulk
+  events = dqc_io.read_columnar(dqc_io.get_columnar_path(home_directory, xtal), 'events',
+                                ['run', 'subrun', 'energy'], energy_range=(spectrum_min, spectrum_max))
+  bad = numpy.isin(events['run'].astype(numpy.int64)*1000 + events['subrun'],
+                   [int(run)*1000 + int(sub) for run, sub in bad_subs])
+  energy = numpy.ascontiguousarray(events['energy'][bad], dtype=numpy.float64)
+  spectrum_bad.FillN(len(energy), energy, numpy.ones(len(energy)))
+else:
+  # for each bad sub-run of the trimmed data files, per-subrun files or run files
+  for run, subrun, tree, firstEntry, meta in dqc_io.iter_subruns(ROOT, trimmed_path, {(int(run), int(sub)) for run, sub in bad_subs}):
+    print(run, subrun)
+    run = str(run)
+    sub = '{:03d}'.format(subrun)
   
-  try:
-    tree.Draw('crystal{0}.energy>>'.format(xtal) + spectrum_this, 'crystal{0}.energy >= 1 && crystal{0}.energy <= 6'.format(xtal), 'gOff')
-    this = ROOT.gDirectory.Get("this")
-    spectrum_bad.Add(this)
-  except:
-    print('histogram error for {run}.{sub}'.format(run=run, sub=sub))
+    # skip the sub-run without trimmed event, reading the metadata only
+    if meta['nEntries'] == 0:
+      continue
   
-  # close
-  data_file.Close()
+    try:
+      tree.Draw('crystal{0}.energy>>'.format(xtal) + spectrum_this, 'crystal{0}.energy >= 1 && crystal{0}.energy <= 6'.format(xtal), 'gOff',
+                meta['nEntries'], firstEntry)
+      this = ROOT.gDirectory.Get("this")
+      spectrum_bad.Add(this)
+    except:
+      print('histogram error for {run}.{sub}'.format(run=run, sub=sub))
 
 # 3. Draw spectrums and save
 good_max = spectrum_good.GetMaximum()
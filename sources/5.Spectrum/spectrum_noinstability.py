@@ -11,6 +11,9 @@
 # without long term instabile period.
 # You must run 'spectrum.py' code before run this code, to generate the 
 # spectrum for good sub-runs.
+# With an energy window, the bad sub-run list file name is
+# 'noinstability_xtal#_window.txt', and the good spectrum is read from the
+# output of 'spectrum.py' in the same window.
 # 
 # Your bad sub-run list file should fowwlow the following format
 # ####.@@@: ~~~~~~
@@ -25,8 +28,13 @@
 # Find '# SETTING: directory' comments and modify directories.
 #
 # Usage
-#     (pyroot) $ python spectrum_noinstability.py 'xtal'
+#     (pyroot) $ python spectrum_noinstability.py 'xtal' ['read_mode'] ['window']
 #             xtal: 2 or 7
+#             read_mode: 'root' (default) reads every trimmed ROOT file,
+#                        'columnar' reads the Parquet dataset written by
+#                        'perform_trim.py --columnar' in bulk
+#             window: energy window of the spectrum and of the bad sub-run
+#                     list (e.g. '2to6keV'). 1~6 keV if not given.
 # Example
 #     (pyroot) $ python spectrum_noinstability.py  2
 #             will draw the spectrum of crystal 2.
@@ -36,15 +44,24 @@
 # import packages
 import os
 import sys
+import numpy
 import ROOT
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import dqc_io
 
 # set root, make TCanvas and spectrum (TH1D) instances
 ROOT.gROOT.SetBatch(1)
 xtal = sys.argv[1]  # first parameter
+read_mode = sys.argv[2] if len(sys.argv) > 2 else 'root'  # second parameter, optional
+window = sys.argv[3] if len(sys.argv) > 3 else None  # third parameter, optional
+assert read_mode in ['root', 'columnar']
+suffix = '' if window is None else '_' + window  # of the file names
 
 canvas = ROOT.TCanvas('c', 'c', 1000, 600)
 spectrum_min = 1.  # keV
 spectrum_max = 6.  # keV
+if window is not None:
+  spectrum_min, spectrum_max = dqc_io.parse_energy_window(window)
 spectrum_bin_size = 0.25  # keV
 spectrum_bad = ROOT.TH1D('bad_no_instability', f'Crystal {xtal} Spectrum (Normed)', int((spectrum_max - spectrum_min) /
                          spectrum_bin_size), spectrum_min, spectrum_max)
@@ -60,7 +77,7 @@ output_path = home_directory + 'spectrum/'
 # Read bad sub-run list
 # SETTING: final result
 bad_sub_path = home_directory + 'BadCandidates/'
-bad_sub_name = 'noinstability_xtal{}.txt'.format(xtal)
+bad_sub_name = 'noinstability_xtal{}{}.txt'.format(xtal, suffix)
 bad_sub_file = open(bad_sub_path + bad_sub_name, "r")
 
 # the tuple (run, sub-run) of bad sub-runs are in list 'bad_subs'
@@ -71,40 +88,37 @@ for line in bad_sub_file:
   bad_subs.append((run, sub))
 
 # Read existing spectrum
-spectrum_file_name = 'Spectrum_xtal{}.root'.format(xtal)
+spectrum_file_name = 'Spectrum_xtal{}{}.root'.format(xtal, suffix)
 spectrum_file = ROOT.TFile(output_path + spectrum_file_name)
 spectrum_good = spectrum_file.Get('good')
 
 # 2. Read data and stack histogram
-filenamelist = sorted(os.listdir(trimmed_path))
-filenum = len(filenamelist)
-for fileidx, filename in enumerate(filenamelist):
-  print(fileidx, ' / ', filenum)
+if read_mode == 'columnar':
+  # read the events in the window of every sub-run in bulk
+  events = dqc_io.read_columnar(dqc_io.get_columnar_path(home_directory, xtal), 'events',
+                                ['run', 'subrun', 'energy'], energy_range=(spectrum_min, spectrum_max))
+  bad = numpy.isin(events['run'].astype(numpy.int64)*1000 + events['subrun'],
+                   [int(run)*1000 + int(sub) for run, sub in bad_subs])
+  energy = numpy.ascontiguousarray(events['energy'][bad], dtype=numpy.float64)
+  spectrum_bad.FillN(len(energy), energy, numpy.ones(len(energy)))
+else:
+  # for each bad sub-run of the trimmed data files, per-subrun files or run files
+  for run, subrun, tree, firstEntry, meta in dqc_io.iter_subruns(ROOT, trimmed_path, {(int(run), int(sub)) for run, sub in bad_subs}):
+    print(run, subrun)
+    run = str(run)
+    sub = '{:03d}'.format(subrun)
   
-  # if file smaller than 10kB, it is probably empty or processed incorrectly, so skip
-  if os.path.getsize(trimmed_path + filename) <= 10000:
-    continue
+    # skip the sub-run without trimmed event, reading the metadata only
+    if meta['nEntries'] == 0:
+      continue
   
-  # select spectrum to write
-  run = filename[8:12]
-  sub = filename[-3:]
-  
-  if (run, sub) not in bad_subs:
-    continue
-  
-  # open the data file
-  data_file = ROOT.TFile(trimmed_path + filename)  # read file
-  tree = data_file.Get('ntp')  # read tree
-  
-  try:
-    tree.Draw('crystal{0}.energy>>'.format(xtal) + spectrum_this, 'crystal{0}.energy >= 1 && crystal{0}.energy <= 6'.format(xtal), 'gOff')
-    this = ROOT.gDirectory.Get("this")
-    spectrum_bad.Add(this)
-  except:
-    print('histogram error for {run}.{sub}'.format(run=run, sub=sub))
-  
-  # close
-  data_file.Close()
+    try:
+      tree.Draw('crystal{0}.energy>>'.format(xtal) + spectrum_this, 'crystal{0}.energy >= {1} && crystal{0}.energy <= {2}'.format(xtal, spectrum_min, spectrum_max), 'gOff',
+                meta['nEntries'], firstEntry)
+      this = ROOT.gDirectory.Get("this")
+      spectrum_bad.Add(this)
+    except:
+      print('histogram error for {run}.{sub}'.format(run=run, sub=sub))
 
 # 3. Draw spectrums and save
 good_max = spectrum_good.GetMaximum()
@@ -153,10 +167,10 @@ canvas.Update()
 # create output directory
 # if you encounter permission problem, change the output directory or its permission using chmod.
 os.makedirs(output_path, exist_ok=True)
-canvas.SaveAs(output_path + 'Spectrum_no_instability_xtal{0}.pdf'.format(xtal))
+canvas.SaveAs(output_path + 'Spectrum_no_instability_xtal{0}{1}.pdf'.format(xtal, suffix))
 
 # create output root file
-out_root_file = ROOT.TFile(output_path + 'Spectrum_no_instability_xtal{0}.root'.format(xtal), 'recreate')
+out_root_file = ROOT.TFile(output_path + 'Spectrum_no_instability_xtal{0}{1}.root'.format(xtal, suffix), 'recreate')
 
 # write
 spectrum_good.SetName('good')
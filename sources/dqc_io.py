@@ -0,0 +1,289 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+#  Helper functions to read the trimmed data files, shared by the analysis
+# stages. Import it from a script in a stage directory (e.g. 2.ExtractRate)
+# with
+#     sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+#     import dqc_io
+###############################################################################
+
+# Import packages
+import os
+import sys
+
+# Names of the values stored in the 'meta' tree of a trimmed file
+meta_names = ['iEvtSec', 'fEvtSec', 'subrunDuration', 'nOriginalEntries', 'nEntries']
+
+
+# Read the subrun metadata of an opened trimmed file (ROOT.TFile).
+# Return a dict of iEvtSec, fEvtSec, subrunDuration, nOriginalEntries and
+# nEntries, without reading the event data.
+# Files trimmed before the 'meta' tree was introduced keep the timing in
+# per-entry branches of 'ntp', so the first entry is read for them and
+# nOriginalEntries is set to -1.
+def read_subrun_meta(data_file):
+  meta = data_file.Get('meta')
+  if meta:
+    meta.GetEntry(0)
+    return {name: getattr(meta, name) for name in meta_names}
+
+  tree = data_file.Get('ntp')
+  tree.GetEntry(0)
+  return {'iEvtSec': tree.iEvtSec, 'fEvtSec': tree.fEvtSec,
+          'subrunDuration': tree.subrunDuration,
+          'nOriginalEntries': -1, 'nEntries': tree.GetEntries()}
+
+
+# Read the subrun metadata of an opened per-subrun trimmed file, like
+# read_subrun_meta(), checking that the file is complete. Return None if it is
+# broken: a zombie, without 'ntp', with a number of entries other than its
+# metadata, or an old file of no entry without the 'meta' tree, whose timing
+# is unknown. The file size is not checked, since a complete file of a short
+# or quiet subrun can be very small.
+def read_valid_subrun_meta(data_file):
+  if not data_file or data_file.IsZombie() or not data_file.Get('ntp'):
+    return None
+  nEntries = data_file.Get('ntp').GetEntries()
+  if not data_file.Get('meta') and nEntries == 0:
+    return None
+  meta = read_subrun_meta(data_file)
+  if meta['nEntries'] != nEntries:
+    return None
+  return meta
+
+
+# Iterate over every subrun of the trimmed files in a directory, in the order
+# of run and subrun. Both layouts are read:
+#  per-subrun files 'trim_T{run:06d}_C{xtal}.root.{subrun:03d}', and
+#  run files 'trim_T{run:06d}_C{xtal}.root' packed by consolidate_trim.py,
+#  holding the events of every subrun and the 'subruns' index tree.
+# Yield (run, subrun, tree, firstEntry, meta), where the events of the subrun
+# are the entries firstEntry ~ firstEntry + meta['nEntries'] - 1 of tree, e.g.
+#     tree.Draw(varexp, selection, 'goff', meta['nEntries'], firstEntry)
+# The file is closed when the iteration moves to the next file. Broken
+# per-subrun files are skipped (see read_valid_subrun_meta()), but a file of
+# no selected event is read, however small it is.
+#  subruns: set of (run, subrun) to read, or None for every subrun
+def iter_subruns(ROOT, trimmed_path, subruns=None):
+  for filename in list_trimmed_files(trimmed_path):
+    yield from iter_file_subruns(ROOT, trimmed_path, filename, subruns)
+
+
+# Names of the trimmed files to read in a directory, sorted by run and
+# subrun: every run file, and the per-subrun files of the runs not packed
+# yet. The files can be read separately, e.g. by several processes, with
+# iter_file_subruns().
+def list_trimmed_files(trimmed_path):
+  filenamelist = sorted(filename for filename in os.listdir(trimmed_path)
+                        if not filename.startswith('.'))  # hidden files are being written
+  run_files = {int(filename[6:12]) for filename in filenamelist if filename.endswith('.root')}
+  return [filename for filename in filenamelist
+          if filename.endswith('.root') or int(filename[6:12]) not in run_files]
+
+
+# Iterate over every subrun of a trimmed file, a run file or a per-subrun
+# file, like iter_subruns().
+def iter_file_subruns(ROOT, trimmed_path, filename, subruns=None):
+  run = int(filename[6:12])
+
+  if filename.endswith('.root'):  # run file
+    data_file = ROOT.TFile(trimmed_path + filename)
+    tree = data_file.Get('ntp')
+    index = data_file.Get('subruns')
+    for i in range(index.GetEntries()):
+      index.GetEntry(i)
+      if subruns is None or (run, index.subrun) in subruns:
+        meta = {name: getattr(index, name) for name in meta_names}
+        yield run, index.subrun, tree, index.firstEntry, meta
+    data_file.Close()
+    return
+
+  # per-subrun file
+  subrun = int(filename[-3:])
+  if subruns is not None and (run, subrun) not in subruns:
+    return
+  data_file = ROOT.TFile(trimmed_path + filename)
+  meta = read_valid_subrun_meta(data_file)
+  if meta is None:
+    print('Broken ', trimmed_path + filename, file=sys.stderr)
+  else:
+    yield run, subrun, data_file.Get('ntp'), 0, meta
+  data_file.Close()
+
+
+# Energy windows counted by default, both in the summary records of
+# 1.TrimmingData/trim_summary.py and by 2.ExtractRate/graph_rate_vs_time.py.
+# The first one is the default window of the later stages.
+energy_windows = ['1to6keV', '2to6keV', '1to2keV', '6to20keV']
+
+
+# Energy range of an energy window named '{low}to{high}keV' (e.g. '1to6keV'),
+# as (low, high) in keV. Both ends are included, like
+#     'crystal{xtal}.energy >= 1 && crystal{xtal}.energy <= 6'
+def parse_energy_window(name):
+  if not name.endswith('keV') or 'to' not in name:
+    raise ValueError('energy window name is not {low}to{high}keV: ' + name)
+  low, high = name[:-3].split('to')
+  return float(low), float(high)
+
+
+# Rate store file of the crystal, written by
+# 2.ExtractRate/graph_rate_vs_time.py. It is a NumPy structured array (.npy)
+# of one row per subrun, in the order of run and subrun, with the columns
+#     run, subrun, mid_time, duration,
+#     counts_{window}, rate_{window}, err_{window} of every energy window
+# where the rate is the number of events per 2 hours.
+def get_rate_store_file(home_directory, xtal):
+  return home_directory + f'graphs/Rates_xtal{xtal}.npy'
+
+
+# Data type of the rate store with the energy windows
+def get_rate_dtype(windows):
+  import numpy
+  fields = [('run', 'i4'), ('subrun', 'i4'), ('mid_time', 'f8'), ('duration', 'f8')]
+  for name in windows:
+    fields += [('counts_' + name, 'i8'), ('rate_' + name, 'f8'), ('err_' + name, 'f8')]
+  return numpy.dtype(fields)
+
+
+# Write the rate store. It is written under a temporary name and renamed, so
+# that readers never see a partially written file.
+def write_rate_store(store_file, rates):
+  import numpy
+  directory, name = os.path.split(store_file)
+  temporary = os.path.join(directory, '.' + name)
+  with open(temporary, 'wb') as outfile:
+    numpy.save(outfile, rates)
+  os.replace(temporary, store_file)
+
+
+# Read the rate store in one call. Return the structured array; with mmap,
+# it is memory-mapped read-only, and only the columns used are read.
+def read_rate_store(store_file, mmap=True):
+  import numpy
+  return numpy.load(store_file, mmap_mode='r' if mmap else None)
+
+
+# Names of the energy windows of the rate store, the first one being the
+# default
+def get_rate_windows(rates):
+  return [name[len('counts_'):] for name in rates.dtype.names if name.startswith('counts_')]
+
+
+# Rate and its error columns of an energy window of the rate store, the first
+# window if window is None. Raise KeyError if the window is not in the store.
+def get_rate_columns(rates, window=None):
+  if window is None:
+    window = get_rate_windows(rates)[0]
+  if 'rate_' + window not in rates.dtype.names:
+    raise KeyError(window)
+  return rates['rate_' + window], rates['err_' + window]
+
+
+# Read the cut version and the hash of its configuration file recorded in an
+# opened trimmed file. Return (None, None) for files trimmed before the cut
+# version was recorded; they are stale for every cut version.
+# They are stored as TNamed by ROOT, or as TObjString by the uproot engine.
+def read_cut_version(data_file):
+  version = data_file.Get('cutVersion')
+  cut_hash = data_file.Get('cutHash')
+  if not version or not cut_hash:
+    return None, None
+  return read_string(version), read_string(cut_hash)
+
+
+# Read the string stored as TNamed (its title) or as TObjString
+def read_string(obj):
+  return obj.GetTitle() if obj.InheritsFrom('TNamed') else obj.GetName()
+
+
+# Parquet dataset directory of the crystal, written by
+# 'perform_trim.py --columnar' (see 1.TrimmingData/trim_columnar.py)
+def get_columnar_path(home_directory, xtal, multiplicity='single'):
+  return home_directory + 'data/columnar/' + (f'C{xtal}/' if multiplicity == 'single' else f'C{xtal}_multi/')
+
+
+# Read a table ('events' or 'subruns') of the columnar dataset in bulk.
+# Return a dict of NumPy arrays, including 'run' from the partitioning.
+#  columns: columns to read, or None for every column
+#  energy_range: (min, max) to read only the events in the energy range,
+#                inclusive. Only for the 'events' table.
+def read_columnar(dataset_path, table, columns=None, energy_range=None):
+  import pyarrow.dataset
+  dataset = pyarrow.dataset.dataset(dataset_path + table, format='parquet', partitioning='hive')
+  condition = None
+  if energy_range is not None:
+    energy = pyarrow.dataset.field('energy')
+    condition = (energy >= energy_range[0]) & (energy <= energy_range[1])
+  data = dataset.to_table(columns=columns, filter=condition)
+  return {name: data.column(name).to_numpy() for name in data.column_names}
+
+
+# Summary directory of the crystal, written by 'perform_trim.py --summary'
+# (see 1.TrimmingData/trim_summary.py)
+def get_summary_path(home_directory, xtal, multiplicity='single'):
+  return home_directory + 'data/' + (f'C{xtal}_summary/' if multiplicity == 'single' else f'C{xtal}_multi_summary/')
+
+
+# Read every summary record in the summary directory, in the order of run
+# and subrun. Return the list of the records (dicts).
+def read_summaries(summary_path):
+  import json
+  records = []
+  for filename in sorted(os.listdir(summary_path)):
+    if filename.startswith('.'):  # being written
+      continue
+    with open(summary_path + filename) as infile:
+      records.append(json.load(infile))
+  return records
+
+
+# Time index file of the crystal, written by 1.TrimmingData/time_index.py
+def get_time_index_file(home_directory, xtal, multiplicity='single'):
+  return home_directory + 'data/' + (f'C{xtal}' if multiplicity == 'single' else f'C{xtal}_multi') + '_time_index.csv'
+
+
+# Read the time index. Return the list of (tmin, tmax, run, subrun,
+# filename, firstEntry, nEntries), sorted by tmin.
+def read_time_index(index_file):
+  import csv
+  rows = []
+  with open(index_file) as infile:
+    reader = csv.reader(infile)
+    next(reader)  # header
+    for tmin, tmax, run, subrun, filename, firstEntry, nEntries in reader:
+      rows.append((int(tmin), int(tmax), int(run), int(subrun), filename, int(firstEntry), int(nEntries)))
+  return rows
+
+
+# Iterate over the subruns overlapping the time window t0 ~ t1 (eventsec,
+# inclusive), opening only the files holding them. The time index rows are
+# found by binary search, so the other files are never touched.
+# Yield (run, subrun, tree, firstEntry, nEntries) like iter_subruns(); select
+# the events in the window with e.g.
+#     tree.Draw(varexp, f'eventsec >= {t0} && eventsec <= {t1}', 'goff', nEntries, firstEntry)
+def query_time_window(ROOT, trimmed_path, rows, t0, t1):
+  import bisect
+  tmins = [row[0] for row in rows]
+  # running maximum of tmax, which is sorted even if subruns overlap
+  tmaxs = []
+  for row in rows:
+    tmaxs.append(max(row[1], tmaxs[-1]) if tmaxs else row[1])
+  first = bisect.bisect_left(tmaxs, t0)
+  last = bisect.bisect_right(tmins, t1)
+
+  data_file = None
+  for tmin, tmax, run, subrun, filename, firstEntry, nEntries in rows[first:last]:
+    if tmax < t0:  # before the window, only reached when subruns overlap
+      continue
+    if data_file is None or data_file.GetName() != trimmed_path + filename:
+      if data_file is not None:
+        data_file.Close()
+      data_file = ROOT.TFile(trimmed_path + filename)
+    yield run, subrun, data_file.Get('ntp'), firstEntry, nEntries
+  if data_file is not None:
+    data_file.Close()
+
+# END OF CODE
@@ -5,15 +5,21 @@
 #SBATCH --output %x-%A.out
 #SBATCH --error %x-%A.err
 
-cd "$SLURM_SUBMIT_DIR" || exit
-cd "./4.TrimmingData/" || exit
-TRIM_ID=$(sbatch --parsable submit_trim_singlehit.sh)
-echo "Trimming Data Submition: $TRIM_ID"
+# lines above are sbatch submission setting
+# job name is 'DQC_end_to_end'
+# use jepyc node
+# time wall is set to 200 hours.
+# output (error) messages will be saved in DQC_end_to_end-######.out (.err) file
+#######################################################################################
+
 
-cd "../5.ExtractRate/" || exit
-EXTR_ID=$(sbatch --parsable --dependency=afterok:"$TRIM_ID" submit_graph_rate_vs_time.sh)
-echo "Extract Rate Submition: $EXTR_ID"
+# trim data, extract rate and draw plots (stage 1 ~ 3).
+# run_pipeline.py submits every step as a Slurm job when the steps it depends on
+# are finished, and skips the steps whose inputs did not change since they last
+# succeeded. Submit this again after a failure to resume from the failed steps.
+# See run_pipeline.py for the options.
+maxjobs=20
+
+cd "$SLURM_SUBMIT_DIR" || exit
 
-cd "../6.DrawPlots/" || exit
-DRAW_ID=$(sbatch --parsable --dependency=afterok:"$EXTR_ID" submit_draw.sh)
-echo "Draw Plots Submition: $DRAW_ID"
+python run_pipeline.py --backend slurm --workers $maxjobs
@@ -0,0 +1,294 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+#  Change output directories to your own directories.
+# Find '# SETTING: directory' comments and modify directories.
+#
+# Usage
+#     (pyroot) $ python run_pipeline.py [options]
+#             --xtals: 2, 3, 4, 6 or 7, a comma separated list of them, or
+#                      'all' (default: 'all')
+#             --runs: comma separated list of runs (default: every run
+#                     directory of the MRGD directory)
+#             --backend: 'local' runs every step as a process of this node,
+#                        'slurm' submits every step as a Slurm job
+#                        (default: 'local')
+#             --workers: number of trimming workers of schedule_trim.py
+#             --extract-workers: number of processes (and of the cores of the
+#                                Slurm job) reading the trimmed files in the
+#                                extract step (default: 16)
+#             --jobs: number of steps running at once (default: 8)
+#             --force: comma separated steps to run even if up to date, or
+#                      'all'
+#             --dry-run: print the steps which would run, and exit
+#             --partition, --time: sbatch options of the 'slurm' backend
+#             other options: passed to schedule_trim.py (--engine, --slim,
+#                            --bundle-size, ...)
+# Example
+#     (pyroot) $ python run_pipeline.py --backend slurm
+#             will trim the new MRGD files, and extract and draw the rate of
+#             the crystals whose trimmed files changed, with Slurm jobs.
+#     (pyroot) $ python run_pipeline.py --xtals 2 --force draw_hist-C2
+#             will draw the rate histogram of crystal 2 again.
+#
+#  This script runs the stages 1 ~ 3 as a graph of steps,
+#     inventory: scan the MRGD directory (1.TrimmingData/mrgd_inventory.py)
+#     trim: trim the subruns of the inventory (1.TrimmingData/schedule_trim.py)
+#     extract: record the rate of every crystal in one job, reading only the
+#              new trimmed files (2.ExtractRate/graph_rate_vs_time.py)
+#     draw_time-C{xtal}, draw_hist-C{xtal}: draw the rate of the crystal
+#                      (3.DrawPlots/draw_rate_vs_time.py, draw_rate_hist.py)
+# where each step runs when the steps it depends on are finished. A step is
+# skipped if its input files (size and mtime of every file) and its command
+# are the same as when it last succeeded, and its output files exist. The
+# state of every step is saved in out/pipeline_state.json as soon as the step
+# finishes, so that running the pipeline again after a failure resumes from
+# the failed steps without redoing the finished ones.
+#  The trim step fails if some subruns still fail after the retries of
+# schedule_trim.py. The steps after it run anyway on the trimmed files, and
+# the trim step runs again next time, retrying only the failed subruns. A
+# failure of any other step stops only the steps depending on it.
+#  The inventory and trim steps always run on this node; schedule_trim.py
+# submits the trimming workers itself with the 'slurm' backend. The logs of
+# every step are written in out/pipeline/.
+###############################################################################
+
+# 0. Prepare
+# Import packages
+import os
+import sys
+import json
+import time
+import shlex
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Directory of this script, holding the stage directories
+script_directory = os.path.dirname(os.path.abspath(__file__))
+
+# set directory, relative to this script
+home_directory = os.path.join(script_directory, './../')  # SETTING: directory
+
+# Good crystals
+good_xtals = [2, 3, 4, 6, 7]
+
+# State of the steps, and the logs of the steps
+state_file = os.path.join(script_directory, 'out', 'pipeline_state.json')
+log_directory = os.path.join(script_directory, 'out', 'pipeline')
+
+
+# A step of the pipeline. command is run in the stage directory, after the
+# steps of deps. inputs and outputs are files or directories.
+#  soft: the steps after it run even if it fails
+#  local: always run on this node
+#  volatile: arguments appended to command, which do not make the step outdated
+#  cpus: number of cores of the Slurm job
+def make_step(name, stage, command, inputs, outputs, deps, soft=False, local=False, volatile=[], cpus=1):
+  return {'name': name, 'stage': os.path.join(script_directory, stage), 'command': command,
+          'inputs': inputs, 'outputs': outputs, 'deps': deps, 'soft': soft, 'local': local, 'volatile': volatile,
+          'cpus': cpus}
+
+
+# Steps of the pipeline, in an order where every step is after its deps
+def make_steps(xtals, options, trim_arguments):
+  inventory = home_directory + 'data/mrgd_inventory.csv'
+  runs = [] if options.runs is None else ['--runs', options.runs]
+  trim_dir = os.path.join(log_directory, time.strftime('trim-%Y%m%d-%H%M%S'))
+  graphs = home_directory + 'graphs/'
+  plots = home_directory + 'plots/'
+  result = home_directory + 'result/'
+
+  steps = [
+    make_step('inventory', '1.TrimmingData',
+              [sys.executable, 'mrgd_inventory.py', 'scan', '--inventory', inventory] + runs,
+              [], [inventory], [], local=True),
+    make_step('trim', '1.TrimmingData',
+              [sys.executable, 'schedule_trim.py', ','.join(map(str, xtals)), 'single', '--inventory', inventory,
+               '--backend', options.backend] + runs
+              + ([] if options.workers is None else ['--workers', str(options.workers)]) + trim_arguments,
+              [inventory, os.path.join(script_directory, '1.TrimmingData', 'cuts')],
+              [home_directory + f'data/C{xtal}/' for xtal in xtals], ['inventory'], soft=True, local=True,
+              volatile=['--work-dir', trim_dir]),
+    make_step('extract', '2.ExtractRate',
+              [sys.executable, 'graph_rate_vs_time.py', ','.join(map(str, xtals)), '--incremental',
+               '--workers', str(options.extract_workers)],
+              [home_directory + f'data/C{xtal}/' for xtal in xtals],
+              [graphs + f'Rates_xtal{xtal}.npy' for xtal in xtals], ['trim'], cpus=options.extract_workers),
+  ]
+  for xtal in xtals:
+    steps += [
+      make_step(f'draw_time-C{xtal}', '3.DrawPlots',
+                [sys.executable, 'draw_rate_vs_time.py', str(xtal)],
+                [graphs + f'Rates_xtal{xtal}.npy'],
+                [plots + f'RawRateTime_xtal{xtal}.pdf'], ['extract']),
+      make_step(f'draw_hist-C{xtal}', '3.DrawPlots',
+                [sys.executable, 'draw_rate_hist.py', str(xtal)],
+                [graphs + f'Rates_xtal{xtal}.npy'],
+                [plots + f'RateHist_xtal{xtal}.pdf', plots + f'ColoredRateHist_xtal{xtal}.pdf',
+                 result + f'bad_subruns_999pct_xtal{xtal}.txt', result + f'bad_subruns_chauvenet_xtal{xtal}.txt'],
+                ['extract']),
+    ]
+  return steps
+
+
+# Fingerprint of a step: its command, and the size and mtime of every input
+# file. Only the directory entries are read, not the files.
+def get_fingerprint(step):
+  digest = hashlib.sha1()
+  digest.update(' '.join(step['command'][1:]).encode())  # not the interpreter
+  for path in step['inputs']:
+    digest.update(b'\0' + path.encode())
+    if os.path.isdir(path):
+      for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+          if filename.startswith('.'):  # temporary files
+            continue
+          stat = os.stat(os.path.join(dirpath, filename))
+          digest.update(f'{os.path.relpath(dirpath, path)}/{filename},{stat.st_size},{stat.st_mtime_ns}\n'.encode())
+    elif os.path.isfile(path):
+      stat = os.stat(path)
+      digest.update(f'{stat.st_size},{stat.st_mtime_ns}\n'.encode())
+    else:
+      digest.update(b'missing\n')
+  return digest.hexdigest()
+
+
+# Read the state of the steps, a dict name -> {'fingerprint', 'finished'}
+def read_state(path):
+  if not os.path.isfile(path):
+    return {}
+  with open(path) as infile:
+    return json.load(infile)
+
+
+# Write the state of the steps under a temporary name and rename it, so that
+# a killed pipeline never leaves a partially written state.
+def write_state(path, state):
+  directory, name = os.path.split(path)
+  os.makedirs(directory, exist_ok=True)
+  temporary = os.path.join(directory, '.' + name)
+  with open(temporary, 'w') as outfile:
+    json.dump(state, outfile, indent=1, sort_keys=True)
+  os.replace(temporary, path)
+
+
+# Whether the step has to run
+def is_outdated(step, state, fingerprint, options):
+  if step['name'] in options.force or 'all' in options.force:
+    return True
+  if step['name'] == 'inventory':  # the MRGD directory is the input
+    return True
+  if state.get(step['name'], {}).get('fingerprint') != fingerprint:
+    return True
+  return not all(os.path.exists(path) for path in step['outputs'])
+
+
+# Run a step, and return its exit code
+def run_step(step, options):
+  log_prefix = os.path.join(log_directory, step['name'])
+  command = step['command'] + step['volatile']
+  if options.backend == 'local' or step['local']:
+    with open(log_prefix + '.out', 'w') as stdout, open(log_prefix + '.err', 'w') as stderr:
+      return subprocess.run(command, stdout=stdout, stderr=stderr, cwd=step['stage']).returncode
+  sbatch = ['sbatch', '--wait', '--parsable',
+            '--job-name', 'DQC_' + step['name'], '--partition', options.partition, '--time', options.time,
+            '--cpus-per-task', str(step['cpus']),
+            '--chdir', step['stage'], '--output', log_prefix + '.out', '--error', log_prefix + '.err',
+            '--wrap', ' '.join(shlex.quote(argument) for argument in command)]
+  return subprocess.run(sbatch, stdout=subprocess.DEVNULL).returncode
+
+
+def main():
+  # 1. Get input from command line.
+  parser = argparse.ArgumentParser(description='Run the stages 1 ~ 3, only the steps whose inputs changed.')
+  parser.add_argument('--xtals', default='all', help="2, 3, 4, 6 or 7, a comma separated list of them, or 'all'")
+  parser.add_argument('--runs', default=None, help='comma separated list of runs, every run if not given')
+  parser.add_argument('--backend', choices=['local', 'slurm'], default='local')
+  parser.add_argument('--workers', type=int, default=None, help='number of trimming workers of schedule_trim.py')
+  parser.add_argument('--extract-workers', type=int, default=16,
+                      help='number of processes reading the trimmed files in the extract step')
+  parser.add_argument('--jobs', type=int, default=8, help='number of steps running at once')
+  parser.add_argument('--force', default='', help="comma separated steps to run even if up to date, or 'all'")
+  parser.add_argument('--dry-run', action='store_true', help='print the steps which would run, and exit')
+  parser.add_argument('--partition', default='jepyc', help='Slurm partition of the steps')
+  parser.add_argument('--time', default='99:00:00', help='time limit of each Slurm job')
+  options, trim_arguments = parser.parse_known_args()  # the others go to schedule_trim.py
+
+  xtals = good_xtals if options.xtals == 'all' else [int(xtal) for xtal in options.xtals.split(',')]
+  options.force = [name for name in options.force.split(',') if name != '']
+
+  # Check bad input
+  for xtal in xtals:
+    assert xtal in good_xtals  # Use good crystals only
+  assert options.jobs >= 1 and options.extract_workers >= 1
+
+  steps = make_steps(xtals, options, trim_arguments)
+  steps_by_name = {step['name']: step for step in steps}
+  for name in options.force:
+    assert name == 'all' or name in steps_by_name
+  state = read_state(state_file)
+
+  # 2. Print the steps which would run, as of now
+  if options.dry_run:
+    for step in steps:
+      outdated = is_outdated(step, state, get_fingerprint(step), options)
+      print(step['name'], 'Outdated' if outdated else 'UpToDate', ' '.join(step['command'][1:]), sep=',')
+    return
+
+  # 3. Run every step when its deps are finished
+  os.makedirs(log_directory, exist_ok=True)
+  # status of each step: 'Done', 'UpToDate', 'Failed' or 'Blocked'
+  statuses = {}
+  pending = list(steps)
+  with ThreadPoolExecutor(max_workers=options.jobs) as pool:
+    running = {}
+    while len(pending) > 0 or len(running) > 0:
+      for step in list(pending):
+        dep_statuses = [statuses.get(dep) for dep in step['deps']]
+        if None in dep_statuses:
+          continue  # not yet
+        pending.remove(step)
+        if any(status in ['Failed', 'Blocked'] and not steps_by_name[dep]['soft']
+               for dep, status in zip(step['deps'], dep_statuses)):
+          statuses[step['name']] = 'Blocked'
+          print(sys.argv[0], step['name'], 'Blocked', 0, sep=',')
+          continue
+        fingerprint = get_fingerprint(step)  # the inputs are written by the deps
+        if not is_outdated(step, state, fingerprint, options):
+          statuses[step['name']] = 'UpToDate'
+          print(sys.argv[0], step['name'], 'UpToDate', 0, sep=',')
+          continue
+        running[pool.submit(run_step, step, options)] = (step, fingerprint, time.time())
+      sys.stdout.flush()
+      if len(running) == 0:
+        continue  # the steps skipped just now unblock others
+
+      finished, _ = wait(running, return_when=FIRST_COMPLETED)
+      for future in finished:
+        step, fingerprint, start = running.pop(future)
+        returncode = future.result()
+        if returncode == 0:
+          statuses[step['name']] = 'Done'
+          state[step['name']] = {'fingerprint': fingerprint, 'finished': time.time()}
+        else:
+          statuses[step['name']] = 'Failed'
+          state.pop(step['name'], None)  # run it again next time
+        write_state(state_file, state)
+        print(sys.argv[0], step['name'], statuses[step['name']], f'{time.time() - start:.1f}', sep=',')
+        if returncode != 0:
+          print('Failed ', step['name'], returncode, os.path.join(log_directory, step['name'] + '.err'), file=sys.stderr)
+
+  # 4. Exit with the failure of any step
+  if any(status in ['Failed', 'Blocked'] for status in statuses.values()):
+    sys.exit(1)
+
+
+# Execute the main code
+if __name__ == '__main__':
+  main()
+
+# END OF CODE
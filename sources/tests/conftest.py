@@ -0,0 +1,21 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+# Usage
+#     $ python -m pytest sources/tests
+#             will run the tests of the modules not requiring ROOT.
+#
+#  The tests import the modules like the stage scripts do, from 'sources/'
+# and from the stage directories, so that no package is installed.
+###############################################################################
+
+# Import packages
+import os
+import sys
+
+sources_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(sources_directory)
+sys.path.append(os.path.join(sources_directory, '1.TrimmingData'))
+
+# END OF CODE
@@ -0,0 +1,101 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+#  Tests of dqc_io.py. ROOT is given to the readers as an argument, so a
+# minimal stand-in for TFile is used instead of the trimmed files.
+###############################################################################
+
+# Import packages
+import pytest
+import dqc_io
+
+
+# Stand-in for the ROOT module, recording the files opened by TFile
+class FakeROOT:
+  def __init__(self):
+    self.opened = []
+
+  def TFile(self, name):
+    self.opened.append(name)
+    return FakeFile(name)
+
+
+class FakeFile:
+  def __init__(self, name):
+    self.name = name
+
+  def GetName(self):
+    return self.name
+
+  def Get(self, key):
+    return (self.name, key)
+
+  def Close(self):
+    pass
+
+
+# Time index rows (tmin, tmax, run, subrun, filename, firstEntry, nEntries),
+# sorted by tmin. Subrun 1 of run 1545 overlaps the subruns after it.
+rows = [
+  (100, 199, 1544, 0, 'trim_T001544_C2.root', 0, 10),
+  (200, 299, 1544, 1, 'trim_T001544_C2.root', 10, 10),
+  (300, 399, 1545, 0, 'trim_T001545_C2.root.000', 0, 10),
+  (400, 900, 1545, 1, 'trim_T001545_C2.root.001', 0, 10),
+  (500, 599, 1546, 0, 'trim_T001546_C2.root.000', 0, 10),
+  (600, 699, 1546, 1, 'trim_T001546_C2.root.001', 0, 10),
+]
+
+
+def query(t0, t1):
+  ROOT = FakeROOT()
+  result = [(run, subrun, firstEntry, nEntries)
+            for run, subrun, tree, firstEntry, nEntries in dqc_io.query_time_window(ROOT, 'data/', rows, t0, t1)]
+  return result, ROOT.opened
+
+
+def test_query_time_window():
+  result, opened = query(250, 350)
+  assert result == [(1544, 1, 10, 10), (1545, 0, 0, 10)]
+  assert opened == ['data/trim_T001544_C2.root', 'data/trim_T001545_C2.root.000']
+
+
+def test_query_time_window_with_overlapping_subruns():
+  # Subrun 1 of run 1545 ends after the subruns of run 1546 start.
+  result, opened = query(650, 660)
+  assert result == [(1545, 1, 0, 10), (1546, 1, 0, 10)]
+  result, opened = query(750, 800)
+  assert result == [(1545, 1, 0, 10)]
+  assert opened == ['data/trim_T001545_C2.root.001']
+
+
+def test_query_time_window_bounds_are_inclusive():
+  assert query(199, 200)[0] == [(1544, 0, 0, 10), (1544, 1, 10, 10)]
+  assert query(0, 99) == ([], [])
+  assert query(901, 1000) == ([], [])
+
+
+def test_query_time_window_opens_each_file_once():
+  result, opened = query(100, 299)
+  assert result == [(1544, 0, 0, 10), (1544, 1, 10, 10)]
+  assert opened == ['data/trim_T001544_C2.root']
+
+
+def test_parse_energy_window():
+  assert dqc_io.parse_energy_window('1to6keV') == (1., 6.)
+  assert dqc_io.parse_energy_window('6to20keV') == (6., 20.)
+  assert dqc_io.parse_energy_window('1.5to2.5keV') == (1.5, 2.5)
+
+
+def test_default_energy_windows_are_parsed():
+  for window in dqc_io.energy_windows:
+    low, high = dqc_io.parse_energy_window(window)
+    assert low < high
+
+
+@pytest.mark.parametrize('name', ['1to6', '1-6keV', 'to6keV', '1to6MeV', 'onetosixkeV'])
+def test_parse_energy_window_rejects_bad_names(name):
+  with pytest.raises(ValueError):
+    dqc_io.parse_energy_window(name)
+
+# END OF CODE
@@ -0,0 +1,61 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+#  Tests of mrgd_inventory.py. The bundles are of roughly equal total size,
+# none is empty, and every subrun is in exactly one bundle.
+###############################################################################
+
+# Import packages
+import random
+import argparse
+import pytest
+import mrgd_inventory
+
+
+# Inventory entries (run, subrun, size, mtime) of random sizes
+def make_entries(n, seed=1):
+  generator = random.Random(seed)
+  return [(1544 + i // 100, i % 100, generator.randint(1, 4) * 10**9, 0.) for i in range(n)]
+
+
+@pytest.mark.parametrize('nBundles', [1, 3, 7, 16])
+def test_bundles_are_balanced(nBundles):
+  entries = make_entries(200)
+  bundles = mrgd_inventory.make_bundles(entries, nBundles)
+  assert len(bundles) == nBundles
+  assert sorted(entry for bundle in bundles for entry in bundle) == sorted(entries)
+  sizes = [sum(entry[2] for entry in bundle) for bundle in bundles]
+  # Filled from the largest, each bundle is within the largest entry of the others.
+  assert max(sizes) - min(sizes) <= max(entry[2] for entry in entries)
+  for bundle in bundles:
+    assert bundle == sorted(bundle)
+
+
+def test_bundles_are_not_empty():
+  entries = make_entries(5)
+  bundles = mrgd_inventory.make_bundles(entries, 8)
+  assert len(bundles) == 5
+  assert all(len(bundle) == 1 for bundle in bundles)
+  assert mrgd_inventory.make_bundles([], 4) == []
+
+
+def test_count_bundles():
+  entries = make_entries(200)
+  total = sum(entry[2] for entry in entries)
+  assert mrgd_inventory.count_bundles(entries, total) == 1
+  assert mrgd_inventory.count_bundles(entries, total / 10) == 10
+  assert mrgd_inventory.count_bundles([], 20e9) == 1
+
+
+def test_number_of_bundles_must_be_positive():
+  with pytest.raises(ValueError):
+    mrgd_inventory.make_bundles(make_entries(5), 0)
+  assert mrgd_inventory.positive_int('3') == 3
+  for value in ['0', '-1']:
+    with pytest.raises(argparse.ArgumentTypeError):
+      mrgd_inventory.positive_int(value)
+  with pytest.raises(argparse.ArgumentTypeError):
+    mrgd_inventory.positive_float('0')
+
+# END OF CODE
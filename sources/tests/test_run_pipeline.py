@@ -0,0 +1,100 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+#  Tests of run_pipeline.py. A step is outdated when its command or the size
+# or mtime of an input changed since it last succeeded, or an output is
+# missing, unless it is forced.
+###############################################################################
+
+# Import packages
+import os
+import argparse
+import pytest
+import run_pipeline
+
+
+# A finished step reading tmp_path/inputs/ and writing tmp_path/output.txt,
+# with the state of its last success
+@pytest.fixture
+def finished(tmp_path):
+  inputs = tmp_path / 'inputs'
+  inputs.mkdir()
+  (inputs / 'trim_T001544_C2.root.000').write_text('subrun 0')
+  (inputs / 'trim_T001544_C2.root.001').write_text('subrun 1')
+  output = tmp_path / 'output.txt'
+  output.write_text('rate')
+  step = run_pipeline.make_step('extract', '2.ExtractRate', ['python', 'graph_rate_vs_time.py', '2'],
+                                [str(inputs)], [str(output)], [])
+  state = {'extract': {'fingerprint': run_pipeline.get_fingerprint(step), 'finished': 0.}}
+  return step, state, inputs, output
+
+
+def is_outdated(step, state, force=[]):
+  return run_pipeline.is_outdated(step, state, run_pipeline.get_fingerprint(step), argparse.Namespace(force=force))
+
+
+def test_finished_step_is_up_to_date(finished):
+  step, state, inputs, output = finished
+  assert not is_outdated(step, state)
+
+
+def test_new_step_is_outdated(finished):
+  step, state, inputs, output = finished
+  assert is_outdated(step, {})
+
+
+def test_input_change(finished):
+  step, state, inputs, output = finished
+  (inputs / 'trim_T001544_C2.root.002').write_text('subrun 2')
+  assert is_outdated(step, state)
+
+
+def test_input_mtime_change(finished):
+  step, state, inputs, output = finished
+  path = inputs / 'trim_T001544_C2.root.000'
+  stat = os.stat(path)
+  os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+  assert is_outdated(step, state)
+
+
+def test_temporary_input_is_ignored(finished):
+  step, state, inputs, output = finished
+  (inputs / '.trim_T001544_C2.root.002').write_text('being written')
+  assert not is_outdated(step, state)
+
+
+def test_command_change(finished):
+  step, state, inputs, output = finished
+  step['command'] = step['command'] + ['--workers', '4']
+  assert is_outdated(step, state)
+
+
+def test_volatile_arguments_do_not_change_fingerprint(finished):
+  step, state, inputs, output = finished
+  step['volatile'] = ['--work-dir', 'out/pipeline/trim-1']
+  assert not is_outdated(step, state)
+
+
+def test_missing_output(finished):
+  step, state, inputs, output = finished
+  output.unlink()
+  assert is_outdated(step, state)
+
+
+def test_forced_step(finished):
+  step, state, inputs, output = finished
+  assert is_outdated(step, state, force=['extract'])
+  assert is_outdated(step, state, force=['all'])
+  assert not is_outdated(step, state, force=['draw_hist-C2'])
+
+
+def test_state_round_trip(finished, tmp_path):
+  step, state, inputs, output = finished
+  path = str(tmp_path / 'out' / 'pipeline_state.json')
+  assert run_pipeline.read_state(path) == {}
+  run_pipeline.write_state(path, state)
+  assert run_pipeline.read_state(path) == state
+  assert os.listdir(tmp_path / 'out') == ['pipeline_state.json']
+
+# END OF CODE
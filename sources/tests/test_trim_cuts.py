@@ -0,0 +1,125 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+#  Tests of trim_cuts.py. The TFormula cuts built from 'cuts/v1.json' must
+# select the same events as the cut strings written in perform_trim.py
+# before the cut configuration was introduced. Both are evaluated in Python
+# on random events, since ROOT is not needed to compare them, and they must
+# have the same numeric constants, which the random events may not resolve.
+###############################################################################
+
+# Import packages
+import re
+import math
+import random
+import pytest
+import trim_cuts
+
+# Cut strings of perform_trim.py before the cut configuration, for crystal 2
+# and 7. The LS charge correction was applied to the runs after 1720.
+baseline_shared = 'BLSVeto.isCoincident==1 &&(BMuon.totalDeltaT0/1e6>30) &&'
+baseline_correction = '*((4.6165E-6)*(eventsec-1451606400.0)/3600.0+0.92166)'
+baseline_ls = {'single': '(BLSVeto.Charge{correction}/143.8<=80 &&',
+               'multi': '!(BLSVeto.Charge{correction}/143.8<=30 &&'}
+baseline_crystals = {
+  2: ('(crystal1.nc<4 && crystal3.nc<4 && crystal4.nc<4 && crystal5.nc<4 && crystal6.nc<4 && crystal7.nc<4 && crystal8.nc<3)) &&',
+      '((1.52e-06*TMath::Exp(-107.84*bdt[2]) - 1.94 - 29.288*bdt[2])<crystal2.energy)&&'
+      '(((1 - (crystal2.nx2 - crystal2.nx1))/2) > 0.5163 )&&'
+      '(((1 - (crystal2.nx2 - crystal2.nx1))/2) - 0.330*bdt[2] < 0.918 )'),
+  7: ('(crystal1.nc<4 && crystal2.nc<4 && crystal3.nc<4 && crystal4.nc<4 && crystal5.nc<4 && crystal6.nc<4 && crystal8.nc<3)) &&',
+      '((6.01e-08*TMath::Exp(-120.177*bdt[7]) - 0.24 - 31.615*bdt[7])<crystal7.energy)&&'
+      '(((1 - (crystal7.nx2 - crystal7.nx1))/2) > 0.4875 )&&'
+      '(((1 - (crystal7.nx2 - crystal7.nx1))/2) - 0.451*bdt[7] < 0.909 )'),
+}
+
+
+def get_baseline_cut(xtal, run, multiplicity):
+  correction = '' if run <= 1720 else baseline_correction
+  single_cut, scint_cut = baseline_crystals[xtal]
+  return (baseline_shared + baseline_ls[multiplicity].format(correction=correction) + single_cut
+          + f'(crystal{xtal}.rqcn>-1) &&(pmt{xtal}1.nc>0 && pmt{xtal}2.nc>0) &&(pmt{xtal}1.t1>0 && pmt{xtal}2.t1>0) &&'
+          + scint_cut)
+
+
+# Compile a TFormula cut string into a Python function of an event, a dict
+# leaf -> value
+def compile_cut(cut):
+  expr = re.sub(r'\b([A-Za-z_]\w*)\.([A-Za-z_]\w*)', r"v['\1.\2']", cut)
+  expr = re.sub(r'\b(bdt|eventsec)\b', r"v['\1']", expr)
+  expr = expr.replace('TMath::Exp', 'math.exp').replace('&&', ' and ').replace('||', ' or ')
+  expr = re.sub(r'!(?!=)', ' not ', expr)
+  code = compile(expr.strip(), cut[:40], 'eval')
+  return lambda event: eval(code, {'math': math, 'v': event})
+
+
+# Numeric constants of a cut string, not those in the leaf names
+def get_constants(cut):
+  return sorted(float(number) for number in re.findall(r'(?<![\w.])\d+(?:\.\d*)?(?:[eE][-+]?\d+)?', cut))
+
+
+# Random events around the thresholds of the cuts, most of which pass each
+# term, so that every term rejects some events and some events pass all
+def make_events(n, seed=1):
+  generator = random.Random(seed)
+  events = []
+  for i in range(n):
+    event = {'BLSVeto.isCoincident': generator.choice([0] + [1]*9),
+             'BMuon.totalDeltaT0': generator.uniform(20e6, 200e6),
+             'BLSVeto.Charge': generator.uniform(0, 100*143.8),
+             'eventsec': generator.uniform(1.45e9, 1.65e9),
+             'bdt': [generator.uniform(-0.1, 0.1) for xtal in range(9)]}
+    for xtal in range(1, 9):
+      event[f'crystal{xtal}.nc'] = generator.choice([0, 1, 2, 2, 3, 3, 4])
+      event[f'crystal{xtal}.rqcn'] = generator.choice([-2, -1] + [0, 1]*4)
+      event[f'crystal{xtal}.energy'] = generator.uniform(0, 10)
+      event[f'crystal{xtal}.nx1'] = generator.uniform(0, 0.5)
+      event[f'crystal{xtal}.nx2'] = generator.uniform(0, 0.5)
+      for pmt in (1, 2):
+        event[f'pmt{xtal}{pmt}.nc'] = generator.choice([0] + [1, 2]*5)
+        event[f'pmt{xtal}{pmt}.t1'] = generator.choice([-1, 0] + [1]*10)
+    events.append(event)
+  return events
+
+
+@pytest.mark.parametrize('xtal', [2, 7])
+@pytest.mark.parametrize('multiplicity', ['single', 'multi'])
+@pytest.mark.parametrize('run', [1719, 1720, 1721])
+def test_tformula_cuts_match_baseline(xtal, run, multiplicity):
+  assert get_constants(trim_cuts.get_cuts(xtal, run, multiplicity)) == get_constants(get_baseline_cut(xtal, run, multiplicity))
+  cut = compile_cut(trim_cuts.get_cuts(xtal, run, multiplicity))
+  baseline = compile_cut(get_baseline_cut(xtal, run, multiplicity))
+  events = make_events(5000)
+  selected = [cut(event) for event in events]
+  assert selected == [baseline(event) for event in events]
+  assert any(selected) and not all(selected)
+
+
+def test_charge_correction_after_run_1720():
+  assert not trim_cuts.is_charge_corrected(1719)
+  assert not trim_cuts.is_charge_corrected(1720)
+  assert trim_cuts.is_charge_corrected(1721)
+  assert 'eventsec' not in trim_cuts.get_cut_leaves(2, 1720, 'single')
+  assert 'eventsec' in trim_cuts.get_cut_leaves(2, 1721, 'single')
+
+
+@pytest.mark.parametrize('multiplicity', ['single', 'multi'])
+def test_cut_parts_split_the_cuts(multiplicity):
+  shared = compile_cut(trim_cuts.get_shared_cut())
+  ls = compile_cut(trim_cuts.get_cuts(2, 1721, 'ls_' + multiplicity))
+  crystal = compile_cut(trim_cuts.get_cuts(2, 1721, 'crystal'))
+  cut = compile_cut(trim_cuts.get_cuts(2, 1721, multiplicity))
+  for event in make_events(2000):
+    assert cut(event) == (shared(event) and ls(event) and crystal(event))
+
+
+def test_cut_parts_read_their_own_leaves():
+  shared = trim_cuts.get_cut_leaves(2, 1721, 'shared')
+  ls = trim_cuts.get_cut_leaves(2, 1721, 'ls_single')
+  crystal = trim_cuts.get_cut_leaves(2, 1721, 'crystal')
+  assert shared == ('BLSVeto.isCoincident', 'BMuon.totalDeltaT0')
+  assert 'BLSVeto.Charge' in ls and 'eventsec' in ls and 'BMuon.totalDeltaT0' not in ls
+  assert 'crystal2.energy' in crystal and 'BLSVeto.Charge' not in crystal and 'BLSVeto.isCoincident' not in crystal
+  assert set(shared + ls + crystal) == set(trim_cuts.get_cut_leaves(2, 1721, 'single'))
+
+# END OF CODE
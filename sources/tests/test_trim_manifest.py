@@ -0,0 +1,94 @@
+###############################################################################
+# Written by: Seung-mok Lee
+#             physmlee@gmail.com
+#
+#  Tests of trim_manifest.py. An output is up to date only while its input,
+# its cuts and the output itself are the same as when it was recorded.
+###############################################################################
+
+# Import packages
+import os
+import pytest
+import trim_manifest
+
+
+# A recorded output of crystal 2, run 1544, subrun 0, in a manifest of the
+# directory tmp_path/manifest, with the MRGD file tmp_path/mrgd.root
+@pytest.fixture
+def recorded(tmp_path, monkeypatch):
+  monkeypatch.setattr(trim_manifest, 'manifests', {})
+  monkeypatch.setenv('SLURM_JOB_ID', '100')
+  monkeypatch.delenv('SLURM_ARRAY_JOB_ID', raising=False)
+  monkeypatch.delenv('SLURM_ARRAY_TASK_ID', raising=False)
+  input_file = tmp_path / 'mrgd.root'
+  input_file.write_bytes(b'mrgd' * 100)
+  output_file = tmp_path / 'trim.root'
+  output_file.write_bytes(b'trim' * 10)
+  manifest = trim_manifest.open_manifest(str(tmp_path / 'manifest'))
+  fingerprint = trim_manifest.input_fingerprint(str(input_file))
+  trim_manifest.record(manifest, 2, 1544, 0, 'single', fingerprint, 'hash', str(output_file), 400, 40)
+  return manifest, input_file, output_file
+
+
+def is_up_to_date(manifest, input_file, output_file, config_hash='hash'):
+  fingerprint = trim_manifest.input_fingerprint(str(input_file))
+  return trim_manifest.is_up_to_date(manifest, 2, 1544, 0, 'single', fingerprint, config_hash, str(output_file))
+
+
+def test_unchanged_output_is_up_to_date(recorded):
+  assert is_up_to_date(*recorded)
+
+
+def test_other_task_is_not_up_to_date(recorded):
+  manifest, input_file, output_file = recorded
+  fingerprint = trim_manifest.input_fingerprint(str(input_file))
+  assert not trim_manifest.is_up_to_date(manifest, 2, 1544, 1, 'single', fingerprint, 'hash', str(output_file))
+  assert not trim_manifest.is_up_to_date(manifest, 2, 1544, 0, 'multi', fingerprint, 'hash', str(output_file))
+
+
+def test_input_size_change(recorded):
+  manifest, input_file, output_file = recorded
+  stat = os.stat(input_file)
+  input_file.write_bytes(b'mrgd' * 101)
+  os.utime(input_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))  # same mtime
+  assert not is_up_to_date(*recorded)
+
+
+def test_input_mtime_change(recorded):
+  manifest, input_file, output_file = recorded
+  stat = os.stat(input_file)
+  os.utime(input_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+  assert not is_up_to_date(*recorded)
+
+
+def test_config_hash_change(recorded):
+  assert not is_up_to_date(*recorded, config_hash='other')
+
+
+def test_output_change(recorded):
+  manifest, input_file, output_file = recorded
+  output_file.write_bytes(b'trim' * 5)
+  assert not is_up_to_date(*recorded)
+  output_file.unlink()
+  assert not is_up_to_date(*recorded)
+
+
+def test_skipped_task_is_not_up_to_date(recorded):
+  manifest, input_file, output_file = recorded
+  fingerprint = trim_manifest.input_fingerprint(str(input_file))
+  trim_manifest.record_skipped(manifest, 2, 1544, 0, 'single', fingerprint, 'hash', 'NoBranch')
+  assert not is_up_to_date(*recorded)
+
+
+def test_records_of_other_jobs_are_read_after_merge(recorded, monkeypatch):
+  manifest, input_file, output_file = recorded
+  monkeypatch.setattr(trim_manifest, 'manifests', {})
+  monkeypatch.setenv('SLURM_JOB_ID', '200')
+  other = trim_manifest.open_manifest(manifest['path'])
+  assert other['records'] == {}  # the file of job 100 is not read
+  assert trim_manifest.merge_manifest(manifest['path']) == 1
+  assert os.listdir(manifest['path']) == [trim_manifest.merged_name]
+  monkeypatch.setattr(trim_manifest, 'manifests', {})
+  assert is_up_to_date(trim_manifest.open_manifest(manifest['path']), input_file, output_file)
+
+# END OF CODE